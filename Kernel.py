@@ -1,9 +1,15 @@
 import numpy as np
 import pandas as pd
 
-import os, queue, sys
+import os, sys
+from time import perf_counter
+from heapq import heappop, heappush, heapreplace
 from message.Message import MessageType
 
+from util.EventQueue import EventQueue, HeapEventQueue, schedulers
+from util.KernelProfiler import KernelProfiler
+from util.KernelTelemetry import KernelTelemetry
+from util import util
 from util.util import log_print
 
 
@@ -20,8 +26,10 @@ class Kernel:
             sys.exit()
 
         # A single message queue to keep everything organized by increasing
-        # delivery timestamp.
-        self.messages = queue.PriorityQueue()
+        # delivery timestamp.  The simulation is single-threaded, so this is a
+        # lock-free heap keyed on integer nanoseconds (see util.EventQueue).
+        # runner() may replace it with another scheduler.
+        self.messages = HeapEventQueue()
 
         # currentTime is None until after kernelStarting() event completes
         # for all agents.  This is a pd.Timestamp that includes the date.
@@ -51,7 +59,8 @@ class Kernel:
                num_simulations=1, defaultComputationDelay=1,
                defaultLatency=1, agentLatency=None, latencyNoise=[1.0],
                agentLatencyModel=None, skip_log=False,
-               seed=None, oracle=None, log_dir=None):
+               seed=None, oracle=None, log_dir=None, ns_clock=False,
+               scheduler='heap', profile_counters=False, telemetry=None):
         """
         Do something.
 
@@ -69,6 +78,12 @@ class Kernel:
           seed:
           oracle:
           log_dir:
+          ns_clock:                  if True, keep the kernel clock as integer nanoseconds
+          scheduler:                 event calendar name ('heap' or 'calendar') or an EventQueue
+          profile_counters:          if True (or a KernelProfiler), collect per agent type and message type
+                                     counts and wall time, and queue depth, into custom_state['kernel_profile']
+          telemetry:                 file name (.jsonl or .csv) or a KernelTelemetry, to write periodic progress
+                                     rows (sim time, messages, rate, queue length, RSS) while running
 
         Returns:
 
@@ -99,6 +114,39 @@ class Kernel:
         # The data oracle for this simulation, if needed.
         self.oracle = oracle
 
+        # The event calendar used to order pending messages and wakeups.  All schedulers
+        # deliver in exactly the same order; they differ only in speed on a given workload.
+        if isinstance(scheduler, EventQueue):
+            self.messages = scheduler
+        elif scheduler in schedulers:
+            self.messages = schedulers[scheduler]()
+        else:
+            raise ValueError("Unknown scheduler requested for the Kernel",
+                             "scheduler:", scheduler, "known schedulers:", list(schedulers))
+
+        # Should the Kernel keep its clock as plain integer nanoseconds?  In this mode
+        # currentTimeNs and agentCurrentTimes are ints and all delay arithmetic is integer
+        # addition.  A pd.Timestamp is only built for currentTime when an agent is handed
+        # the time in wakeup() or receiveMessage().  Agents see no difference.
+        self.ns_clock = ns_clock
+        self.currentTimeNs = None
+
+        # Optional profiling counters (see util.KernelProfiler).  None when not requested,
+        # in which case the event loop does no timing at all.
+        if isinstance(profile_counters, KernelProfiler):
+            self.profiler = profile_counters
+        elif profile_counters:
+            self.profiler = KernelProfiler()
+        else:
+            self.profiler = None
+
+        # Optional periodic progress records (see util.KernelTelemetry), written every
+        # ten seconds of wall clock time unless a KernelTelemetry with another interval is given.
+        if telemetry is None or isinstance(telemetry, KernelTelemetry):
+            self.telemetry = telemetry
+        else:
+            self.telemetry = KernelTelemetry(telemetry)
+
         # If a log directory was not specified, use the initial wallclock.
         if log_dir:
             self.log_dir = log_dir
@@ -114,7 +162,7 @@ class Kernel:
 
         # This also nicely enforces agents being unable to act before
         # the simulation startTime.
-        self.agentCurrentTimes = [self.startTime] * len(agents)
+        self.agentCurrentTimes = [self.startTime.value if ns_clock else self.startTime] * len(agents)
 
         # agentComputationDelays is in nanoseconds, starts with a default
         # value from config, and can be changed by any agent at any time
@@ -154,12 +202,24 @@ class Kernel:
         # staggering of sent messages.
         self.currentAgentAdditionalDelay = 0
 
+        # Events delivered while their recipient is still "in the future" wait in a
+        # per-agent inbox, a heap of (message type value, sequence, event).  At most one
+        # of an agent's waiting events is kept in the global queue, and agentInboxTokens
+        # holds its sequence number (None if there is none).  inboxedEvents counts the
+        # events placed in an inbox because the agent already had its one event requeued.
+        # That is the number of inbox insertions, not a count of requeues saved: each of
+        # these events would have been requeued at least once without the inbox.
+        self.agentInboxes = [[] for _ in agents]
+        self.agentInboxTokens = [None] * len(agents)
+        self.inboxedEvents = 0
+
         log_print("Kernel started: {}", self.name)
         log_print("Simulation started!")
 
         # Note that num_simulations has not yet been really used or tested
-        # for anything.  Instead we have been running multiple simulations
-        # with coarse parallelization from a shell script.
+        # for anything.  It re-runs the same agent objects without resetting
+        # them.  To run a config repeatedly in one process, with a fresh
+        # Kernel and agents each time, see util.multi_run.
         for sim in range(num_simulations):
             log_print("Starting sim {}", sim)
 
@@ -193,102 +253,166 @@ class Kernel:
 
             # Set the kernel to its startTime.
             self.currentTime = self.startTime
+            if self.ns_clock: self.currentTimeNs = self.startTime.value
             log_print("\n--- Kernel Clock started ---")
             log_print("Kernel.currentTime is now {}", self.currentTime)
 
             # Start processing the Event Queue.
             log_print("\n--- Kernel Event Queue begins ---")
-            log_print("Kernel will start processing messages.  Queue length: {}", len(self.messages.queue))
+            log_print("Kernel will start processing messages.  Queue length: {}", len(self.messages))
 
             # Track starting wall clock time and total message count for stats at the end.
             eventQueueWallClockStart = pd.Timestamp('now')
             ttl_messages = 0
 
-            # Process messages until there aren't any (at which point there never can
-            # be again, because agents only "wake" in response to messages), or until
-            # the kernel stop time is reached.
-            while not self.messages.empty() and self.currentTime and (self.currentTime <= self.stopTime):
-                # Get the next message in timestamp order (delivery time) and extract it.
-                self.currentTime, event = self.messages.get()
-                msg_recipient, msg_type, msg = event
+            # The loop works on "now", which is a pd.Timestamp or, with ns_clock, integer
+            # nanoseconds.  Either way it is only compared and added to values in the same unit.
+            ns_clock = self.ns_clock
+            stopTime = self.stopTime.value if ns_clock else self.stopTime
+            now = self.currentTimeNs if ns_clock else self.currentTime
 
-                # Periodically print the simulation time and total messages, even if muted.
-                if ttl_messages % 100000 == 0:
-                    print("\n--- Simulation time: {}, messages processed: {}, wallclock elapsed: {} ---\n".format(
-                        self.fmtTime(self.currentTime), ttl_messages, pd.Timestamp('now') - eventQueueWallClockStart))
+            profiler = self.profiler
+            if profiler is not None: profiler.kernelStarting(agents)
 
-                log_print("\n--- Kernel Event Queue pop ---")
-                log_print("Kernel handling {} message for agent {} at time {}",
-                          msg_type, msg_recipient, self.fmtTime(self.currentTime))
+            telemetry = self.telemetry
+            if telemetry is not None: telemetry.start(now, len(self.messages))
 
-                ttl_messages += 1
+            try:
+                # Process messages until there aren't any (at which point there never can
+                # be again, because agents only "wake" in response to messages), or until
+                # the kernel stop time is reached.
+                while not self.messages.empty() and now is not None and (now <= stopTime):
+                    # Get the next message in timestamp order (delivery time) and extract it.
+                    now, event = self.messages.get()
+                    msg_recipient, msg_type, msg = event
 
-                # In between messages, always reset the currentAgentAdditionalDelay.
-                self.currentAgentAdditionalDelay = 0
+                    if ns_clock:
+                        self.currentTimeNs = now
+                    else:
+                        self.currentTime = now
 
-                # Dispatch message to agent.
-                if msg_type == MessageType.WAKEUP:
+                    if profiler is not None: profiler.recordDepth(now, len(self.messages))
 
-                    # Who requested this wakeup call?
-                    agent = msg_recipient
-
-                    # Test to see if the agent is already in the future.  If so,
-                    # delay the wakeup until the agent can act again.
-                    if self.agentCurrentTimes[agent] > self.currentTime:
-                        # Push the wakeup call back into the PQ with a new time.
-                        self.messages.put((self.agentCurrentTimes[agent],
-                                           (msg_recipient, msg_type, msg)))
-                        log_print("Agent in future: wakeup requeued for {}",
-                                  self.fmtTime(self.agentCurrentTimes[agent]))
-                        continue
+                    # Periodically print the simulation time and total messages, even if muted.
+                    if ttl_messages % 100000 == 0:
+                        print("\n--- Simulation time: {}, messages processed: {}, wallclock elapsed: {} ---\n".format(
+                            self.fmtTime(now), ttl_messages, pd.Timestamp('now') - eventQueueWallClockStart))
 
-                    # Set agent's current time to global current time for start
-                    # of processing.
-                    self.agentCurrentTimes[agent] = self.currentTime
+                    if not util.silent_mode:
+                        log_print("\n--- Kernel Event Queue pop ---")
+                        log_print("Kernel handling {} message for agent {} at time {}",
+                                  msg_type, msg_recipient, self.fmtTime(now))
 
-                    # Wake the agent.
-                    agents[agent].wakeup(self.currentTime)
+                    ttl_messages += 1
 
-                    # Delay the agent by its computation delay plus any transient additional delay requested.
-                    self.agentCurrentTimes[agent] += pd.Timedelta(self.agentComputationDelays[agent] +
-                                                                  self.currentAgentAdditionalDelay)
+                    if telemetry is not None and perf_counter() >= telemetry.next_sample:
+                        telemetry.sample(now, ttl_messages, len(self.messages))
 
-                    log_print("After wakeup return, agent {} delayed from {} to {}",
-                              agent, self.fmtTime(self.currentTime), self.fmtTime(self.agentCurrentTimes[agent]))
+                    # In between messages, always reset the currentAgentAdditionalDelay.
+                    self.currentAgentAdditionalDelay = 0
 
-                elif msg_type == MessageType.MESSAGE:
-
-                    # Who is receiving this message?
+                    # Who is this message or wakeup call for?
                     agent = msg_recipient
-
-                    # Test to see if the agent is already in the future.  If so,
-                    # delay the message until the agent can act again.
-                    if self.agentCurrentTimes[agent] > self.currentTime:
-                        # Push the message back into the PQ with a new time.
-                        self.messages.put((self.agentCurrentTimes[agent],
-                                           (msg_recipient, msg_type, msg)))
-                        log_print("Agent in future: message requeued for {}",
-                                  self.fmtTime(self.agentCurrentTimes[agent]))
+                    seq = self.messages.last_seq
+
+                    # Is this the agent's inbox representative (see below)?
+                    if self.agentInboxTokens[agent] == seq:
+                        self.agentInboxTokens[agent] = None
+
+                    # Test to see if the agent is already in the future.  If so, delay the
+                    # message or wakeup until the agent can act again.  Only one of the
+                    # agent's pending events (its representative) is pushed back into the
+                    # queue at the time the agent becomes free.  Any others wait in the
+                    # agent's inbox instead of bouncing through the global queue.
+                    if self.agentCurrentTimes[agent] > now:
+                        if self.agentInboxTokens[agent] is None:
+                            # Push the event back into the PQ with a new time.
+                            self.messages.requeue(self.agentCurrentTimes[agent], event)
+                            self.agentInboxTokens[agent] = seq
+                            if not util.silent_mode:
+                                log_print("Agent in future: {} requeued for {}",
+                                          msg_type, self.fmtTime(self.agentCurrentTimes[agent]))
+                        else:
+                            heappush(self.agentInboxes[agent], (msg_type.value, seq, event))
+                            self.inboxedEvents += 1
+                            if not util.silent_mode:
+                                log_print("Agent in future: {} held in inbox until {}",
+                                          msg_type, self.fmtTime(self.agentCurrentTimes[agent]))
                         continue
 
-                    # Set agent's current time to global current time for start
-                    # of processing.
-                    self.agentCurrentTimes[agent] = self.currentTime
-
-                    # Deliver the message.
-                    agents[agent].receiveMessage(self.currentTime, msg)
-
-                    # Delay the agent by its computation delay plus any transient additional delay requested.
-                    self.agentCurrentTimes[agent] += pd.Timedelta(self.agentComputationDelays[agent] +
-                                                                  self.currentAgentAdditionalDelay)
-
-                    log_print("After receiveMessage return, agent {} delayed from {} to {}",
-                              agent, self.fmtTime(self.currentTime), self.fmtTime(self.agentCurrentTimes[agent]))
-
-                else:
-                    raise ValueError("Unknown message type found in queue",
-                                     "currentTime:", self.currentTime,
-                                     "messageType:", self.msg.type)
+                    # The agent is free.  Events waiting in its inbox are due now, and are
+                    # ordered against this one exactly as the queue would have ordered them.
+                    inbox = self.agentInboxes[agent]
+                    if inbox and inbox[0] < (msg_type.value, seq):
+                        _, seq, event = heapreplace(inbox, (msg_type.value, seq, event))
+                        msg_recipient, msg_type, msg = event
+
+                    # Dispatch message to agent.
+                    if msg_type == MessageType.WAKEUP:
+
+                        # Set agent's current time to global current time for start
+                        # of processing.  With ns_clock, this is where the Timestamp
+                        # handed to the agent is built.
+                        self.agentCurrentTimes[agent] = now
+                        if ns_clock: self.currentTime = pd.Timestamp(now)
+
+                        # Wake the agent.
+                        if profiler is None:
+                            agents[agent].wakeup(self.currentTime)
+                        else:
+                            wallClockStart = perf_counter()
+                            agents[agent].wakeup(self.currentTime)
+                            profiler.recordWakeup(agent, perf_counter() - wallClockStart)
+
+                        # Delay the agent by its computation delay plus any transient additional delay requested.
+                        delay = self.agentComputationDelays[agent] + self.currentAgentAdditionalDelay
+                        self.agentCurrentTimes[agent] += int(delay) if ns_clock else pd.Timedelta(delay)
+
+                        if not util.silent_mode:
+                            log_print("After wakeup return, agent {} delayed from {} to {}",
+                                      agent, self.fmtTime(now), self.fmtTime(self.agentCurrentTimes[agent]))
+
+                    elif msg_type == MessageType.MESSAGE:
+
+                        # Set agent's current time to global current time for start
+                        # of processing.  With ns_clock, this is where the Timestamp
+                        # handed to the agent is built.
+                        self.agentCurrentTimes[agent] = now
+                        if ns_clock: self.currentTime = pd.Timestamp(now)
+
+                        # Deliver the message.
+                        if profiler is None:
+                            agents[agent].receiveMessage(self.currentTime, msg)
+                        else:
+                            wallClockStart = perf_counter()
+                            agents[agent].receiveMessage(self.currentTime, msg)
+                            profiler.recordMessage(agent, msg, perf_counter() - wallClockStart)
+
+                        # Delay the agent by its computation delay plus any transient additional delay requested.
+                        delay = self.agentComputationDelays[agent] + self.currentAgentAdditionalDelay
+                        self.agentCurrentTimes[agent] += int(delay) if ns_clock else pd.Timedelta(delay)
+
+                        if not util.silent_mode:
+                            log_print("After receiveMessage return, agent {} delayed from {} to {}",
+                                      agent, self.fmtTime(now), self.fmtTime(self.agentCurrentTimes[agent]))
+
+                    else:
+                        raise ValueError("Unknown message type found in queue",
+                                         "currentTime:", self.currentTime,
+                                         "messageType:", self.msg.type)
+
+                    # If the agent still has events waiting and none of them is in the queue,
+                    # hand the earliest one to the queue for when the agent is next free.
+                    if inbox and self.agentInboxTokens[agent] is None:
+                        _, seq, event = heappop(inbox)
+                        self.messages.requeue(self.agentCurrentTimes[agent], event, seq)
+                        self.agentInboxTokens[agent] = seq
+            finally:
+                # Write the last telemetry row and close the file, even if an agent raised.
+                if telemetry is not None: telemetry.stop(now, ttl_messages, len(self.messages))
+
+            # Bring the agent-facing clock up to date with the last event popped.
+            if ns_clock and now is not None: self.currentTime = pd.Timestamp(now)
 
             if self.messages.empty():
                 log_print("\n--- Kernel Event Queue empty ---")
@@ -320,17 +444,28 @@ class Kernel:
             print("Event Queue elapsed: {}, messages: {}, messages per second: {:0.1f}".format(
                 eventQueueWallClockElapsed, ttl_messages,
                 ttl_messages / (eventQueueWallClockElapsed / (np.timedelta64(1, 's')))))
+            log_print("Events held in agent inboxes: {}", self.inboxedEvents)
+            if profiler is not None:
+                print("Wall time by agent type:")
+                for line in profiler.summary():
+                    print(line)
             log_print("Ending sim {}", sim)
 
         # The Kernel adds a handful of custom state results for all simulations,
         # which configurations may use, print, log, or discard.
         self.custom_state['kernel_event_queue_elapsed_wallclock'] = eventQueueWallClockElapsed
-        self.custom_state['kernel_slowest_agent_finish_time'] = max(self.agentCurrentTimes)
+        self.custom_state['kernel_slowest_agent_finish_time'] = pd.Timestamp(max(self.agentCurrentTimes))
+        self.custom_state['kernel_inboxed_events'] = self.inboxedEvents
+        if self.profiler is not None:
+            self.custom_state['kernel_profile'] = self.profiler.results()
 
         # Agents will request the Kernel to serialize their agent logs, usually
         # during kernelTerminating, but the Kernel must write out the summary
-        # log itself.
+        # log (and the profiling counters, if collected, unless logging is off) itself.
         self.writeSummaryLog()
+        if self.profiler is not None:
+            path = self.logPath()
+            if path is not None: self.profiler.write(path)
 
         # This should perhaps be elsewhere, as it is explicitly financial, but it
         # is convenient to have a quick summary of the results for now.
@@ -382,34 +517,44 @@ class Kernel:
         # This means message delay (before latency) is the agent's standard computation delay
         # PLUS any accumulated delay for this wake cycle PLUS any one-time requested delay
         # for this specific message only.
-        sentTime = self.currentTime + pd.Timedelta(self.agentComputationDelays[sender] +
-                                                   self.currentAgentAdditionalDelay + delay)
+        # With ns_clock, the same arithmetic is done on integer nanoseconds: the delay terms
+        # are summed first and the sum is truncated once with int(), as pd.Timedelta truncates
+        # it.  Latency (plus noise) is likewise truncated once below.
+        if self.ns_clock:
+            sentTime = self.currentTimeNs + int(self.agentComputationDelays[sender] +
+                                                self.currentAgentAdditionalDelay + delay)
+        else:
+            sentTime = self.currentTime + pd.Timedelta(self.agentComputationDelays[sender] +
+                                                       self.currentAgentAdditionalDelay + delay)
 
         # Apply communication delay per the agentLatencyModel, if defined, or the
         # agentLatency matrix [sender][recipient] otherwise.
         if self.agentLatencyModel is not None:
             latency = self.agentLatencyModel.get_latency(sender_id=sender, recipient_id=recipient)
-            deliverAt = sentTime + pd.Timedelta(latency)
-            log_print(
-                "Kernel applied latency {}, accumulated delay {}, one-time delay {} on sendMessage from: {} to {}, scheduled for {}",
-                latency, self.currentAgentAdditionalDelay, delay, self.agents[sender].name, self.agents[recipient].name,
-                self.fmtTime(deliverAt))
+            deliverAt = sentTime + (int(latency) if self.ns_clock else pd.Timedelta(latency))
+            if not util.silent_mode:
+                log_print(
+                    "Kernel applied latency {}, accumulated delay {}, one-time delay {} on sendMessage from: {} to {}, scheduled for {}",
+                    latency, self.currentAgentAdditionalDelay, delay, self.agents[sender].name, self.agents[recipient].name,
+                    self.fmtTime(deliverAt))
         else:
             latency = self.agentLatency[sender][recipient]
             noise = self.random_state.choice(len(self.latencyNoise), 1, self.latencyNoise)[0]
-            deliverAt = sentTime + pd.Timedelta(latency + noise)
-            log_print(
-                "Kernel applied latency {}, noise {}, accumulated delay {}, one-time delay {} on sendMessage from: {} to {}, scheduled for {}",
-                latency, noise, self.currentAgentAdditionalDelay, delay, self.agents[sender].name,
-                self.agents[recipient].name,
-                self.fmtTime(deliverAt))
+            deliverAt = sentTime + (int(latency + noise) if self.ns_clock else pd.Timedelta(latency + noise))
+            if not util.silent_mode:
+                log_print(
+                    "Kernel applied latency {}, noise {}, accumulated delay {}, one-time delay {} on sendMessage from: {} to {}, scheduled for {}",
+                    latency, noise, self.currentAgentAdditionalDelay, delay, self.agents[sender].name,
+                    self.agents[recipient].name,
+                    self.fmtTime(deliverAt))
 
         # Finally drop the message in the queue with priority == delivery time.
-        self.messages.put((deliverAt, (recipient, MessageType.MESSAGE, msg)))
+        self.messages.put(deliverAt, (recipient, MessageType.MESSAGE, msg))
 
-        log_print("Sent time: {}, current time {}, computation delay {}", sentTime, self.currentTime,
-                  self.agentComputationDelays[sender])
-        log_print("Message queued: {}", msg)
+        if not util.silent_mode:
+            log_print("Sent time: {}, current time {}, computation delay {}", sentTime, self.currentTime,
+                      self.agentComputationDelays[sender])
+            log_print("Message queued: {}", msg)
 
     def setWakeup(self, sender=None, requestedTime=None):
         # Called by an agent to receive a "wakeup call" from the kernel
@@ -420,7 +565,7 @@ class Kernel:
         # kernel will not supply any parameters to the wakeup() call.
 
         if requestedTime is None:
-            requestedTime = self.currentTime + pd.TimeDelta(1)
+            requestedTime = self.currentTime + pd.Timedelta(1)
 
         if sender is None:
             raise ValueError("setWakeup() called without valid sender ID",
@@ -431,11 +576,14 @@ class Kernel:
                              "currentTime:", self.currentTime,
                              "requestedTime:", requestedTime)
 
-        log_print("Kernel adding wakeup for agent {} at time {}",
-                  sender, self.fmtTime(requestedTime))
+        if not util.silent_mode:
+            log_print("Kernel adding wakeup for agent {} at time {}",
+                      sender, self.fmtTime(requestedTime))
+
+        if self.ns_clock:
+            requestedTime = pd.Timestamp(requestedTime).value
 
-        self.messages.put((requestedTime,
-                           (sender, MessageType.WAKEUP, None)))
+        self.messages.put(requestedTime, (sender, MessageType.WAKEUP, None))
 
     def getAgentComputeDelay(self, sender=None):
         # Allows an agent to query its current computation delay.
@@ -531,6 +679,17 @@ class Kernel:
                                 'AgentStrategy': self.agents[sender].type,
                                 'EventType': eventType, 'Event': event})
 
+    def logPath(self):
+        # The directory for this run's log files, created if necessary, or None if logging is
+        # turned off.  For agents that write files in formats other than writeLog's pickled
+        # DataFrames.
+        if self.skip_log: return None
+
+        path = os.path.join(".", "log", self.log_dir)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        return path
+
     def writeSummaryLog(self):
         path = os.path.join(".", "log", self.log_dir)
         file = "summary_log.bz2"
@@ -19,11 +19,19 @@ if __name__ == '__main__':
                         help='Name of config file to execute')
     parser.add_argument('--config-help', action='store_true',
                         help='Print argument options for the specific config file.')
+    parser.add_argument('--run-seeds', type=int, nargs='+', default=None,
+                        help='Run the config once per seed, all in this process.')
 
     args, config_args = parser.parse_known_args()
 
     # First parameter supplied is config file.
     config_file = args.config
 
-    config = importlib.import_module('config.{}'.format(config_file),
-                                     package=None)
+    if args.run_seeds is None:
+        config = importlib.import_module('config.{}'.format(config_file),
+                                         package=None)
+    else:
+        # In-process multi-run mode: interpreter startup, imports and data loading are
+        # paid once for all the seeds.
+        from util.multi_run import run_seeds
+        run_seeds(config_file, config_args, args.run_seeds)
@@ -1,6 +1,7 @@
 import pandas as pd
 
 from copy import deepcopy
+from util import util
 from util.util import log_print
 
 class Agent:
@@ -126,8 +127,9 @@ class Agent:
 
     self.currentTime = currentTime
 
-    log_print ("At {}, agent {} ({}) received: {}",
-                  self.kernel.fmtTime(currentTime), self.id, self.name, msg)
+    if not util.silent_mode:
+      log_print ("At {}, agent {} ({}) received: {}",
+                    self.kernel.fmtTime(currentTime), self.id, self.name, msg)
 
 
   def wakeup (self, currentTime):
@@ -137,8 +139,9 @@ class Agent:
 
     self.currentTime = currentTime
 
-    log_print ("At {}, agent {} ({}) received wakeup.",
-                  self.kernel.fmtTime(currentTime), self.id, self.name)
+    if not util.silent_mode:
+      log_print ("At {}, agent {} ({}) received wakeup.",
+                    self.kernel.fmtTime(currentTime), self.id, self.name)
 
 
   ### Methods used to request services from the Kernel.  These should be used
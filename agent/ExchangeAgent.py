@@ -3,13 +3,23 @@
 # of its order books, a pipeline delay (in ns) for order activity, the exchange computation delay (in ns),
 # the levels of order stream history to maintain per symbol (maintains all orders that led to the last N trades),
 # whether to log all order activity to the agent log, and a random state object (already seeded) to use
-# for stochasticity.
+# for stochasticity.  book_log_depth optionally limits the archived order book snapshots to that many
+# levels per side, and book_journal keeps a journal of every change to the order books (see
+# util.BookJournal), independent of book_freq.  market_data_refresh is the number of messages between
+# full order book refreshes for incremental market data subscribers.  log_book_snapshots also writes the
+# archived snapshots out as an ORDERBOOK_<symbol>_FULL or _FREQ_<freq> DataFrame at the end of the run
+# (see logOrderBookSnapshots); it is off by default, as that can take several seconds per symbol.
 from agent.FinancialAgent import FinancialAgent
-from message.Message import Message
+from message.Message import Message, MarketClosed, MarketData, OrderBatch, QueryLastTradeReply, \
+                            QueryOrderStreamReply, QuerySpreadReply, QueryTransactedVolumeReply, ReplaceFailed
 from util.OrderBook import OrderBook
+from util import util
 from util.util import log_print
 
 import datetime as dt
+import os
+
+import numpy as np
 
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -18,13 +28,51 @@ warnings.simplefilter(action='ignore', category=UserWarning)
 import pandas as pd
 pd.set_option('display.max_rows', 500)
 
-from copy import deepcopy
+
+# Message types carrying a single order (in body['order']), batches of orders, and the responses
+# that incur the exchange's pipeline delay.
+ORDER_MESSAGES = frozenset(['LIMIT_ORDER', 'MARKET_ORDER', 'CANCEL_ORDER', 'MODIFY_ORDER'])
+BATCH_MESSAGES = frozenset(['LIMIT_ORDER_BATCH', 'CANCEL_BATCH', 'REPLACE_BATCH'])
+PIPELINE_MESSAGES = frozenset(['ORDER_ACCEPTED', 'ORDER_CANCELLED', 'ORDER_EXECUTED', 'REPLACE_FAILED'])
+
+
+class Subscription:
+  # One agent's market data subscription to one symbol: the number of levels to send, the minimum
+  # number of ns between updates (0 for every update), and the order book update time last sent.
+  # An incremental subscription also has the sequence number of its next message and the
+  # (bids, asks) snapshot it was last sent, against which the next message's changes are taken.
+  __slots__ = ('levels', 'freq', 'last_update', 'incremental', 'seq', 'sent')
+
+  def __init__(self, levels, freq, last_update, incremental=False, seq=0):
+    self.levels = levels
+    self.freq = freq
+    self.last_update = last_update
+    self.incremental = incremental
+    self.seq = seq
+    self.sent = None
+
+  def isDue(self, book_update):
+    # Should the subscriber be sent the order book as of book_update?  Either it wants every update,
+    # or the book has changed at least freq ns after the last update it was sent.
+    return (self.freq == 0) or \
+           ((book_update is not None) and (book_update > self.last_update) and
+            ((book_update - self.last_update).delta >= self.freq))
+
+
+def levelChanges(old, new):
+  # The (price, volume) changes that turn the price levels old into new (both lists of (price, volume)),
+  # with volume 0 for a price that is no longer present.
+  old_volumes = dict(old)
+  changes = [(price, volume) for price, volume in new if old_volumes.pop(price, None) != volume]
+  changes.extend((price, 0) for price in old_volumes)
+  return changes
 
 
 class ExchangeAgent(FinancialAgent):
 
   def __init__(self, id, name, type, mkt_open, mkt_close, symbols, book_freq='S', wide_book=False, pipeline_delay = 40000,
-               computation_delay = 1, stream_history = 0, log_orders = False, random_state = None):
+               computation_delay = 1, stream_history = 0, log_orders = False, random_state = None,
+               book_log_depth = None, book_journal = False, market_data_refresh = 100, log_book_snapshots = False):
 
     super().__init__(id, name, type, random_state)
 
@@ -50,24 +98,73 @@ class ExchangeAgent(FinancialAgent):
     # Log all order activity?
     self.log_orders = log_orders
 
+    # At what frequency will we archive the order books for visualization and analysis, and
+    # to how many levels?  (The order books need to know this.)
+    self.book_freq = book_freq
+    self.book_log_depth = book_log_depth
+
+    # Write the archived order book snapshots out as DataFrames at the end of the run?
+    self.log_book_snapshots = log_book_snapshots
+
+    # Journal every change to the order books?
+    self.book_journal = book_journal
+
     # Create an order book for each symbol.
     self.order_books = {}
 
     for symbol in symbols:
       self.order_books[symbol] = OrderBook(self, symbol)
 
-    # At what frequency will we archive the order books for visualization and analysis?
-    self.book_freq = book_freq
-
-    # Store orderbook in wide format? ONLY WORKS with book_freq == 0
+    # Store orderbook in wide format (a column per quote) rather than skinny (a row per time and quote)?
     self.wide_book = wide_book
 
-    # The subscription dict is a dictionary with the key = agent ID,
-    # value = dict (key = symbol, value = list [levels (no of levels to recieve updates for),
-    # frequency (min number of ns between messages), last agent update timestamp]
-    # e.g. {101 : {'AAPL' : [1, 10, pd.Timestamp(10:00:00)}}
+    # The market data subscription registry is a dictionary with the key = symbol, value = dict (key = agent ID,
+    # value = Subscription), so an order book update only visits that symbol's subscribers.  An agent may
+    # subscribe to any number of symbols.
+    # e.g. {'AAPL' : {101 : Subscription(1, 10, pd.Timestamp(10:00:00))}}
+    self.subscribers = {symbol: {} for symbol in symbols}
+
+    # The same subscriptions keyed by agent ID, then symbol.
+    # e.g. {101 : {'AAPL' : Subscription(1, 10, pd.Timestamp(10:00:00))}}
     self.subscription_dict = {}
 
+    # While a batch of orders is processed, the agent that sent it and the order messages for that
+    # agent, which are sent back to it as one ORDER_BATCH message.
+    self.batch_sender = None
+    self.batch_messages = None
+
+    # With no computation delay the exchange can handle any number of orders in one nanosecond.  The
+    # first change to a symbol's book in a nanosecond is published at once; any later ones in the same
+    # nanosecond are published together at the end of it (see publishOrderBookData).  last_publish
+    # holds the time each symbol was last published at once, and pending_publish the symbols awaiting
+    # the end of the current nanosecond.
+    self.last_publish = {}
+    self.pending_publish = set()
+
+    # The method that handles each type of message understood by this exchange.  Subclasses may add
+    # or replace entries.
+    self.message_handlers = {
+      "MARKET_DATA_SUBSCRIPTION_REQUEST": self.handleSubscription,
+      "MARKET_DATA_SUBSCRIPTION_CANCELLATION": self.handleSubscription,
+      "WHEN_MKT_OPEN": self.handleWhenMktOpen,
+      "WHEN_MKT_CLOSE": self.handleWhenMktClose,
+      "QUERY_LAST_TRADE": self.handleQueryLastTrade,
+      "QUERY_SPREAD": self.handleQuerySpread,
+      "QUERY_ORDER_STREAM": self.handleQueryOrderStream,
+      "QUERY_TRANSACTED_VOLUME": self.handleQueryTransactedVolume,
+      "LIMIT_ORDER": self.handleLimitOrder,
+      "MARKET_ORDER": self.handleMarketOrder,
+      "CANCEL_ORDER": self.handleCancelOrder,
+      "MODIFY_ORDER": self.handleModifyOrder,
+      "LIMIT_ORDER_BATCH": self.handleOrderBatch,
+      "CANCEL_BATCH": self.handleOrderBatch,
+      "REPLACE_BATCH": self.handleOrderBatch,
+    }
+
+    # Incremental subscribers are sent the whole of their view of the book in every this many messages
+    # (starting with the first), and only the levels that changed in the others.
+    self.market_data_refresh = market_data_refresh
+
   # The exchange agent overrides this to obtain a reference to an oracle.
   # This is needed to establish a "last trade price" at open (i.e. an opening
   # price) in case agents query last trade before any simulated trades are made.
@@ -100,12 +197,16 @@ class ExchangeAgent(FinancialAgent):
           dfFund.set_index('FundamentalTime', inplace=True)
           self.writeLog(dfFund, filename='fundamental_{}'.format(symbol))
           log_print("Fundamental archival complete.")
+    if self.book_journal:
+      for symbol in self.order_books:
+        self.writeJournal(symbol)
     if self.book_freq is None: return
     else:
       # Iterate over the order books controlled by this exchange.
       for symbol in self.order_books:
         start_time = dt.datetime.now()
-        #self.logOrderBookSnapshots(symbol)
+        self.writeDepthLog(symbol)
+        if self.log_book_snapshots: self.logOrderBookSnapshots(symbol)
         end_time = dt.datetime.now()
         print("Time taken to log the order book: {}".format(end_time - start_time))
         print("Order book archival complete.")
@@ -122,278 +223,401 @@ class ExchangeAgent(FinancialAgent):
     # Note that computation delay MUST be updated before any calls to sendMessage.
     self.setComputationDelay(self.computation_delay)
 
+    kind = msg.body['msg']
+
     # Is the exchange closed?  (This block only affects post-close, not pre-open.)
     if currentTime > self.mkt_close:
       # Most messages after close will receive a 'MKT_CLOSED' message in response.  A few things
       # might still be processed, like requests for final trade prices or such.
-      if msg.body['msg'] in ['LIMIT_ORDER', 'MARKET_ORDER', 'CANCEL_ORDER', 'MODIFY_ORDER']:
-        log_print("{} received {}: {}", self.name, msg.body['msg'], msg.body['order'])
-        self.sendMessage(msg.body['sender'], Message({"msg": "MKT_CLOSED"}))
+      if kind in ORDER_MESSAGES:
+        if not util.silent_mode: log_print("{} received {}: {}", self.name, kind, msg.body['order'])
+        self.sendMessage(msg.body['sender'], MarketClosed())
 
         # Don't do any further processing on these messages!
         return
-      elif 'QUERY' in msg.body['msg']:
+      elif 'QUERY' in kind:
         # Specifically do allow querying after market close, so agents can get the
         # final trade of the day as their "daily close" price for a symbol.
         pass
       else:
-        log_print("{} received {}, discarded: market is closed.", self.name, msg.body['msg'])
-        self.sendMessage(msg.body['sender'], Message({"msg": "MKT_CLOSED"}))
+        if not util.silent_mode: log_print("{} received {}, discarded: market is closed.", self.name, kind)
+        self.sendMessage(msg.body['sender'], MarketClosed())
 
         # Don't do any further processing on these messages!
         return
 
-    # Log order messages only if that option is configured.  Log all other messages.
-    if msg.body['msg'] in ['LIMIT_ORDER', 'MARKET_ORDER', 'CANCEL_ORDER', 'MODIFY_ORDER']:
-      if self.log_orders: self.logEvent(msg.body['msg'], msg.body['order'].to_dict())
-    else:
-      self.logEvent(msg.body['msg'], msg.body['sender'])
+    # Log order messages only if that option is configured.  Log all other messages.  Batches are
+    # logged order by order as they are processed.
+    if kind in ORDER_MESSAGES:
+      if self.log_orders: self.logEvent(kind, msg.body['order'].to_dict())
+    elif kind not in BATCH_MESSAGES:
+      self.logEvent(kind, msg.body['sender'])
 
-    # Handle the DATA SUBSCRIPTION request and cancellation messages from the agents.
-    if msg.body['msg'] in ["MARKET_DATA_SUBSCRIPTION_REQUEST", "MARKET_DATA_SUBSCRIPTION_CANCELLATION"]:
+    # Handle all message types understood by this exchange.
+    handler = self.message_handlers.get(kind)
+    if handler is not None: handler(currentTime, msg)
+
+  # Handlers for the message types in self.message_handlers.  Each takes the current time and the message.
+
+  def handleSubscription(self, currentTime, msg):
+    # MARKET_DATA_SUBSCRIPTION_REQUEST and MARKET_DATA_SUBSCRIPTION_CANCELLATION messages from the agents.
+    if not util.silent_mode:
       log_print("{} received {} request from agent {}", self.name, msg.body['msg'], msg.body['sender'])
-      self.updateSubscriptionDict(msg, currentTime)
+    self.updateSubscriptionDict(msg, currentTime)
 
-    # Handle all message types understood by this exchange.
-    if msg.body['msg'] == "WHEN_MKT_OPEN":
+  def handleWhenMktOpen(self, currentTime, msg):
+    if not util.silent_mode:
       log_print("{} received WHEN_MKT_OPEN request from agent {}", self.name, msg.body['sender'])
 
-      # The exchange is permitted to respond to requests for simple immutable data (like "what are your
-      # hours?") instantly.  This does NOT include anything that queries mutable data, like equity
-      # quotes or trades.
-      self.setComputationDelay(0)
+    # The exchange is permitted to respond to requests for simple immutable data (like "what are your
+    # hours?") instantly.  This does NOT include anything that queries mutable data, like equity
+    # quotes or trades.
+    self.setComputationDelay(0)
 
-      self.sendMessage(msg.body['sender'], Message({"msg": "WHEN_MKT_OPEN", "data": self.mkt_open}))
-    elif msg.body['msg'] == "WHEN_MKT_CLOSE":
+    self.sendMessage(msg.body['sender'], Message({"msg": "WHEN_MKT_OPEN", "data": self.mkt_open}))
+
+  def handleWhenMktClose(self, currentTime, msg):
+    if not util.silent_mode:
       log_print("{} received WHEN_MKT_CLOSE request from agent {}", self.name, msg.body['sender'])
 
-      # The exchange is permitted to respond to requests for simple immutable data (like "what are your
-      # hours?") instantly.  This does NOT include anything that queries mutable data, like equity
-      # quotes or trades.
-      self.setComputationDelay(0)
+    # The exchange is permitted to respond to requests for simple immutable data (like "what are your
+    # hours?") instantly.  This does NOT include anything that queries mutable data, like equity
+    # quotes or trades.
+    self.setComputationDelay(0)
 
-      self.sendMessage(msg.body['sender'], Message({"msg": "WHEN_MKT_CLOSE", "data": self.mkt_close}))
-    elif msg.body['msg'] == "QUERY_LAST_TRADE":
-      symbol = msg.body['symbol']
-      if symbol not in self.order_books:
-        log_print("Last trade request discarded.  Unknown symbol: {}", symbol)
-      else:
+    self.sendMessage(msg.body['sender'], Message({"msg": "WHEN_MKT_CLOSE", "data": self.mkt_close}))
+
+  def handleQueryLastTrade(self, currentTime, msg):
+    symbol = msg.body['symbol']
+    if symbol not in self.order_books:
+      if not util.silent_mode: log_print("Last trade request discarded.  Unknown symbol: {}", symbol)
+    else:
+      if not util.silent_mode:
         log_print("{} received QUERY_LAST_TRADE ({}) request from agent {}", self.name, symbol, msg.body['sender'])
 
-        # Return the single last executed trade price (currently not volume) for the requested symbol.
-        # This will return the average share price if multiple executions resulted from a single order.
-        self.sendMessage(msg.body['sender'], Message({"msg": "QUERY_LAST_TRADE", "symbol": symbol,
-                                                      "data": self.order_books[symbol].last_trade,
-                                                      "mkt_closed": True if currentTime > self.mkt_close else False}))
-    elif msg.body['msg'] == "QUERY_SPREAD":
-      symbol = msg.body['symbol']
-      depth = msg.body['depth']
-      if symbol not in self.order_books:
-        log_print("Bid-ask spread request discarded.  Unknown symbol: {}", symbol)
-      else:
+      # Return the single last executed trade price (currently not volume) for the requested symbol.
+      # This will return the average share price if multiple executions resulted from a single order.
+      self.sendMessage(msg.body['sender'], QueryLastTradeReply(symbol, self.order_books[symbol].last_trade,
+                                                               True if currentTime > self.mkt_close else False))
+
+  def handleQuerySpread(self, currentTime, msg):
+    symbol = msg.body['symbol']
+    depth = msg.body['depth']
+    if symbol not in self.order_books:
+      if not util.silent_mode: log_print("Bid-ask spread request discarded.  Unknown symbol: {}", symbol)
+    else:
+      if not util.silent_mode:
         log_print("{} received QUERY_SPREAD ({}:{}) request from agent {}", self.name, symbol, depth,
                   msg.body['sender'])
 
-        # Return the requested depth on both sides of the order book for the requested symbol.
-        # Returns price levels and aggregated volume at each level (not individual orders).
-        self.sendMessage(msg.body['sender'], Message({"msg": "QUERY_SPREAD", "symbol": symbol, "depth": depth,
-                                                      "bids": self.order_books[symbol].getInsideBids(depth),
-                                                      "asks": self.order_books[symbol].getInsideAsks(depth),
-                                                      "data": self.order_books[symbol].last_trade,
-                                                      "mkt_closed": True if currentTime > self.mkt_close else False,
-                                                      "book": ''}))
-
-        # It is possible to also send the pretty-printed order book to the agent for logging, but forcing pretty-printing
-        # of a large order book is very slow, so we should only do it with good reason.  We don't currently
-        # have a configurable option for it.
-        # "book": self.order_books[symbol].prettyPrint(silent=True) }))
-    elif msg.body['msg'] == "QUERY_ORDER_STREAM":
-      symbol = msg.body['symbol']
-      length = msg.body['length']
-
-      if symbol not in self.order_books:
-        log_print("Order stream request discarded.  Unknown symbol: {}", symbol)
-      else:
+      # Return the requested depth on both sides of the order book for the requested symbol.
+      # Returns price levels and aggregated volume at each level (not individual orders).
+      self.sendMessage(msg.body['sender'], QuerySpreadReply(symbol, depth,
+                                                            self.order_books[symbol].getInsideBids(depth),
+                                                            self.order_books[symbol].getInsideAsks(depth),
+                                                            self.order_books[symbol].last_trade,
+                                                            True if currentTime > self.mkt_close else False,
+                                                            book=''))
+
+      # It is possible to also send the pretty-printed order book to the agent for logging, but forcing pretty-printing
+      # of a large order book is very slow, so we should only do it with good reason.  We don't currently
+      # have a configurable option for it.
+      # "book": self.order_books[symbol].prettyPrint(silent=True) }))
+
+  def handleQueryOrderStream(self, currentTime, msg):
+    symbol = msg.body['symbol']
+    length = msg.body['length']
+
+    if symbol not in self.order_books:
+      if not util.silent_mode: log_print("Order stream request discarded.  Unknown symbol: {}", symbol)
+    else:
+      if not util.silent_mode:
         log_print("{} received QUERY_ORDER_STREAM ({}:{}) request from agent {}", self.name, symbol, length,
                   msg.body['sender'])
 
-      # We return indices [1:length] inclusive because the agent will want "orders leading up to the last
-      # L trades", and the items under index 0 are more recent than the last trade.
-      self.sendMessage(msg.body['sender'], Message({"msg": "QUERY_ORDER_STREAM", "symbol": symbol, "length": length,
-                                                    "mkt_closed": True if currentTime > self.mkt_close else False,
-                                                    "orders": self.order_books[symbol].history[1:length + 1]
-                                                    }))
-    elif msg.body['msg'] == 'QUERY_TRANSACTED_VOLUME':
-      symbol = msg.body['symbol']
-      lookback_period = msg.body['lookback_period']
-      if symbol not in self.order_books:
-        log_print("Order stream request discarded.  Unknown symbol: {}", symbol)
-      else:
+    # We return indices [1:length] inclusive because the agent will want "orders leading up to the last
+    # L trades", and the items under index 0 are more recent than the last trade.
+    self.sendMessage(msg.body['sender'], QueryOrderStreamReply(symbol, length,
+                                                               True if currentTime > self.mkt_close else False,
+                                                               self.order_books[symbol].history[1:length + 1]))
+
+  def handleQueryTransactedVolume(self, currentTime, msg):
+    symbol = msg.body['symbol']
+    lookback_period = msg.body['lookback_period']
+    if symbol not in self.order_books:
+      if not util.silent_mode: log_print("Order stream request discarded.  Unknown symbol: {}", symbol)
+    else:
+      if not util.silent_mode:
         log_print("{} received QUERY_TRANSACTED_VOLUME ({}:{}) request from agent {}", self.name, symbol, lookback_period,
                   msg.body['sender'])
-      self.sendMessage(msg.body['sender'], Message({"msg": "QUERY_TRANSACTED_VOLUME", "symbol": symbol,
-                                                    "transacted_volume": self.order_books[symbol].get_transacted_volume(lookback_period),
-                                                    "mkt_closed": True if currentTime > self.mkt_close else False
-                                                    }))
-    elif msg.body['msg'] == "LIMIT_ORDER":
-      order = msg.body['order']
-      log_print("{} received LIMIT_ORDER: {}", self.name, order)
-      if order.symbol not in self.order_books:
-        log_print("Limit Order discarded.  Unknown symbol: {}", order.symbol)
-      else:
-        # Hand the order to the order book for processing.
-        self.order_books[order.symbol].handleLimitOrder(deepcopy(order))
-        self.publishOrderBookData()
-    elif msg.body['msg'] == "MARKET_ORDER":
-      order = msg.body['order']
-      log_print("{} received MARKET_ORDER: {}", self.name, order)
-      if order.symbol not in self.order_books:
-        log_print("Market Order discarded.  Unknown symbol: {}", order.symbol)
-      else:
-        # Hand the market order to the order book for processing.
-        self.order_books[order.symbol].handleMarketOrder(deepcopy(order))
-        self.publishOrderBookData()
-    elif msg.body['msg'] == "CANCEL_ORDER":
-      # Note: this is somewhat open to abuse, as in theory agents could cancel other agents' orders.
-      # An agent could also become confused if they receive a (partial) execution on an order they
-      # then successfully cancel, but receive the cancel confirmation first.  Things to think about
-      # for later...
-      order = msg.body['order']
-      log_print("{} received CANCEL_ORDER: {}", self.name, order)
-      if order.symbol not in self.order_books:
-        log_print("Cancellation request discarded.  Unknown symbol: {}", order.symbol)
-      else:
-        # Hand the order to the order book for processing.
-        self.order_books[order.symbol].cancelOrder(deepcopy(order))
-        self.publishOrderBookData()
-    elif msg.body['msg'] == 'MODIFY_ORDER':
-      # Replace an existing order with a modified order.  There could be some timing issues
-      # here.  What if an order is partially executed, but the submitting agent has not
-      # yet received the norification, and submits a modification to the quantity of the
-      # (already partially executed) order?  I guess it is okay if we just think of this
-      # as "delete and then add new" and make it the agent's problem if anything weird
-      # happens.
-      order = msg.body['order']
-      new_order = msg.body['new_order']
-      log_print("{} received MODIFY_ORDER: {}, new order: {}".format(self.name, order, new_order))
+    self.sendMessage(msg.body['sender'], QueryTransactedVolumeReply(symbol,
+                                                                    self.order_books[symbol].get_transacted_volume(lookback_period),
+                                                                    True if currentTime > self.mkt_close else False))
+
+  def handleLimitOrder(self, currentTime, msg):
+    order = msg.body['order']
+    if not util.silent_mode: log_print("{} received LIMIT_ORDER: {}", self.name, order)
+    if order.symbol not in self.order_books:
+      if not util.silent_mode: log_print("Limit Order discarded.  Unknown symbol: {}", order.symbol)
+    else:
+      # Hand the order to the order book for processing.  The book takes ownership of the
+      # order object (the sender keeps its own copy), so it is not copied here.
+      self.order_books[order.symbol].handleLimitOrder(order)
+      self.publishOrderBookData(order.symbol)
+
+  def handleMarketOrder(self, currentTime, msg):
+    order = msg.body['order']
+    if not util.silent_mode: log_print("{} received MARKET_ORDER: {}", self.name, order)
+    if order.symbol not in self.order_books:
+      if not util.silent_mode: log_print("Market Order discarded.  Unknown symbol: {}", order.symbol)
+    else:
+      # Hand the market order to the order book for processing.
+      self.order_books[order.symbol].handleMarketOrder(order)
+      self.publishOrderBookData(order.symbol)
+
+  def handleCancelOrder(self, currentTime, msg):
+    # Note: this is somewhat open to abuse, as in theory agents could cancel other agents' orders.
+    # An agent could also become confused if they receive a (partial) execution on an order they
+    # then successfully cancel, but receive the cancel confirmation first.  Things to think about
+    # for later...
+    order = msg.body['order']
+    if not util.silent_mode: log_print("{} received CANCEL_ORDER: {}", self.name, order)
+    if order.symbol not in self.order_books:
+      if not util.silent_mode: log_print("Cancellation request discarded.  Unknown symbol: {}", order.symbol)
+    else:
+      # Hand the order to the order book for processing.
+      self.order_books[order.symbol].cancelOrder(order)
+      self.publishOrderBookData(order.symbol)
+
+  def handleModifyOrder(self, currentTime, msg):
+    # Replace an existing order with a modified order.  There could be some timing issues
+    # here.  What if an order is partially executed, but the submitting agent has not
+    # yet received the norification, and submits a modification to the quantity of the
+    # (already partially executed) order?  I guess it is okay if we just think of this
+    # as "delete and then add new" and make it the agent's problem if anything weird
+    # happens.
+    order = msg.body['order']
+    new_order = msg.body['new_order']
+    if not util.silent_mode:
+      log_print("{} received MODIFY_ORDER: {}, new order: {}", self.name, order, new_order)
+    if order.symbol not in self.order_books:
+      if not util.silent_mode: log_print("Modification request discarded.  Unknown symbol: {}", order.symbol)
+    else:
+      self.order_books[order.symbol].modifyOrder(order, new_order)
+      self.publishOrderBookData(order.symbol)
+
+  def handleOrderBatch(self, currentTime, msg):
+    # Process a batch of orders from one agent in one step: nothing else reaches the order books in
+    # between.  LIMIT_ORDER_BATCH carries new limit orders, CANCEL_BATCH orders to cancel, and
+    # REPLACE_BATCH (order, new_order) pairs, each cancelling order and entering new_order in its
+    # place (at the back of the queue for its price).  new_order is only entered if order was still
+    # in the book to cancel; otherwise (say it had already executed) the agent receives
+    # REPLACE_FAILED with both orders.  The order acceptances, cancellations, executions and failed
+    # replacements for the sending agent are returned to it in one ORDER_BATCH message (the messages, in
+    # order, under "messages"), and subscribers get one market data update per symbol.
+    kind = msg.body['msg']
+    if not util.silent_mode:
+      log_print("{} received {} of {} orders from agent {}", self.name, kind, len(msg.body['orders']), msg.body['sender'])
+
+    self.batch_sender, self.batch_messages = msg.body['sender'], []
+    symbols = []
+
+    for item in msg.body['orders']:
+      order = item[0] if kind == 'REPLACE_BATCH' else item
       if order.symbol not in self.order_books:
-        log_print("Modification request discarded.  Unknown symbol: {}".format(order.symbol))
+        if not util.silent_mode: log_print("{} order discarded.  Unknown symbol: {}", kind, order.symbol)
+        continue
+
+      book = self.order_books[order.symbol]
+      if kind == 'LIMIT_ORDER_BATCH':
+        if self.log_orders: self.logEvent('LIMIT_ORDER', order.to_dict())
+        book.handleLimitOrder(order)
+      elif kind == 'CANCEL_BATCH':
+        if self.log_orders: self.logEvent('CANCEL_ORDER', order.to_dict())
+        book.cancelOrder(order)
       else:
-        self.order_books[order.symbol].modifyOrder(deepcopy(order), deepcopy(new_order))
-        self.publishOrderBookData()
+        new_order = item[1]
+        if self.log_orders: self.logEvent('CANCEL_ORDER', order.to_dict())
+        if book.cancelOrder(order):
+          if self.log_orders: self.logEvent('LIMIT_ORDER', new_order.to_dict())
+          book.handleLimitOrder(new_order)
+        else:
+          if not util.silent_mode: log_print("Replacement discarded.  Order not in book: {}", order)
+          self.sendMessage(self.batch_sender, ReplaceFailed(order, new_order))
+
+      if order.symbol not in symbols: symbols.append(order.symbol)
+
+    messages = self.batch_messages
+    self.batch_sender, self.batch_messages = None, None
+    if messages:
+      super().sendMessage(msg.body['sender'], OrderBatch(messages), delay = self.pipeline_delay)
+
+    for symbol in symbols:
+      self.publishOrderBookData(symbol)
 
   def updateSubscriptionDict(self, msg, currentTime):
-    # The subscription dict is a dictionary with the key = agent ID,
-    # value = dict (key = symbol, value = list [levels (no of levels to recieve updates for),
-    # frequency (min number of ns between messages), last agent update timestamp]
-    # e.g. {101 : {'AAPL' : [1, 10, pd.Timestamp(10:00:00)}}
+    # Add, replace or remove one agent's subscription to one symbol.  Subscriptions to other symbols
+    # are not affected.
+    agent_id, symbol = msg.body['sender'], msg.body['symbol']
+    if symbol not in self.order_books:
+      if not util.silent_mode: log_print("Subscription request discarded.  Unknown symbol: {}", symbol)
+      return
+
     if msg.body['msg'] == "MARKET_DATA_SUBSCRIPTION_REQUEST":
-      agent_id, symbol, levels, freq = msg.body['sender'], msg.body['symbol'], msg.body['levels'], msg.body['freq']
-      self.subscription_dict[agent_id] = {symbol: [levels, freq, currentTime]}
+      # A replacement subscription carries on the old one's sequence numbers (starting with a full refresh),
+      # so the subscriber can tell its messages from any of the old subscription's still in flight.
+      old = self.subscribers[symbol].get(agent_id)
+      subscription = Subscription(msg.body['levels'], msg.body['freq'], currentTime,
+                                  incremental=msg.body.get('incremental', False),
+                                  seq=old.seq if old is not None else 0)
+      self.subscription_dict.setdefault(agent_id, {})[symbol] = subscription
+      self.subscribers[symbol][agent_id] = subscription
     elif msg.body['msg'] == "MARKET_DATA_SUBSCRIPTION_CANCELLATION":
-      agent_id, symbol = msg.body['sender'], msg.body['symbol']
-      del self.subscription_dict[agent_id][symbol]
+      self.subscription_dict.get(agent_id, {}).pop(symbol, None)
+      self.subscribers[symbol].pop(agent_id, None)
+
+  def publishOrderBookData(self, symbol):
+    # Publish the change to the symbol's order book to its subscribers.  With no computation delay,
+    # a second or later change to the book in the same nanosecond is held until the end of the
+    # nanosecond (see wakeup), so a burst of orders costs subscribers at most two updates, while a
+    # lone order costs no wakeup.  Every message for this exchange due in this nanosecond is
+    # delivered before a wakeup due in it.
+    if not self.subscribers[symbol]: return
+
+    if self.computation_delay == 0 and self.last_publish.get(symbol) == self.currentTime:
+      if not self.pending_publish: self.setWakeup(self.currentTime)
+      self.pending_publish.add(symbol)
+    else:
+      self.last_publish[symbol] = self.currentTime
+      self.sendMarketData(symbol)
+
+  def wakeup(self, currentTime):
+    super().wakeup(currentTime)
 
-  def publishOrderBookData(self):
+    # Publish the order books that changed again during this nanosecond.
+    for symbol in self.pending_publish:
+      self.sendMarketData(symbol)
+    self.pending_publish.clear()
+
+  def sendMarketData(self, symbol):
     '''
     The exchange agents sends an order book update to the agents using the subscription API if one of the following
     conditions are met:
     1) agent requests ALL order book updates (freq == 0)
     2) order book update timestamp > last time agent was updated AND the orderbook update time stamp is greater than
     the last agent update time stamp by a period more than that specified in the freq parameter.
+
+    Each distinct depth is read from the order book once, and its bids and asks lists are shared by every
+    subscriber to that depth, so subscribers must not modify them.
+
+    Incremental subscribers are sent only the levels that changed since their last message (see
+    marketDataChanges).
     '''
-    for agent_id, params in self.subscription_dict.items():
-      for symbol, values in params.items():
-        levels, freq, last_agent_update = values[0], values[1], values[2]
-        orderbook_last_update = self.order_books[symbol].last_update_ts
-        if (freq == 0) or \
-           ((orderbook_last_update > last_agent_update) and ((orderbook_last_update - last_agent_update).delta >= freq)):
-          self.sendMessage(agent_id, Message({"msg": "MARKET_DATA",
-                                              "symbol": symbol,
-                                              "bids": self.order_books[symbol].getInsideBids(levels),
-                                              "asks": self.order_books[symbol].getInsideAsks(levels),
-                                              "last_transaction": self.order_books[symbol].last_trade,
-                                              "exchange_ts": self.currentTime}))
-          self.subscription_dict[agent_id][symbol][2] = orderbook_last_update
+    book = self.order_books[symbol]
+    orderbook_last_update = book.last_update_ts
+    snapshots = {}
+    changes = {}
+    for agent_id, subscription in self.subscribers[symbol].items():
+      if subscription.isDue(orderbook_last_update):
+        levels = subscription.levels
+        snapshot = snapshots.get(levels)
+        if snapshot is None:
+          snapshot = snapshots[levels] = (book.getInsideBids(levels), book.getInsideAsks(levels))
+        if subscription.incremental:
+          self.sendMessage(agent_id, MarketData(symbol, book.last_trade, self.currentTime,
+                                                **self.marketDataChanges(subscription, snapshot, changes)))
+        else:
+          self.sendMessage(agent_id, MarketData(symbol, book.last_trade, self.currentTime,
+                                                bids=snapshot[0], asks=snapshot[1]))
+        subscription.last_update = orderbook_last_update
+
+  def marketDataChanges(self, subscription, snapshot, changes):
+    # The order book fields (as MarketData keyword arguments) of an incremental MARKET_DATA message taking
+    # the subscriber from the (bids, asks) snapshot it was last sent to this one.  Each message has a
+    # sequence number ("seq").  The first, and every market_data_refresh-th after it, is a full refresh
+    # ("full": True, with "bids" and "asks"); the others hold only "bid_changes" and "ask_changes" (see
+    # levelChanges).  Subscribers that were last sent the same snapshot share the changes, which are
+    # cached in changes (keyed by the id of the previous snapshot) for the rest of this publish.
+    seq, previous = subscription.seq, subscription.sent
+    subscription.seq += 1
+    subscription.sent = snapshot
+
+    if previous is None or seq % self.market_data_refresh == 0:
+      return {"seq": seq, "full": True, "bids": snapshot[0], "asks": snapshot[1]}
+
+    cached = changes.get(id(previous))
+    if cached is None or cached[0] is not previous:
+      cached = changes[id(previous)] = (previous, levelChanges(previous[0], snapshot[0]),
+                                        levelChanges(previous[1], snapshot[1]))
+    return {"seq": seq, "full": False, "bid_changes": cached[1], "ask_changes": cached[2]}
+
+  def writeDepthLog(self, symbol):
+    # Save the order book's columnar depth log (see util.DepthLog) as ORDERBOOK_<symbol>_DEPTH.npz,
+    # which DepthLog.load() reads back.
+    path = self.kernel.logPath()
+    if path is None: return
+
+    book = self.order_books[symbol]
+    book.depth_log.flush(book)
+    book.depth_log.write(os.path.join(path, 'ORDERBOOK_{}_DEPTH.npz'.format(symbol)))
+
+  def writeJournal(self, symbol):
+    # Save the order book's journal of changes (see util.BookJournal) as ORDERBOOK_<symbol>_JOURNAL.npz,
+    # which BookJournal.load() reads back.
+    path = self.kernel.logPath()
+    if path is None: return
+
+    self.order_books[symbol].journal.write(os.path.join(path, 'ORDERBOOK_{}_JOURNAL.npz'.format(symbol)))
 
   def logOrderBookSnapshots(self, symbol):
     """
     Log full depth quotes (price, volume) from this order book at some pre-determined frequency. Here we are looking at
     the actual log for this order book (i.e. are there snapshots to export, independent of the requested frequency).
+
+    With book_freq 0 there is one snapshot per recorded change (ORDERBOOK_<symbol>_FULL), otherwise one per interval
+    of book_freq from market open to close, each showing the book as it was at that time (ORDERBOOK_<symbol>_FREQ_<freq>).
+    The skinny format has a (time, quote) MultiIndex and a Volume column with one row per non-empty quote at each time;
+    the wide format has a time index and a sparse column per quote.  Volume is negative for bids.
     """
-    def get_quote_range_iterator(s):
-      """ Helper method for order book logging. Takes pandas Series and returns python range() from first to last
-          element.
-      """
-      forbidden_values = [0, 19999900] # TODO: Put constant value in more sensible place!
-      quotes = sorted(s)
-      for val in forbidden_values:
-        try: quotes.remove(val)
-        except ValueError:
-          pass
-      return quotes
+    forbidden_quotes = [0, 19999900] # TODO: Put constant value in more sensible place!
 
     book = self.order_books[symbol]
+    log = book.depth_log
+    log.flush(book)
+
+    if not log: return
+
+    print("Logging order book to file...")
+
+    if log.interval == 0:  # Save all possible information
+      times = log.arrays()[0]
+      filename = f'ORDERBOOK_{symbol}_FULL'
+    else:  # Sample at frequency self.book_freq, from market open (exclusive) to close (inclusive).
+      open_ns, close_ns = self.mkt_open.value, self.mkt_close.value
+      times = open_ns + log.interval * np.arange(1, (close_ns - open_ns) // log.interval + 1, dtype=np.int64)
+      filename = f'ORDERBOOK_{symbol}_FREQ_{self.book_freq}'
+
+    # Forward fill the logged snapshots onto the sample times, then keep only the quotes that
+    # were ever quoted (and not forbidden) at those times.
+    S, quotes = log.resample(times)
+    S.eliminate_zeros()
+    keep = (S.getnnz(axis=0) > 0) & ~np.isin(quotes, forbidden_quotes)
+    S, quotes = S[:, keep], quotes[keep]
+
+    if not self.wide_book:
+      # Rows (times) are in order, so with the quotes sorted within each row the index is sorted.
+      S.sort_indices()
+      S = S.tocoo()
+      index = pd.MultiIndex.from_arrays([pd.to_datetime(times[S.row]), quotes[S.col]], names=['time', 'quote'])
+      df = pd.DataFrame({'Volume': S.data}, index=index)
+    else:
+      df = pd.DataFrame.sparse.from_spmatrix(S, index=pd.to_datetime(times), columns=quotes)
+      df.index.name = 'QuoteTime' if log.interval == 0 else None
 
-    if book.book_log:
-
-      print("Logging order book to file...")
-      dfLog = book.book_log_to_df()
-      dfLog.set_index('QuoteTime', inplace=True)
-      dfLog = dfLog[~dfLog.index.duplicated(keep='last')]
-      dfLog.sort_index(inplace=True)
-
-      if str(self.book_freq).isdigit() and int(self.book_freq) == 0:  # Save all possible information
-        # Get the full range of quotes at the finest possible resolution.
-        quotes = get_quote_range_iterator(dfLog.columns.unique())
-
-        # Restructure the log to have multi-level rows of all possible pairs of time and quote
-        # with volume as the only column.
-        if not self.wide_book:
-          filledIndex = pd.MultiIndex.from_product([dfLog.index, quotes], names=['time', 'quote'])
-          dfLog = dfLog.stack()
-          dfLog = dfLog.reindex(filledIndex)
-
-        filename = f'ORDERBOOK_{symbol}_FULL'
-
-      else:  # Sample at frequency self.book_freq
-        # With multiple quotes in a nanosecond, use the last one, then resample to the requested freq.
-        dfLog = dfLog.resample(self.book_freq).ffill()
-        dfLog.sort_index(inplace=True)
-
-        # Create a fully populated index at the desired frequency from market open to close.
-        # Then project the logged data into this complete index.
-        time_idx = pd.date_range(self.mkt_open, self.mkt_close, freq=self.book_freq, closed='right')
-        dfLog = dfLog.reindex(time_idx, method='ffill')
-        dfLog.sort_index(inplace=True)
-
-        if not self.wide_book:
-          dfLog = dfLog.stack()
-          dfLog.sort_index(inplace=True)
-
-          # Get the full range of quotes at the finest possible resolution.
-          quotes = get_quote_range_iterator(dfLog.index.get_level_values(1).unique())
-
-          # Restructure the log to have multi-level rows of all possible pairs of time and quote
-          # with volume as the only column.
-          filledIndex = pd.MultiIndex.from_product([time_idx, quotes], names=['time', 'quote'])
-          dfLog = dfLog.reindex(filledIndex)
-
-        filename = f'ORDERBOOK_{symbol}_FREQ_{self.book_freq}'
-
-      # Final cleanup
-      if not self.wide_book:
-        dfLog.rename('Volume')
-        df = pd.SparseDataFrame(index=dfLog.index)
-        df['Volume'] = dfLog
-      else:
-        df = dfLog
-        df = df.reindex(sorted(df.columns), axis=1)
-
-      # Archive the order book snapshots directly to a file named with the symbol, rather than
-      # to the exchange agent log.
-      self.writeLog(df, filename=filename)
-      print("Order book logging complete!")
+    # Archive the order book snapshots directly to a file named with the symbol, rather than
+    # to the exchange agent log.
+    self.writeLog(df, filename=filename)
+    print("Order book logging complete!")
 
   def sendMessage (self, recipientID, msg):
     # The ExchangeAgent automatically applies appropriate parallel processing pipeline delay
@@ -401,10 +625,14 @@ class ExchangeAgent(FinancialAgent):
     # TODO: probably organize the order types into categories once there are more, so we can
     # take action by category (e.g. ORDER-related messages) instead of enumerating all message
     # types to be affected.
-    if msg.body['msg'] in ['ORDER_ACCEPTED', 'ORDER_CANCELLED', 'ORDER_EXECUTED']:
+    if msg.body['msg'] in PIPELINE_MESSAGES:
       # Messages that require order book modification (not simple queries) incur the additional
-      # parallel processing delay as configured.
-      super().sendMessage(recipientID, msg, delay = self.pipeline_delay)
+      # parallel processing delay as configured.  During a batch, those for the batch's sender are
+      # collected to return to it together (see handleOrderBatch).
+      if recipientID == self.batch_sender:
+        self.batch_messages.append(msg)
+      else:
+        super().sendMessage(recipientID, msg, delay = self.pipeline_delay)
       if self.log_orders: self.logEvent(msg.body['msg'], msg.body['order'].to_dict())
     else:
       # Other message types incur only the currently-configured computation delay for this agent.
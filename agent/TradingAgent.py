@@ -1,16 +1,35 @@
 from agent.FinancialAgent import FinancialAgent
 from agent.ExchangeAgent import ExchangeAgent
-from message.Message import Message
+from message.Message import Message, CancelOrder, ModifyOrder, PlaceLimitOrder, PlaceMarketOrder, QueryLastTrade, \
+                            QueryOrderStream, QuerySpread, QueryTransactedVolume
 from util.order.LimitOrder import LimitOrder
 from util.order.MarketOrder import MarketOrder
+from util import util
 from util.util import log_print
 
+from bisect import bisect_left
 from copy import deepcopy
 import sys
 
 #DEBUG
 import traceback
 
+
+class LevelKeys:
+  # A read-only view of a list of (price, volume) levels, best first, as the ascending sort keys bisect
+  # needs: price for asks and -price for bids (as in util.OrderBook.OrderBookSide).
+  __slots__ = ('levels', 'sign')
+
+  def __init__(self, levels, is_bid):
+    self.levels = levels
+    self.sign = -1 if is_bid else 1
+
+  def __len__(self):
+    return len(self.levels)
+
+  def __getitem__(self, i):
+    return self.sign * self.levels[i][0]
+
 # The TradingAgent class (via FinancialAgent, via Agent) is intended as the
 # base class for all trading agents (i.e. not things like exchanges) in a
 # market simulation.  It handles a lot of messaging (inbound and outbound)
@@ -76,6 +95,15 @@ class TradingAgent(FinancialAgent):
     self.known_bids = {}
     self.known_asks = {}
 
+    # For incremental market data subscriptions, the highest message sequence number received for each
+    # symbol, and the symbols whose known bids and asks have missed an update and await a full refresh.
+    self.market_data_seq = {}
+    self.market_data_stale = set()
+
+    # Replacement orders sent in a REPLACE_BATCH, by order id, until the exchange accepts or executes
+    # them (when they join the open orders list) or reports that the replacement failed.
+    self.pending_replacements = {}
+
     # The agent remembers the order history communicated by the exchange
     # when such is requested by an agent (for example, a heuristic belief
     # learning agent).
@@ -104,6 +132,26 @@ class TradingAgent(FinancialAgent):
     # as it will go away.
     self.book = ''
 
+    # The method that handles each type of message understood by every trading agent.  Execution,
+    # acceptance and cancellation call the orderExecuted, orderAccepted and orderCancelled methods,
+    # which subclasses should extend, and MKT_CLOSED (a reply to asking the exchange for something
+    # after it closed) calls marketClosed.  Subclasses may add or replace entries.
+    self.message_handlers = {
+      "WHEN_MKT_OPEN": self.handleMarketHours,
+      "WHEN_MKT_CLOSE": self.handleMarketHours,
+      "ORDER_EXECUTED": self.handleOrderExecuted,
+      "ORDER_ACCEPTED": self.handleOrderAccepted,
+      "REPLACE_FAILED": lambda currentTime, msg: self.replaceFailed(msg.body['order'], msg.body['new_order']),
+      "ORDER_CANCELLED": lambda currentTime, msg: self.orderCancelled(msg.body['order']),
+      "ORDER_BATCH": self.handleOrderBatch,
+      "MKT_CLOSED": lambda currentTime, msg: self.marketClosed(),
+      "QUERY_LAST_TRADE": self.handleLastTrade,
+      "QUERY_SPREAD": self.handleSpread,
+      "QUERY_ORDER_STREAM": self.handleOrderStream,
+      "QUERY_TRANSACTED_VOLUME": self.handleTransactedVolume,
+      "MARKET_DATA": lambda currentTime, msg: self.handleMarketData(msg),
+    }
+
 
   # Simulation lifecycle messages.
 
@@ -170,17 +218,30 @@ class TradingAgent(FinancialAgent):
     # the market open and closed times, and is the market not already closed.
     return (self.mkt_open and self.mkt_close) and not self.mkt_closed
 
-  def requestDataSubscription(self, symbol, levels, freq):
+  # Used by any Trading Agent subclass to subscribe to market data from the Exchange Agent.  With incremental,
+  # the exchange sends only the price levels that changed (plus periodic full refreshes), which
+  # handleMarketData applies to known_bids and known_asks.  A new subscription starts with a full refresh,
+  # so the sequence numbers of any earlier one are forgotten.
+  def requestDataSubscription(self, symbol, levels, freq, incremental=False):
+      self.resetMarketDataSeq(symbol)
       self.sendMessage(recipientID = self.exchangeID,
                        msg = Message({"msg": "MARKET_DATA_SUBSCRIPTION_REQUEST",
-                                      "sender": self.id, "symbol": symbol, "levels": levels, "freq": freq}))
+                                      "sender": self.id, "symbol": symbol, "levels": levels, "freq": freq,
+                                      "incremental": incremental}))
 
   # Used by any Trading Agent subclass to cancel subscription to market data from the Exchange Agent
   def cancelDataSubscription(self, symbol):
+    self.resetMarketDataSeq(symbol)
     self.sendMessage(recipientID=self.exchangeID,
                      msg=Message({"msg": "MARKET_DATA_SUBSCRIPTION_CANCELLATION",
                                   "sender": self.id, "symbol": symbol}))
 
+  # Forgets the last incremental MARKET_DATA sequence number seen for a symbol, and whether its known
+  # levels were stale.  A later subscription's numbering starts again at the exchange.
+  def resetMarketDataSeq(self, symbol):
+    self.market_data_seq.pop(symbol, None)
+    self.market_data_stale.discard(symbol)
+
 
   def receiveMessage (self, currentTime, msg):
     super().receiveMessage(currentTime, msg)
@@ -188,121 +249,126 @@ class TradingAgent(FinancialAgent):
     # Do we know the market hours?
     had_mkt_hours = self.mkt_open is not None and self.mkt_close is not None
 
-    # Record market open or close times.
-    if msg.body['msg'] == "WHEN_MKT_OPEN":
-      self.mkt_open = msg.body['data']
+    # Handle all message types understood by every trading agent.
+    handler = self.message_handlers.get(msg.body['msg'])
+    if handler is not None: handler(currentTime, msg)
 
-      log_print ("Recorded market open: {}", self.kernel.fmtTime(self.mkt_open))
+    # Now do we know the market hours?
+    have_mkt_hours = self.mkt_open is not None and self.mkt_close is not None
 
-    elif msg.body['msg'] == "WHEN_MKT_CLOSE":
-      self.mkt_close = msg.body['data']
+    # Once we know the market open and close times, schedule a wakeup call for market open.
+    # Only do this once, when we first have both items.
+    if have_mkt_hours and not had_mkt_hours:
+      # Agents are asked to generate a wake offset from the market open time.  We structure
+      # this as a subclass request so each agent can supply an appropriate offset relative
+      # to its trading frequency.
+      ns_offset = self.getWakeFrequency()
 
-      log_print ("Recorded market close: {}", self.kernel.fmtTime(self.mkt_close))
+      self.setWakeup(self.mkt_open + ns_offset)
 
-    elif msg.body['msg'] == "ORDER_EXECUTED":
-      # Call the orderExecuted method, which subclasses should extend.  This parent
-      # class could implement default "portfolio tracking" or "returns tracking"
-      # behavior.
-      order = msg.body['order']
+  # Handlers for the message types in self.message_handlers.  Each takes the current time and the message.
 
-      self.orderExecuted(order)
+  def handleMarketHours (self, currentTime, msg):
+    # Record market open or close times.
+    if msg.body['msg'] == "WHEN_MKT_OPEN":
+      self.mkt_open = msg.body['data']
 
-    elif msg.body['msg'] == "ORDER_ACCEPTED":
-      # Call the orderAccepted method, which subclasses should extend.
-      order = msg.body['order']
+      if not util.silent_mode: log_print ("Recorded market open: {}", self.kernel.fmtTime(self.mkt_open))
 
-      self.orderAccepted(order)
+    else:
+      self.mkt_close = msg.body['data']
 
-    elif msg.body['msg'] == "ORDER_CANCELLED":
-      # Call the orderCancelled method, which subclasses should extend.
-      order = msg.body['order']
+      if not util.silent_mode: log_print ("Recorded market close: {}", self.kernel.fmtTime(self.mkt_close))
 
-      self.orderCancelled(order)
+  def handleOrderExecuted (self, currentTime, msg):
+    order = msg.body['order']
+    if self.pending_replacements: self.confirmReplacement(order.order_id)
+    self.orderExecuted(order)
 
-    elif msg.body['msg'] == "MKT_CLOSED":
-      # We've tried to ask the exchange for something after it closed.  Remember this
-      # so we stop asking for things that can't happen.
+  def handleOrderAccepted (self, currentTime, msg):
+    order = msg.body['order']
+    if self.pending_replacements: self.confirmReplacement(order.order_id)
+    self.orderAccepted(order)
 
-      self.marketClosed()
+  def confirmReplacement (self, order_id):
+    # A replacement order has reached the book: it is now an open order.
+    new_order = self.pending_replacements.pop(order_id, None)
+    if new_order is not None: self.orders[order_id] = new_order
 
-    elif msg.body['msg'] == 'QUERY_LAST_TRADE':
-      # Call the queryLastTrade method, which subclasses may extend.
-      # Also note if the market is closed.
-      if msg.body['mkt_closed']: self.mkt_closed = True
+  def handleOrderBatch (self, currentTime, msg):
+    # The exchange's acknowledgements of a batch of orders.  Handle each as if it had arrived
+    # on its own, through the (possibly overridden) receiveMessage.
+    for message in msg.body['messages']:
+      self.receiveMessage(currentTime, message)
 
-      self.queryLastTrade(msg.body['symbol'], msg.body['data'])
+  # Replies to queries call the queryLastTrade, querySpread, queryOrderStream or query_transacted_volume
+  # method, which subclasses may extend.  Also note if the market is closed.
 
-    elif msg.body['msg'] == 'QUERY_SPREAD':
-      # Call the querySpread method, which subclasses may extend.
-      # Also note if the market is closed.
-      if msg.body['mkt_closed']: self.mkt_closed = True
+  def handleLastTrade (self, currentTime, msg):
+    if msg.body['mkt_closed']: self.mkt_closed = True
 
-      self.querySpread(msg.body['symbol'], msg.body['data'], msg.body['bids'], msg.body['asks'], msg.body['book'])
+    self.queryLastTrade(msg.body['symbol'], msg.body['data'])
 
-    elif msg.body['msg'] == 'QUERY_ORDER_STREAM':
-      # Call the queryOrderStream method, which subclasses may extend.
-      # Also note if the market is closed.
-      if msg.body['mkt_closed']: self.mkt_closed = True
+  def handleSpread (self, currentTime, msg):
+    if msg.body['mkt_closed']: self.mkt_closed = True
 
-      self.queryOrderStream(msg.body['symbol'], msg.body['orders'])
+    self.querySpread(msg.body['symbol'], msg.body['data'], msg.body['bids'], msg.body['asks'], msg.body['book'])
 
-    elif msg.body['msg'] == 'QUERY_TRANSACTED_VOLUME':
-      if msg.body['mkt_closed']: self.mkt_closed = True
-      self.query_transacted_volume(msg.body['symbol'], msg.body['transacted_volume'])
+  def handleOrderStream (self, currentTime, msg):
+    if msg.body['mkt_closed']: self.mkt_closed = True
 
-    elif msg.body['msg'] == 'MARKET_DATA':
-      self.handleMarketData(msg)
+    self.queryOrderStream(msg.body['symbol'], msg.body['orders'])
 
-    # Now do we know the market hours?
-    have_mkt_hours = self.mkt_open is not None and self.mkt_close is not None
+  def handleTransactedVolume (self, currentTime, msg):
+    if msg.body['mkt_closed']: self.mkt_closed = True
 
-    # Once we know the market open and close times, schedule a wakeup call for market open.
-    # Only do this once, when we first have both items.
-    if have_mkt_hours and not had_mkt_hours:
-      # Agents are asked to generate a wake offset from the market open time.  We structure
-      # this as a subclass request so each agent can supply an appropriate offset relative
-      # to its trading frequency.
-      ns_offset = self.getWakeFrequency()
-
-      self.setWakeup(self.mkt_open + ns_offset)
+    self.query_transacted_volume(msg.body['symbol'], msg.body['transacted_volume'])
 
 
   # Used by any Trading Agent subclass to query the last trade price for a symbol.
   # This activity is not logged.
   def getLastTrade (self, symbol):
-    self.sendMessage(self.exchangeID, Message({ "msg" : "QUERY_LAST_TRADE", "sender": self.id,
-                                                "symbol" : symbol })) 
+    self.sendMessage(self.exchangeID, QueryLastTrade(self.id, symbol))
 
 
   # Used by any Trading Agent subclass to query the current spread for a symbol.
   # This activity is not logged.
   def getCurrentSpread (self, symbol, depth=1):
-    self.sendMessage(self.exchangeID, Message({ "msg" : "QUERY_SPREAD", "sender": self.id,
-                                                "symbol" : symbol, "depth" : depth }))
+    self.sendMessage(self.exchangeID, QuerySpread(self.id, symbol, depth))
 
 
   # Used by any Trading Agent subclass to query the recent order stream for a symbol.
   def getOrderStream (self, symbol, length=1):
-    self.sendMessage(self.exchangeID, Message({ "msg" : "QUERY_ORDER_STREAM", "sender": self.id,
-                                                "symbol" : symbol, "length" : length }))
+    self.sendMessage(self.exchangeID, QueryOrderStream(self.id, symbol, length))
 
   def get_transacted_volume(self, symbol, lookback_period='10min'):
     """ Used by any trading agent subclass to query the total transacted volume in a given lookback period """
-    self.sendMessage(self.exchangeID, Message({ "msg": "QUERY_TRANSACTED_VOLUME", "sender": self.id,
-                                                "symbol": symbol, "lookback_period": lookback_period}))
+    self.sendMessage(self.exchangeID, QueryTransactedVolume(self.id, symbol, lookback_period))
 
   # Used by any Trading Agent subclass to place a limit order.  Parameters expect:
   # string (valid symbol), int (positive share quantity), bool (True == BUY), int (price in cents).
   # The call may optionally specify an order_id (otherwise global autoincrement is used) and
   # whether cash or risk limits should be enforced or ignored for the order.
   def placeLimitOrder (self, symbol, quantity, is_buy_order, limit_price, order_id=None, ignore_risk = True, tag = None):
-    order = LimitOrder(self.id, self.currentTime, symbol, quantity, is_buy_order, limit_price, order_id, tag)
-
     #DEBUG to see event from Momentum agent
     stack_list = [f for f in traceback.format_stack()]
     if 'Momentum' in stack_list[len(stack_list)-2]:
       DEBUG = True
 
+    order = self.newLimitOrder(symbol, quantity, is_buy_order, limit_price, order_id, ignore_risk, tag)
+    if order is None: return
+
+    self.sendMessage(self.exchangeID, PlaceLimitOrder(self.id, order))
+
+    # Log this activity.
+    if self.log_orders: self.logEvent('ORDER_SUBMITTED', order.to_dict())
+
+  # Creates a limit order for placeLimitOrder, placeLimitOrderBatch or replaceOrderBatch and adds it to
+  # the open orders list, after checking the quantity and (unless ignore_risk) the at-risk limits.
+  # Returns the order, or None if it is not permitted.
+  def newLimitOrder (self, symbol, quantity, is_buy_order, limit_price, order_id=None, ignore_risk = True, tag = None):
+    order = LimitOrder(self.id, self.currentTime, symbol, quantity, is_buy_order, limit_price, order_id, tag)
+
     if quantity > 0:
       # Test if this order can be permitted given our at-risk limits.
       new_holdings = self.holdings.copy()
@@ -319,8 +385,9 @@ class TradingAgent(FinancialAgent):
         new_at_risk = self.markToMarket(new_holdings) - new_holdings['CASH']
 
         if (new_at_risk > at_risk) and (new_at_risk > self.starting_cash):
-          log_print ("TradingAgent ignored limit order due to at-risk constraints: {}\n{}", order, self.fmtHoldings(self.holdings))
-          return
+          if not util.silent_mode:
+            log_print ("TradingAgent ignored limit order due to at-risk constraints: {}\n{}", order, self.fmtHoldings(self.holdings))
+          return None
 
       # Copy the intended order for logging, so any changes made to it elsewhere
       # don't retroactively alter our "as placed" log of the order.  Eventually
@@ -328,14 +395,26 @@ class TradingAgent(FinancialAgent):
       # objects inside the order (we're halfway there) so there CAN be just a single
       # object per order, that never alters its original state, and eliminate all these copies.
       self.orders[order.order_id] = deepcopy(order)
-      self.sendMessage(self.exchangeID, Message({ "msg" : "LIMIT_ORDER", "sender": self.id,
-                                                  "order" : order })) 
-
-      # Log this activity.
-      if self.log_orders: self.logEvent('ORDER_SUBMITTED', order.to_dict())
+      return order
 
     else:
-      log_print ("TradingAgent ignored limit order of quantity zero: {}", order)
+      if not util.silent_mode: log_print ("TradingAgent ignored limit order of quantity zero: {}", order)
+      return None
+
+  # Used by any Trading Agent subclass to place several limit orders in one message.  orders is a
+  # list of tuples of placeLimitOrder arguments, e.g. [(symbol, quantity, is_buy_order, limit_price), ...];
+  # each is checked as by placeLimitOrder and those not permitted are left out.  The exchange
+  # processes the batch in one step and acknowledges it with one ORDER_BATCH message.
+  def placeLimitOrderBatch (self, orders):
+    orders = [order for order in (self.newLimitOrder(*args) for args in orders) if order is not None]
+    if not orders: return
+
+    self.sendMessage(self.exchangeID, Message({ "msg" : "LIMIT_ORDER_BATCH", "sender": self.id,
+                                                "orders" : orders }))
+
+    # Log this activity.
+    if self.log_orders:
+      for order in orders: self.logEvent('ORDER_SUBMITTED', order.to_dict())
 
   def placeMarketOrder(self, symbol, quantity, is_buy_order, order_id=None, ignore_risk = True, tag=None):
     """
@@ -362,32 +441,73 @@ class TradingAgent(FinancialAgent):
         new_at_risk = self.markToMarket(new_holdings) - new_holdings['CASH']
 
         if (new_at_risk > at_risk) and (new_at_risk > self.starting_cash):
-          log_print("TradingAgent ignored market order due to at-risk constraints: {}\n{}",
-                    order, self.fmtHoldings(self.holdings))
+          if not util.silent_mode:
+            log_print("TradingAgent ignored market order due to at-risk constraints: {}\n{}",
+                      order, self.fmtHoldings(self.holdings))
           return
       self.orders[order.order_id] = deepcopy(order)
-      self.sendMessage(self.exchangeID, Message({"msg" : "MARKET_ORDER", "sender": self.id, "order": order}))
+      self.sendMessage(self.exchangeID, PlaceMarketOrder(self.id, order))
       if self.log_orders: self.logEvent('ORDER_SUBMITTED', order.to_dict())
     else:
-      log_print("TradingAgent ignored market order of quantity zero: {}", order)
+      if not util.silent_mode: log_print("TradingAgent ignored market order of quantity zero: {}", order)
 
   def cancelOrder(self, order):
     """Used by any Trading Agent subclass to cancel any order.  The order must currently
     appear in the agent's open orders list."""
     if isinstance(order, LimitOrder):
-      self.sendMessage(self.exchangeID, Message({"msg": "CANCEL_ORDER", "sender": self.id,
-                                                 "order": order}))
+      self.sendMessage(self.exchangeID, CancelOrder(self.id, order))
       # Log this activity.
       if self.log_orders: self.logEvent('CANCEL_SUBMITTED', order.to_dict())
     else:
-      log_print("order {} of type, {} cannot be cancelled", order, type(order))
+      if not util.silent_mode: log_print("order {} of type, {} cannot be cancelled", order, type(order))
+
+  def cancelOrderBatch(self, orders):
+    """Used by any Trading Agent subclass to cancel several limit orders in one message.  As with
+    cancelOrder, each order must currently appear in the agent's open orders list."""
+    batch = []
+    for order in orders:
+      if isinstance(order, LimitOrder): batch.append(order)
+      elif not util.silent_mode: log_print("order {} of type, {} cannot be cancelled", order, type(order))
+    if not batch: return
+
+    self.sendMessage(self.exchangeID, Message({"msg": "CANCEL_BATCH", "sender": self.id, "orders": batch}))
+
+    # Log this activity.
+    if self.log_orders:
+      for order in batch: self.logEvent('CANCEL_SUBMITTED', order.to_dict())
+
+  def replaceOrderBatch(self, replacements):
+    """Used by any Trading Agent subclass to replace several limit orders in one message.  replacements
+    is a list of tuples of an order followed by the placeLimitOrder arguments of its replacement, e.g.
+    [(order, symbol, quantity, is_buy_order, limit_price), ...]: the exchange cancels each order, which must
+    currently appear in the agent's open orders list, and enters the new order in its place.  Each new order
+    is checked as by placeLimitOrder, and those not permitted are left out, leaving their orders in place.
+    Unlike modifyOrder, the new order may have a different price and loses the old order's time priority.
+    It joins the open orders list once the exchange accepts (or executes) it.  If order is no longer in the
+    book, the new order is not entered and replaceFailed is called instead."""
+    batch = []
+    for order, *args in replacements:
+      new_order = self.newLimitOrder(*args)
+      if new_order is None: continue
+      # newLimitOrder recorded the new order as open; it is pending until the exchange enters it.
+      self.pending_replacements[new_order.order_id] = self.orders.pop(new_order.order_id)
+      batch.append((order, new_order))
+    if not batch: return
+
+    self.sendMessage(self.exchangeID, Message({"msg": "REPLACE_BATCH", "sender": self.id,
+                                               "orders": batch}))
+
+    # Log this activity.
+    if self.log_orders:
+      for order, new_order in batch:
+        self.logEvent('CANCEL_SUBMITTED', order.to_dict())
+        self.logEvent('ORDER_SUBMITTED', new_order.to_dict())
 
   def modifyOrder (self, order, newOrder):
     """ Used by any Trading Agent subclass to modify any existing limit order.  The order must currently
         appear in the agent's open orders list.  Some additional tests might be useful here
         to ensure the old and new orders are the same in some way."""
-    self.sendMessage(self.exchangeID, Message({ "msg" : "MODIFY_ORDER", "sender": self.id,
-                                                "order" : order, "new_order" : newOrder}))
+    self.sendMessage(self.exchangeID, ModifyOrder(self.id, order, newOrder))
 
     # Log this activity.
     if self.log_orders: self.logEvent('MODIFY_ORDER', order.to_dict())
@@ -396,7 +516,7 @@ class TradingAgent(FinancialAgent):
   # Handles ORDER_EXECUTED messages from an exchange agent.  Subclasses may wish to extend,
   # but should still call parent method for basic portfolio/returns tracking.
   def orderExecuted (self, order):
-    log_print ("Received notification of execution for: {}", order)
+    if not util.silent_mode: log_print ("Received notification of execution for: {}", order)
 
     # Log this activity.
     if self.log_orders: self.logEvent('ORDER_EXECUTED', order.to_dict())
@@ -426,9 +546,9 @@ class TradingAgent(FinancialAgent):
       else: o.quantity -= order.quantity
 
     else:
-      log_print ("Execution received for order not in orders list: {}", order)
+      if not util.silent_mode: log_print ("Execution received for order not in orders list: {}", order)
 
-    log_print ("After execution, agent open orders: {}", self.orders)
+    if not util.silent_mode: log_print ("After execution, agent open orders: {}", self.orders)
 
     # After execution, log holdings.
     self.logEvent('HOLDINGS_UPDATED', self.holdings)
@@ -436,7 +556,7 @@ class TradingAgent(FinancialAgent):
 
   # Handles ORDER_ACCEPTED messages from an exchange agent.  Subclasses may wish to extend.
   def orderAccepted (self, order):
-    log_print ("Received notification of acceptance for: {}", order)
+    if not util.silent_mode: log_print ("Received notification of acceptance for: {}", order)
 
     # Log this activity.
     if self.log_orders: self.logEvent('ORDER_ACCEPTED', order.to_dict())
@@ -446,9 +566,20 @@ class TradingAgent(FinancialAgent):
     # a given order has been accepted or not (instead of needing to override this method).
 
 
+  # Handles REPLACE_FAILED messages from an exchange agent: order, part of a replaceOrderBatch, was no longer
+  # in the book (it had probably executed), so new_order was not entered.  Subclasses may wish to extend.
+  def replaceFailed (self, order, new_order):
+    if not util.silent_mode: log_print ("Replacement failed, order not in book: {}", order)
+
+    # Log this activity.
+    if self.log_orders: self.logEvent('REPLACE_FAILED', new_order.to_dict())
+
+    self.pending_replacements.pop(new_order.order_id, None)
+
+
   # Handles ORDER_CANCELLED messages from an exchange agent.  Subclasses may wish to extend.
   def orderCancelled (self, order):
-    log_print ("Received notification of cancellation for: {}", order)
+    if not util.silent_mode: log_print ("Received notification of cancellation for: {}", order)
 
     # Log this activity.
     if self.log_orders: self.logEvent('ORDER_CANCELLED', order.to_dict())
@@ -459,7 +590,7 @@ class TradingAgent(FinancialAgent):
     if order.order_id in self.orders:
       del self.orders[order.order_id]
     else:
-      log_print ("Cancellation received for order not in orders list: {}", order)
+      if not util.silent_mode: log_print ("Cancellation received for order not in orders list: {}", order)
 
 
   # Handles MKT_CLOSED messages from an exchange agent.  Subclasses may wish to extend.
@@ -477,13 +608,13 @@ class TradingAgent(FinancialAgent):
   def queryLastTrade (self, symbol, price):
     self.last_trade[symbol] = price
 
-    log_print ("Received last trade price of {} for {}.", self.last_trade[symbol], symbol)
+    if not util.silent_mode: log_print ("Received last trade price of {} for {}.", self.last_trade[symbol], symbol)
 
     if self.mkt_closed:
       # Note this as the final price of the day.
       self.daily_close_price[symbol] = self.last_trade[symbol]
 
-      log_print ("Received daily close price of {} for {}.", self.last_trade[symbol], symbol)
+      if not util.silent_mode: log_print ("Received daily close price of {} for {}.", self.last_trade[symbol], symbol)
 
 
   # Handles QUERY_SPREAD messages from an exchange agent.
@@ -500,7 +631,8 @@ class TradingAgent(FinancialAgent):
     if asks: best_ask, best_ask_qty = (asks[0][0], asks[0][1])
     else: best_ask, best_ask_qty = ('No asks', 0)
 
-    log_print ("Received spread of {} @ {} / {} @ {} for {}", best_bid_qty, best_bid, best_ask_qty, best_ask, symbol)
+    if not util.silent_mode:
+      log_print ("Received spread of {} @ {} / {} @ {} for {}", best_bid_qty, best_bid, best_ask_qty, best_ask, symbol)
 
     self.logEvent("BID_DEPTH", bids)
     self.logEvent("ASK_DEPTH", asks)
@@ -513,11 +645,50 @@ class TradingAgent(FinancialAgent):
     Handles Market Data messages for agents using subscription mechanism
     '''
     symbol = msg.body['symbol']
-    self.known_asks[symbol] = msg.body['asks']
-    self.known_bids[symbol] = msg.body['bids']
+    if 'seq' in msg.body:
+      # Incremental subscription: keep a local copy of the subscribed levels up to date.
+      if not self.applyMarketData(symbol, msg.body): return
+    else:
+      self.known_asks[symbol] = msg.body['asks']
+      self.known_bids[symbol] = msg.body['bids']
     self.last_trade[symbol] = msg.body['last_transaction']
     self.exchange_ts[symbol] = msg.body['exchange_ts']
 
+  def applyMarketData(self, symbol, body):
+    '''
+    Applies an incremental MARKET_DATA message to known_bids and known_asks.  Returns False for a message
+    that arrived after a later one (message latency can reorder them), which is ignored.  If a message
+    is missing, the known levels stop changing until the next full refresh.
+    '''
+    seq = body['seq']
+    last = self.market_data_seq.get(symbol)
+    if last is not None and seq <= last: return False
+    self.market_data_seq[symbol] = seq
+
+    if body['full']:
+      # The exchange shares these lists between subscribers, so keep copies to update in place.
+      self.known_bids[symbol] = list(body['bids'])
+      self.known_asks[symbol] = list(body['asks'])
+      self.market_data_stale.discard(symbol)
+    elif symbol in self.market_data_stale or last is None or seq != last + 1:
+      self.market_data_stale.add(symbol)
+    else:
+      self.applyLevelChanges(self.known_bids[symbol], body['bid_changes'], True)
+      self.applyLevelChanges(self.known_asks[symbol], body['ask_changes'], False)
+    return True
+
+  def applyLevelChanges(self, levels, changes, is_bid):
+    # Applies (price, volume) changes to a list of (price, volume) levels, best first, in place.  A
+    # volume of 0 removes the level.
+    keys = LevelKeys(levels, is_bid)
+    for price, volume in changes:
+      i = bisect_left(keys, keys.sign * price)
+      if i < len(levels) and levels[i][0] == price:
+        if volume: levels[i] = (price, volume)
+        else: del levels[i]
+      elif volume:
+        levels.insert(i, (price, volume))
+
 
   # Handles QUERY_ORDER_STREAM messages from an exchange agent.
   def queryOrderStream (self, symbol, orders):
@@ -561,9 +732,10 @@ class TradingAgent(FinancialAgent):
     bid_liq = self.getBookLiquidity(self.known_bids[symbol], within)
     ask_liq = self.getBookLiquidity(self.known_asks[symbol], within)
 
-    log_print ("Bid/ask liq: {}, {}", bid_liq, ask_liq)
-    log_print ("Known bids: {}", self.known_bids[self.symbol])
-    log_print ("Known asks: {}", self.known_asks[self.symbol])
+    if not util.silent_mode:
+      log_print ("Bid/ask liq: {}, {}", bid_liq, ask_liq)
+      log_print ("Known bids: {}", self.known_bids[self.symbol])
+      log_print ("Known asks: {}", self.known_asks[self.symbol])
 
     return bid_liq, ask_liq
 
@@ -577,7 +749,7 @@ class TradingAgent(FinancialAgent):
 
       # Is this price within "within" proportion of the best price?
       if abs(best - price) <= int(round(best * within)):
-        log_print ("Within {} of {}: {} with {} shares", within, best, price, shares)
+        if not util.silent_mode: log_print ("Within {} of {}: {} with {} shares", within, best, price, shares)
         liq += shares
 
     return liq
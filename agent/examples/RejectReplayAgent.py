@@ -6,6 +6,7 @@ import pandas as pd
 
 from agent.TradingAgent import TradingAgent
 from util.order.LimitOrder import LimitOrder
+from util import replay_cache
 from util.util import log_print
 
 
@@ -99,7 +100,8 @@ class L3OrdersProcessor:
         self.orders_file_path = orders_file_path
         self.processed_orders_folder_path = processed_orders_folder_path
 
-        self.orders_dict = self.processOrders(orders_file_path)
+        # Processed order streams are shared by repeated in-process runs (see util.replay_cache).
+        self.orders_dict = replay_cache.processed_orders(self, lambda: self.processOrders(orders_file_path))
         self.wakeup_times = [*self.orders_dict]
         self.first_wakeup = self.wakeup_times[0]
         self.wakeup_times.pop(0)
@@ -1,14 +1,9 @@
 import sys
-import warnings
 import pandas as pd
 
 from agent.TradingAgent import TradingAgent
 from util.util import log_print
 
-POVExecutionWarning_msg = "Running a configuration using POVExecutionAgent requires an ExchangeAgent with " \
-                              "attribute `stream_history` set to a large value, recommended at sys.maxsize."
-
-
 class POVExecutionAgent(TradingAgent):
 
     def __init__(self, id, name, type, symbol, starting_cash,
@@ -29,7 +24,6 @@ class POVExecutionAgent(TradingAgent):
         self.accepted_orders = []
         self.state = 'AWAITING_WAKEUP'
 
-        warnings.warn(POVExecutionWarning_msg, UserWarning, stacklevel=1)
         self.processEndTime()
 
     def processEndTime(self):
@@ -114,7 +114,7 @@ class AdaptiveMarketMakerAgent(TradingAgent):
         can_trade = super().wakeup(currentTime)
         if self.subscribe and not self.subscription_requested:
             super().requestDataSubscription(self.symbol, levels=self.subscribe_num_levels,
-                                            freq=pd.Timedelta(self.subscribe_freq, unit='ns'))
+                                            freq=pd.Timedelta(self.subscribe_freq, unit='ns'), incremental=True)
             self.subscription_requested = True
             self.get_transacted_volume(self.symbol, lookback_period=self.subscribe_freq)
             self.state = self.initialiseState()
@@ -185,7 +185,7 @@ class AdaptiveMarketMakerAgent(TradingAgent):
                     log_print("SPREAD MISSING at time {}", currentTime)
                     self.state['AWAITING_MARKET_DATA'] = False
 
-            if self.state['MARKET_DATA'] is False and self.state['AWAITING_TRANSACTED_VOLUME'] is False:
+            if self.state['AWAITING_MARKET_DATA'] is False and self.state['AWAITING_TRANSACTED_VOLUME'] is False:
                 self.placeOrders(mid)
                 self.state = self.initialiseState()
 
@@ -252,7 +252,8 @@ class AdaptiveMarketMakerAgent(TradingAgent):
         return bids_to_place, asks_to_place
 
     def placeOrders(self, mid):
-        """ Given a mid-price, compute new orders that need to be placed, then send the orders to the Exchange.
+        """ Given a mid-price, compute new orders that need to be placed, then send the orders to the Exchange in one
+            batch.
 
             :param mid: mid-price
             :type mid: int
@@ -260,31 +261,33 @@ class AdaptiveMarketMakerAgent(TradingAgent):
         """
 
         bid_orders, ask_orders = self.computeOrdersToPlace(mid)
+        orders = []
 
         if self.backstop_quantity is not None:
             bid_price = bid_orders[0]
             log_print('{}: Placing BUY limit order of size {} @ price {}', self.name, self.backstop_quantity, bid_price)
-            self.placeLimitOrder(self.symbol, self.backstop_quantity, True, bid_price)
+            orders.append((self.symbol, self.backstop_quantity, True, bid_price))
             bid_orders = bid_orders[1:]
 
             ask_price = ask_orders[-1]
             log_print('{}: Placing SELL limit order of size {} @ price {}', self.name, self.backstop_quantity, ask_price)
-            self.placeLimitOrder(self.symbol, self.backstop_quantity, False, ask_price)
+            orders.append((self.symbol, self.backstop_quantity, False, ask_price))
             ask_orders = ask_orders[:-1]
 
         for bid_price in bid_orders:
             log_print('{}: Placing BUY limit order of size {} @ price {}', self.name, self.buy_order_size, bid_price)
-            self.placeLimitOrder(self.symbol, self.buy_order_size, True, bid_price)
+            orders.append((self.symbol, self.buy_order_size, True, bid_price))
 
         for ask_price in ask_orders:
             log_print('{}: Placing SELL limit order of size {} @ price {}', self.name, self.sell_order_size, ask_price)
-            self.placeLimitOrder(self.symbol, self.sell_order_size, False, ask_price)
+            orders.append((self.symbol, self.sell_order_size, False, ask_price))
+
+        self.placeLimitOrderBatch(orders)
 
     def getWakeFrequency(self):
         """ Get time increment corresponding to wakeup period. """
         return pd.Timedelta(self.wake_up_freq)
 
     def cancelAllOrders(self):
-        """ Cancels all resting limit orders placed by the market maker """
-        for _, order in self.orders.items():
-            self.cancelOrder(order)
+        """ Cancels all resting limit orders placed by the market maker, in one batch """
+        self.cancelOrderBatch(list(self.orders.values()))
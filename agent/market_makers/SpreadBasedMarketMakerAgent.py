@@ -61,7 +61,8 @@ class SpreadBasedMarketMakerAgent(TradingAgent):
         """ Agent wakeup is determined by self.wake_up_freq """
         can_trade = super().wakeup(currentTime)
         if self.subscribe and not self.subscription_requested:
-            super().requestDataSubscription(self.symbol, levels=self.subscribe_num_levels, freq=self.subscribe_freq)
+            super().requestDataSubscription(self.symbol, levels=self.subscribe_num_levels, freq=self.subscribe_freq,
+                                            incremental=True)
             self.subscription_requested = True
             self.state = 'AWAITING_MARKET_DATA'
         elif can_trade and not self.subscribe:
@@ -91,7 +92,7 @@ class SpreadBasedMarketMakerAgent(TradingAgent):
             if bid and ask:
                 mid = int((ask + bid) / 2)
             else:
-                log_print(f"SPREAD MISSING at time {currentTime}")
+                log_print("SPREAD MISSING at time {}", currentTime)
 
             orders_to_cancel = self.computeOrdersToCancel(mid)
             self.cancelOrders(orders_to_cancel)
@@ -107,7 +108,7 @@ class SpreadBasedMarketMakerAgent(TradingAgent):
             if bid and ask:
                 mid = int((ask + bid) / 2)
             else:
-                log_print(f"SPREAD MISSING at time {currentTime}")
+                log_print("SPREAD MISSING at time {}", currentTime)
                 return
 
             orders_to_cancel = self.computeOrdersToCancel(mid)
@@ -149,19 +150,20 @@ class SpreadBasedMarketMakerAgent(TradingAgent):
         return orders_to_cancel
 
     def cancelOrders(self, orders_to_cancel):
-        """ Given a list of _Order objects, remove the corresponding orders from ExchangeAgent's orderbook
+        """ Given a list of _Order objects, remove the corresponding orders from ExchangeAgent's orderbook in one batch
 
         :param orders_to_cancel: orders to remove from orderbook
         :type orders_to_cancel: list(_Order)
         :return:
         """
+        orders = []
         for order_tuple in orders_to_cancel:
             order_id = order_tuple.id
             try:
-                order = self.orders[order_id]
-                self.cancelOrder(order)
+                orders.append(self.orders[order_id])
             except KeyError:
                 continue
+        self.cancelOrderBatch(orders)
 
     def computeOrdersToPlace(self, mid):
         """ Given a mid price, computes the orders that need to be removed from orderbook, and adds these orders to
@@ -223,7 +225,8 @@ class SpreadBasedMarketMakerAgent(TradingAgent):
         return bids_to_place, asks_to_place
 
     def placeOrders(self, mid):
-        """ Given a mid-price, compute new orders that need to be placed, then send the orders to the Exchange.
+        """ Given a mid-price, compute new orders that need to be placed, then send the orders to the Exchange in one
+            batch.
 
             :param mid: mid-price
             :type mid: int
@@ -231,13 +234,16 @@ class SpreadBasedMarketMakerAgent(TradingAgent):
         """
 
         bid_orders, ask_orders = self.computeOrdersToPlace(mid)
+        orders = []
         for bid_order in bid_orders:
-            log_print(f'{self.name}: Placing BUY limit order of size {self.order_size} @ price {bid_order.price}')
-            self.placeLimitOrder(self.symbol, self.order_size, True, bid_order.price, order_id=bid_order.id)
+            log_print('{}: Placing BUY limit order of size {} @ price {}', self.name, self.order_size, bid_order.price)
+            orders.append((self.symbol, self.order_size, True, bid_order.price, bid_order.id))
 
         for ask_order in ask_orders:
-            log_print(f'{self.name}: Placing SELL limit order of size {self.order_size} @ price {ask_order.price}')
-            self.placeLimitOrder(self.symbol, self.order_size, False, ask_order.price, order_id=ask_order.id)
+            log_print('{}: Placing SELL limit order of size {} @ price {}', self.name, self.order_size, ask_order.price)
+            orders.append((self.symbol, self.order_size, False, ask_order.price, ask_order.id))
+
+        self.placeLimitOrderBatch(orders)
 
     def initialiseBidsAsksDeques(self, mid):
         """ Initialise the current_bids and current_asks object attributes, which internally keep track of the limit
@@ -277,6 +283,5 @@ class SpreadBasedMarketMakerAgent(TradingAgent):
         return pd.Timedelta(self.wake_up_freq)
 
     def cancelAllOrders(self):
-        """ Cancels all resting limit orders placed by the market maker """
-        for _, order in self.orders.items():
-            self.cancelOrder(order)
+        """ Cancels all resting limit orders placed by the market maker, in one batch """
+        self.cancelOrderBatch(list(self.orders.values()))
@@ -0,0 +1,90 @@
+# Micro-benchmark of the Kernel event calendar.  Replays a synthetic message stream with the
+# same put/get pattern as Kernel.runner through the old queue.PriorityQueue of
+# (pd.Timestamp, sequence, event) tuples and through each util.EventQueue scheduler, and reports
+# messages per second for each.
+#
+# Usage: python cli/bench_event_queue.py [num_agents] [num_messages] [max_offset_ns]
+#
+# Small offsets model dense same-timestamp bursts.  Large offsets spread messages over time.
+
+import queue
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+p = str(Path(__file__).resolve().parents[1])  # directory one level up from this file
+sys.path.append(p)
+
+from message.Message import Message, MessageType
+from util.EventQueue import schedulers
+
+
+def make_workload(num_agents, num_messages, max_offset, seed=0):
+  # Delivery offsets (ns) and recipients for every message.
+  rs = np.random.RandomState(seed)
+  offsets = rs.randint(0, max_offset, size=num_messages)
+  recipients = rs.randint(0, num_agents, size=num_messages)
+  return [(int(o), int(r)) for o, r in zip(offsets, recipients)]
+
+
+def bench_priority_queue(start, workload, num_agents):
+  t0 = time.perf_counter()
+  count = 0
+
+  # Messages do not define an ordering, so a monotonic sequence number breaks ties between equal
+  # timestamps, as the Kernel's own event queue does.
+  q = queue.PriorityQueue()
+  seq = 0
+  for agent in range(num_agents):
+    q.put((start, seq, (agent, MessageType.WAKEUP, None)))
+    seq += 1
+
+  for offset, recipient in workload:
+    now, _, event = q.get()
+    q.put((now + pd.Timedelta(offset), seq, (recipient, MessageType.MESSAGE, Message({"msg": "BENCH"}))))
+    seq += 1
+    count += 1
+  while not q.empty():
+    q.get()
+    count += 1
+  return count, time.perf_counter() - t0
+
+
+def bench_event_queue(q, start, workload, num_agents):
+  t0 = time.perf_counter()
+  count = 0
+
+  for agent in range(num_agents):
+    q.put(start, (agent, MessageType.WAKEUP, None))
+
+  for offset, recipient in workload:
+    now, event = q.get()
+    q.put(now + pd.Timedelta(offset), (recipient, MessageType.MESSAGE, Message({"msg": "BENCH"})))
+    count += 1
+  while not q.empty():
+    q.get()
+    count += 1
+  return count, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+  num_agents = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+  num_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 500000
+  max_offset = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+  start = pd.Timestamp('2019-06-28 09:30:00')
+  workload = make_workload(num_agents, num_messages, max_offset)
+
+  print("Event queue benchmark: {} agents, {} messages, offsets up to {} ns".format(num_agents, num_messages,
+                                                                                   max_offset))
+  count, elapsed = bench_priority_queue(start, workload, num_agents)
+  print("{:24s} elapsed: {:8.3f}s, messages per second: {:0.1f}".format("queue.PriorityQueue", elapsed,
+                                                                          count / elapsed))
+
+  for name, scheduler in schedulers.items():
+    count, elapsed = bench_event_queue(scheduler(), start, workload, num_agents)
+    print("{:24s} elapsed: {:8.3f}s, messages per second: {:0.1f}".format(scheduler.__name__, elapsed,
+                                                                            count / elapsed))
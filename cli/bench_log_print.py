@@ -0,0 +1,71 @@
+# Micro-benchmark of silent-mode logging overhead.  Replays the log_print calls the Kernel
+# makes for every message it delivers (a queue pop notice, a handling notice and the
+# post-delivery delay notice, each formatting timestamps with fmtTime) and compares the
+# cost of calling log_print directly against guarding the calls with util.silent_mode.
+#
+# Usage: python cli/bench_log_print.py [num_messages]
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+p = str(Path(__file__).resolve().parents[1])  # directory one level up from this file
+sys.path.append(p)
+
+from Kernel import Kernel
+from message.Message import MessageType
+from util import util
+from util.util import log_print
+
+
+def bench_unguarded(kernel, now, num_messages):
+  t0 = time.perf_counter()
+  for i in range(num_messages):
+    log_print("\n--- Kernel Event Queue pop ---")
+    log_print("Kernel handling {} message for agent {} at time {}",
+              MessageType.MESSAGE, i, kernel.fmtTime(now))
+    log_print("After receiveMessage return, agent {} delayed from {} to {}",
+              i, kernel.fmtTime(now), kernel.fmtTime(now))
+  return time.perf_counter() - t0
+
+
+def bench_guarded(kernel, now, num_messages):
+  t0 = time.perf_counter()
+  for i in range(num_messages):
+    if not util.silent_mode:
+      log_print("\n--- Kernel Event Queue pop ---")
+      log_print("Kernel handling {} message for agent {} at time {}",
+                MessageType.MESSAGE, i, kernel.fmtTime(now))
+    if not util.silent_mode:
+      log_print("After receiveMessage return, agent {} delayed from {} to {}",
+                i, kernel.fmtTime(now), kernel.fmtTime(now))
+  return time.perf_counter() - t0
+
+
+def bench_empty(num_messages):
+  # Bare loop cost, subtracted from the other two.
+  t0 = time.perf_counter()
+  for i in range(num_messages):
+    pass
+  return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+  num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+  util.silent_mode = True
+  kernel = Kernel("Benchmark Kernel", random_state=np.random.RandomState(seed=1))
+  now = pd.Timestamp('2019-06-28 09:30:00')
+
+  base = bench_empty(num_messages)
+  unguarded = bench_unguarded(kernel, now, num_messages) - base
+  guarded = bench_guarded(kernel, now, num_messages) - base
+
+  print("Silent log_print benchmark: {} simulated messages".format(num_messages))
+  print("{:24s} elapsed: {:8.3f}s, ns per message: {:8.1f}".format("unguarded log_print", unguarded,
+                                                                    unguarded / num_messages * 1e9))
+  print("{:24s} elapsed: {:8.3f}s, ns per message: {:8.1f}".format("guarded log_print", guarded,
+                                                                    guarded / num_messages * 1e9))
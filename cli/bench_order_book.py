@@ -0,0 +1,88 @@
+# Micro-benchmark of OrderBook matching on a crossing-heavy workload.  Each round rebuilds
+# both sides of a book with `levels` price levels of `orders_per_level` small resting orders,
+# then sends aggressive limit orders that sweep through several levels at once, so most of
+# the time goes to executing fills (each partial or full fill of a resting order sends one
+# ORDER_EXECUTED to each side of the trade).  Only the sweeps are timed.
+#
+# Usage: python cli/bench_order_book.py [rounds] [levels] [orders_per_level]
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+p = str(Path(__file__).resolve().parents[1])  # directory one level up from this file
+sys.path.append(p)
+
+from util import util
+from util.OrderBook import OrderBook
+from util.order.LimitOrder import LimitOrder
+
+
+class BenchmarkExchange:
+  # The parts of ExchangeAgent that an OrderBook uses.  Messages are counted, not delivered.
+  def __init__(self):
+    self.currentTime = pd.Timestamp('2019-06-28 09:30:00')
+    self.stream_history = 10
+    self.book_freq = None
+    self.book_journal = False
+    self.messages = 0
+
+  def sendMessage(self, recipientID, msg):
+    self.messages += 1
+
+  def logEvent(self, eventType, event='', appendSummaryLog=False):
+    pass
+
+
+def run(rounds, levels, orders_per_level, random_state):
+  exchange = BenchmarkExchange()
+  book = OrderBook(exchange, 'BENCH')
+  mid = 100000
+
+  resting = aggressive = fills = 0
+  elapsed = 0.0
+  for r in range(rounds):
+    # Rebuild the book: asks above and bids below the mid price.
+    for level in range(1, levels + 1):
+      for i in range(orders_per_level):
+        for is_buy in (True, False):
+          price = mid - level if is_buy else mid + level
+          book.handleLimitOrder(LimitOrder(1, exchange.currentTime, 'BENCH', int(random_state.randint(1, 10)),
+                                           is_buy, price))
+          resting += 1
+
+    # Sweep it: alternate buys and sells large enough to take out several levels each.
+    messages = exchange.messages
+    t0 = time.perf_counter()
+    while book.bids and book.asks:
+      is_buy = aggressive % 2 == 0
+      quantity = int(random_state.randint(1, 5 * orders_per_level * 10))
+      price = mid + levels if is_buy else mid - levels
+      book.handleLimitOrder(LimitOrder(2, exchange.currentTime, 'BENCH', quantity, is_buy, price))
+      aggressive += 1
+    elapsed += time.perf_counter() - t0
+    fills += exchange.messages - messages
+
+    # Clear whatever the last sweep left resting.
+    book = OrderBook(exchange, 'BENCH')
+
+  return resting, aggressive, fills, elapsed
+
+
+if __name__ == '__main__':
+  rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+  levels = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+  orders_per_level = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+  util.silent_mode = True
+
+  resting, aggressive, fills, elapsed = run(rounds, levels, orders_per_level, np.random.RandomState(seed=1))
+
+  print("Crossing-heavy OrderBook benchmark: {} rounds of {} levels x {} orders per side".format(
+        rounds, levels, orders_per_level))
+  print("{} resting orders, {} aggressive orders, {} messages sent while sweeping".format(resting, aggressive, fills))
+  print("sweep elapsed: {:8.3f}s, us per aggressive order: {:8.1f}, us per message: {:8.2f}".format(
+        elapsed, elapsed / aggressive * 1e6, elapsed / fills * 1e6))
@@ -1,25 +1,164 @@
+# Runs one config for many seeds in parallel, e.g.
+#
+#   python config/parallel.py --config rmsc03 --log_folder sweep --num_simulations 500 --seed 1 -- -t ABM -d 20200603
+#
+# Arguments not recognized here are passed through to the config.  Each run executes in a
+# worker process through util.multi_run.run_config, so it logs to <log_folder>_seed_<seed>
+# just as `python abides.py -c <config> -l <log_folder>_seed_<seed> -s <seed>` would.
+#
+# Workers are forked after the config's own imports have been done once in this process,
+# so no run pays for interpreter startup or for importing numpy, pandas, scipy and the
+# simulator.  Each run's stdout goes to stdout.txt in its log directory.  The Kernel's
+# custom_state, the summary log and the run's wall clock time are sent back, failed runs
+# are retried, and everything is collected into <log_folder>_results.csv (one row per
+# seed) and <log_folder>_results.pkl (full custom_state and summary log) under ./log.
+
 import argparse
+import ast
+import contextlib
+import multiprocessing
 import os
-from multiprocessing import Pool
-import psutil
+import pickle
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
 import datetime as dt
 import numpy as np
+import pandas as pd
+import psutil
 
-
-def run_in_parallel(num_simulations, num_parallel, config, log_folder, verbose):
-
-    global_seeds = np.random.randint(0, 2 ** 32, num_simulations)
-    print(f'Global Seeds: {global_seeds}')
-
-    processes = [f'python -u abides.py -c {config} -l {log_folder}_seed_{seed} {"-v" if verbose else ""} -s {seed}'
-                 for seed in global_seeds]
-
-    pool = Pool(processes=num_parallel)
-    pool.map(run_process, processes)
-
-
-def run_process(process):
-    os.system(process)
+p = str(Path(__file__).resolve().parents[1])  # directory one level up from this file
+sys.path.append(p)
+
+from util.multi_run import args_for_seed, run_config
+
+
+def preload_config_imports(config):
+    # Execute the config's module-level import statements (only those) in this process, so
+    # forked workers inherit the imported modules.  Anything that fails to import here is
+    # skipped; the worker will report the error properly when it runs the config.
+    path = os.path.join(p, 'config', '{}.py'.format(config))
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            try:
+                exec(compile(ast.Module(body=[node], type_ignores=[]), path, 'exec'), {})
+            except Exception:
+                pass
+
+
+def picklable(state):
+    # custom_state is freeform, so replace any entry that cannot be sent back to the
+    # parent process with its repr.
+    if state is None: return None
+
+    result = {}
+    for key, value in state.items():
+        try:
+            pickle.dumps(value)
+            result[key] = value
+        except Exception:
+            result[key] = repr(value)
+    return result
+
+
+def run_seed(config, config_args, seed, log_folder):
+    # Worker: run the config once for this seed.  Returns a result dict; exceptions
+    # propagate to the parent, which decides whether to retry.
+    args = args_for_seed(config_args, seed, log_folder)
+    log_dir = args[args.index('-l') + 1]
+
+    path = os.path.join('.', 'log', log_dir)
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    start = time.perf_counter()
+    with open(os.path.join(path, 'stdout.txt'), 'w') as out, contextlib.redirect_stdout(out):
+        config_globals = run_config(config, args)
+    elapsed = time.perf_counter() - start
+
+    kernel = config_globals.get('kernel')
+    return {'seed': seed,
+            'log_dir': log_dir,
+            'elapsed_seconds': elapsed,
+            'worker_pid': os.getpid(),
+            'custom_state': picklable(kernel.custom_state) if kernel is not None else None,
+            'summary_log': kernel.summaryLog if kernel is not None else None}
+
+
+def run_in_parallel(seeds, num_parallel, config, config_args, log_folder, max_attempts=2):
+    # Returns one result dict per seed, in seed order.  Runs that raise are retried until
+    # they have been attempted max_attempts times, after which the error is recorded.  If a
+    # worker dies outright (e.g. killed for memory) the pool is broken, and every run still
+    # pending is retried in a new pool.
+    preload_config_imports(config)
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+    attempts = {seed: 0 for seed in seeds}
+    results = {}
+    pending = list(seeds)
+
+    while pending:
+        retry = []
+        with ProcessPoolExecutor(max_workers=num_parallel, mp_context=context) as executor:
+            futures = {executor.submit(run_seed, config, config_args, seed, log_folder): seed
+                       for seed in pending}
+
+            for future in as_completed(futures):
+                seed = futures[future]
+                attempts[seed] += 1
+                try:
+                    result = future.result()
+                    result['status'] = 'ok'
+                    result['attempts'] = attempts[seed]
+                    results[seed] = result
+                    print(f'Seed {seed} finished in {result["elapsed_seconds"]:0.1f}s '
+                          f'({len(results)}/{len(seeds)} done)')
+                except Exception as e:
+                    error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+                    if attempts[seed] < max_attempts:
+                        print(f'Seed {seed} failed (attempt {attempts[seed]}), will retry: {error}')
+                        retry.append(seed)
+                        continue
+                    print(f'Seed {seed} failed (attempt {attempts[seed]}), giving up: {error}')
+                    results[seed] = {'seed': seed, 'status': 'failed', 'attempts': attempts[seed],
+                                     'error': error, 'custom_state': None, 'summary_log': None}
+        pending = retry
+
+    return [results[seed] for seed in seeds]
+
+
+def results_table(results):
+    # One row per run: status and timing, plus every scalar custom_state entry.
+    rows = []
+    for result in results:
+        row = {key: value for key, value in result.items() if key not in ('custom_state', 'summary_log')}
+        for key, value in (result['custom_state'] or {}).items():
+            if value is None or np.isscalar(value) or isinstance(value, (pd.Timestamp, pd.Timedelta)):
+                row[key] = value
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def write_results(results, log_folder):
+    path = os.path.join('.', 'log')
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    table = results_table(results)
+    table.to_csv(os.path.join(path, f'{log_folder}_results.csv'), index=False)
+
+    with open(os.path.join(path, f'{log_folder}_results.pkl'), 'wb') as f:
+        pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return table
 
 
 if __name__ == "__main__":
@@ -32,6 +171,8 @@ if __name__ == "__main__":
                         help='Total number of simulations to run')
     parser.add_argument('--num_parallel', type=int, default=None,
                         help='Number of simulations to run in parallel')
+    parser.add_argument('--max_attempts', type=int, default=2,
+                        help='Number of times to attempt each simulation before recording a failure')
     parser.add_argument('--config', required=True,
                         help='Name of config file to execute')
     parser.add_argument('--log_folder', required=True,
@@ -48,17 +189,30 @@ if __name__ == "__main__":
     log_folder = args.log_folder
     verbose = args.verbose
 
+    # Everything else is for the config.
+    config_args = [arg for arg in remaining_args if arg != '--']
+    if verbose: config_args.append('-v')
+
     print(f'Total number of simulation: {num_simulations}')
     print(f'Number of simulations to run in parallel: {num_parallel}')
     print(f'Configuration: {config}')
 
     np.random.seed(seed)
 
-    run_in_parallel(num_simulations=num_simulations,
-                    num_parallel=num_parallel,
-                    config=config,
-                    log_folder=log_folder,
-                    verbose=verbose)
+    global_seeds = np.random.randint(0, 2 ** 32, num_simulations)
+    print(f'Global Seeds: {global_seeds}')
+
+    results = run_in_parallel(seeds=[int(s) for s in global_seeds],
+                              num_parallel=num_parallel,
+                              config=config,
+                              config_args=config_args,
+                              log_folder=log_folder,
+                              max_attempts=args.max_attempts)
+
+    table = write_results(results, log_folder)
+    failed = table[table['status'] != 'ok']
+    print(f'Completed: {len(table) - len(failed)}, failed: {len(failed)}')
+    if len(failed): print(failed[['seed', 'attempts', 'error']].to_string(index=False))
 
     end_time = dt.datetime.now()
-    print(f'Total time taken to run in parallel: {end_time - start_time}')
\ No newline at end of file
+    print(f'Total time taken to run in parallel: {end_time - start_time}')
@@ -16,6 +16,7 @@ from dateutil.parser import parse
 from Kernel import Kernel
 from util import util
 from util.order import LimitOrder
+from util.KernelTelemetry import KernelTelemetry
 from util.oracle.SparseMeanRevertingOracle import SparseMeanRevertingOracle
 
 from agent.ExchangeAgent import ExchangeAgent
@@ -71,6 +72,16 @@ parser.add_argument('-v',
 parser.add_argument('--config_help',
                     action='store_true',
                     help='Print argument options for this config file')
+parser.add_argument('--profile-kernel',
+                    action='store_true',
+                    help='Collect Kernel profiling counters (written to kernel_profile.json in the log directory)')
+parser.add_argument('--telemetry',
+                    default=None,
+                    help='File to which the Kernel writes periodic progress rows (.jsonl, or .csv)')
+parser.add_argument('--telemetry-interval',
+                    type=float,
+                    default=10.0,
+                    help='Wall clock seconds between telemetry rows')
 # Execution agent config
 parser.add_argument('-e',
                     '--execution-agents',
@@ -408,7 +419,9 @@ kernel.runner(agents=agents,
               #agentLatency=latency,
               #latencyNoise=noise,
               oracle=None,
-              log_dir=args.log_dir)
+              log_dir=args.log_dir,
+              profile_counters=args.profile_kernel,
+              telemetry=KernelTelemetry(args.telemetry, interval=args.telemetry_interval) if args.telemetry else None)
 
 
 simulation_end_time = dt.datetime.now()
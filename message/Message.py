@@ -6,12 +6,12 @@ class MessageType(Enum):
   WAKEUP = 2
 
   def __lt__(self, other):
-    return self.value < other.value 
+    return self.value < other.value
 
 
 class Message:
 
-  uniq = 0
+  __slots__ = ('body',)
 
   def __init__ (self, body = None):
     # The base Message class no longer holds envelope/header information,
@@ -19,32 +19,271 @@ class Message:
     # body.  Delivery metadata is now handled outside the message itself.
     # The body may be overridden by specific message type subclasses.
     # It is acceptable for WAKEUP type messages to have no body.
+    #
+    # Messages due for delivery at the same time step are ordered by the
+    # kernel's event queue (see util.EventQueue), so messages themselves
+    # need no ordering.
     self.body = body
 
-    # The autoincrementing variable here will ensure that, when Messages are
-    # due for delivery at the same time step, the Message that was created
-    # first is delivered first.  (Which is not important, but Python 3
-    # requires a fully resolved chain of priority in all cases, so we need
-    # something consistent.)  We might want to generate these with stochasticity,
-    # but guarantee uniqueness somehow, to make delivery of orders at the same
-    # exact timestamp "random" instead of "arbitrary" (FIFO among tied times)
-    # as it currently is.
-    self.uniq = Message.uniq
-    Message.uniq += 1
-
     # The base Message class can no longer do any real error checking.
     # Subclasses are strongly encouraged to do so based on their body.
 
 
-  def __lt__(self, other):
-    # Required by Python3 for this object to be placed in a priority queue.
-    # If we ever decide to place something on the queue other than Messages,
-    # we will need to alter the below to not assume the other object is
-    # also a Message.
+  def __str__(self):
+    # Make a printable representation of this message.
+    return str(self.body)
+
+
+class TypedMessage(Message):
+  # Base class for the typed messages below, used for the messages an exchange and its trading
+  # agents exchange most often.  They carry their fields in slots instead of a body dictionary,
+  # which makes them cheaper to create and to read.  A typed message is its own body and supports
+  # the dictionary reads agents make of bodies (msg.body['order'], 'seq' in msg.body,
+  # msg.body.get('incremental', False)), with its message type under 'msg', so agents handle it
+  # exactly as they would the equivalent Message({"msg": ..., ...}).  A field that was not set is
+  # absent, like a missing key.
+  #
+  # Subclasses set msg (the message type) and __slots__ (their fields, which are also the keyword
+  # arguments of their constructors).
+
+  __slots__ = ()
+  msg = None
+
+  def __init__(self):
+    pass
+
+  @property
+  def body(self):
+    return self
 
-    return (self.uniq < other.uniq)
+  def __getitem__(self, key):
+    try:
+      return getattr(self, key)
+    except AttributeError:
+      raise KeyError(key) from None
 
+  def __contains__(self, key):
+    return key == 'msg' or (key in self.__slots__ and hasattr(self, key))
+
+  def get(self, key, default=None):
+    return getattr(self, key, default) if key in self else default
+
+  def keys(self):
+    return ['msg'] + [key for key in self.__slots__ if hasattr(self, key)]
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def items(self):
+    return [(key, self[key]) for key in self.keys()]
+
+  def to_dict(self):
+    return dict(self.items())
 
   def __str__(self):
-    # Make a printable representation of this message.
-    return str(self.body)
+    return str(self.to_dict())
+
+
+# Messages from trading agents to an exchange.
+
+class PlaceLimitOrder(TypedMessage):
+  __slots__ = ('sender', 'order')
+  msg = "LIMIT_ORDER"
+
+  def __init__(self, sender, order):
+    self.sender = sender
+    self.order = order
+
+
+class PlaceMarketOrder(TypedMessage):
+  __slots__ = ('sender', 'order')
+  msg = "MARKET_ORDER"
+
+  def __init__(self, sender, order):
+    self.sender = sender
+    self.order = order
+
+
+class CancelOrder(TypedMessage):
+  __slots__ = ('sender', 'order')
+  msg = "CANCEL_ORDER"
+
+  def __init__(self, sender, order):
+    self.sender = sender
+    self.order = order
+
+
+class ModifyOrder(TypedMessage):
+  __slots__ = ('sender', 'order', 'new_order')
+  msg = "MODIFY_ORDER"
+
+  def __init__(self, sender, order, new_order):
+    self.sender = sender
+    self.order = order
+    self.new_order = new_order
+
+
+class QueryLastTrade(TypedMessage):
+  __slots__ = ('sender', 'symbol')
+  msg = "QUERY_LAST_TRADE"
+
+  def __init__(self, sender, symbol):
+    self.sender = sender
+    self.symbol = symbol
+
+
+class QuerySpread(TypedMessage):
+  __slots__ = ('sender', 'symbol', 'depth')
+  msg = "QUERY_SPREAD"
+
+  def __init__(self, sender, symbol, depth):
+    self.sender = sender
+    self.symbol = symbol
+    self.depth = depth
+
+
+class QueryOrderStream(TypedMessage):
+  __slots__ = ('sender', 'symbol', 'length')
+  msg = "QUERY_ORDER_STREAM"
+
+  def __init__(self, sender, symbol, length):
+    self.sender = sender
+    self.symbol = symbol
+    self.length = length
+
+
+class QueryTransactedVolume(TypedMessage):
+  __slots__ = ('sender', 'symbol', 'lookback_period')
+  msg = "QUERY_TRANSACTED_VOLUME"
+
+  def __init__(self, sender, symbol, lookback_period):
+    self.sender = sender
+    self.symbol = symbol
+    self.lookback_period = lookback_period
+
+
+# Messages from an exchange to trading agents.
+
+class OrderAccepted(TypedMessage):
+  __slots__ = ('order',)
+  msg = "ORDER_ACCEPTED"
+
+  def __init__(self, order):
+    self.order = order
+
+
+class OrderExecuted(TypedMessage):
+  __slots__ = ('order',)
+  msg = "ORDER_EXECUTED"
+
+  def __init__(self, order):
+    self.order = order
+
+
+class OrderCancelled(TypedMessage):
+  __slots__ = ('order',)
+  msg = "ORDER_CANCELLED"
+
+  def __init__(self, order):
+    self.order = order
+
+
+class OrderModified(TypedMessage):
+  __slots__ = ('new_order',)
+  msg = "ORDER_MODIFIED"
+
+  def __init__(self, new_order):
+    self.new_order = new_order
+
+
+class OrderBatch(TypedMessage):
+  # The responses to a batch of orders (see ExchangeAgent.handleOrderBatch), as a list of messages.
+  __slots__ = ('messages',)
+  msg = "ORDER_BATCH"
+
+  def __init__(self, messages):
+    self.messages = messages
+
+
+class ReplaceFailed(TypedMessage):
+  # A cancel/replace in a REPLACE_BATCH whose order was no longer in the book, so new_order was not entered.
+  __slots__ = ('order', 'new_order')
+  msg = "REPLACE_FAILED"
+
+  def __init__(self, order, new_order):
+    self.order = order
+    self.new_order = new_order
+
+
+class MarketClosed(TypedMessage):
+  __slots__ = ()
+  msg = "MKT_CLOSED"
+
+
+class QueryLastTradeReply(TypedMessage):
+  __slots__ = ('symbol', 'data', 'mkt_closed')
+  msg = "QUERY_LAST_TRADE"
+
+  def __init__(self, symbol, data, mkt_closed):
+    self.symbol = symbol
+    self.data = data
+    self.mkt_closed = mkt_closed
+
+
+class QuerySpreadReply(TypedMessage):
+  __slots__ = ('symbol', 'depth', 'bids', 'asks', 'data', 'mkt_closed', 'book')
+  msg = "QUERY_SPREAD"
+
+  def __init__(self, symbol, depth, bids, asks, data, mkt_closed, book=''):
+    self.symbol = symbol
+    self.depth = depth
+    self.bids = bids
+    self.asks = asks
+    self.data = data
+    self.mkt_closed = mkt_closed
+    self.book = book
+
+
+class QueryOrderStreamReply(TypedMessage):
+  __slots__ = ('symbol', 'length', 'mkt_closed', 'orders')
+  msg = "QUERY_ORDER_STREAM"
+
+  def __init__(self, symbol, length, mkt_closed, orders):
+    self.symbol = symbol
+    self.length = length
+    self.mkt_closed = mkt_closed
+    self.orders = orders
+
+
+class QueryTransactedVolumeReply(TypedMessage):
+  __slots__ = ('symbol', 'transacted_volume', 'mkt_closed')
+  msg = "QUERY_TRANSACTED_VOLUME"
+
+  def __init__(self, symbol, transacted_volume, mkt_closed):
+    self.symbol = symbol
+    self.transacted_volume = transacted_volume
+    self.mkt_closed = mkt_closed
+
+
+class MarketData(TypedMessage):
+  # A market data subscription update.  A plain one carries bids and asks.  An incremental one
+  # carries seq and full, and then bids and asks if full, or bid_changes and ask_changes if not
+  # (see ExchangeAgent.marketDataChanges).
+  __slots__ = ('symbol', 'last_transaction', 'exchange_ts', 'bids', 'asks', 'seq', 'full',
+               'bid_changes', 'ask_changes')
+  msg = "MARKET_DATA"
+
+  def __init__(self, symbol, last_transaction, exchange_ts, bids=None, asks=None, seq=None, full=None,
+               bid_changes=None, ask_changes=None):
+    self.symbol = symbol
+    self.last_transaction = last_transaction
+    self.exchange_ts = exchange_ts
+    if bids is not None:
+      self.bids = bids
+      self.asks = asks
+    if seq is not None:
+      self.seq = seq
+      self.full = full
+    if bid_changes is not None:
+      self.bid_changes = bid_changes
+      self.ask_changes = ask_changes
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The simulator's packages (agent, message, util, ...) are imported from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util import util
+
+util.silent_mode = True
+
+from agent.ExchangeAgent import ExchangeAgent
+from agent.TradingAgent import TradingAgent
+from stub_kernel import StubKernel
+
+
+MKT_OPEN = pd.Timestamp('2020-06-03 09:30:00')
+MKT_CLOSE = pd.Timestamp('2020-06-03 16:00:00')
+TIME = MKT_OPEN + pd.Timedelta('1min')
+
+
+def make_exchange(**kwargs):
+  # An exchange for the symbol ABM that archives no snapshots, with any other arguments given.
+  kwargs.setdefault('book_freq', None)
+  return ExchangeAgent(0, "EXCHANGE", "ExchangeAgent", MKT_OPEN, MKT_CLOSE, ['ABM'],
+                       random_state=np.random.RandomState(1), **kwargs)
+
+
+@pytest.fixture
+def book():
+  # The ABM order book of an exchange that keeps a journal, at TIME.
+  exchange = make_exchange(book_journal=True)
+  StubKernel([exchange])
+  exchange.currentTime = TIME
+  return exchange.order_books['ABM']
+
+
+@pytest.fixture
+def agents():
+  # An exchange and two trading agents connected by a StubKernel, at TIME: (exchange, traders, kernel).
+  exchange = make_exchange(computation_delay=1, market_data_refresh=100)
+  traders = [TradingAgent(i, "TRADER {}".format(i), "TradingAgent", random_state=np.random.RandomState(i),
+                          log_to_file=False) for i in (1, 2)]
+  for trader in traders:
+    trader.exchangeID = exchange.id
+    trader.currentTime = TIME
+  kernel = StubKernel([exchange] + traders)
+  return exchange, traders, kernel
@@ -0,0 +1,24 @@
+# A stand-in for the Kernel for tests that pass messages between a few agents directly.
+
+
+class StubKernel:
+  # Delivers messages between the agents in the order they were sent, with no latency.
+
+  def __init__(self, agents):
+    self.agents = {agent.id: agent for agent in agents}
+    self.queue = []
+    for agent in agents: agent.kernel = self
+
+  def sendMessage(self, sender, recipient, msg, delay=0):
+    self.queue.append((recipient, msg))
+
+  def setAgentComputeDelay(self, sender, requestedDelay):
+    pass
+
+  def deliver(self, currentTime, drop=None):
+    # Deliver every queued message (including those sent on delivery) at currentTime.  Messages for which
+    # drop(recipient, msg) is true are lost instead.
+    while self.queue:
+      recipient, msg = self.queue.pop(0)
+      if drop is not None and drop(recipient, msg): continue
+      self.agents[recipient].receiveMessage(currentTime, msg)
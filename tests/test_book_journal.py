@@ -0,0 +1,68 @@
+import pandas as pd
+
+from conftest import TIME
+from util.BookJournal import BookJournal
+from util.order.LimitOrder import LimitOrder
+
+
+def limit_order(quantity, is_buy_order, price, order_id):
+  return LimitOrder(5, TIME, 'ABM', quantity, is_buy_order, price, order_id)
+
+
+def resting_orders(book):
+  # The live book's resting orders in the layout of BookJournal.orders().
+  rows = [(order.order_id, order.is_buy_order, order.limit_price, order.quantity)
+          for side in (book.bids, book.asks) for level in side.levelsFromBest() for order in level]
+  return pd.DataFrame(rows, columns=['OrderID', 'IsBuy', 'Price', 'Quantity'])
+
+
+def check_rebuilt(book, journal):
+  assert journal.levels() == (book.getInsideBids(), book.getInsideAsks())
+  rebuilt = journal.orders()
+  live = resting_orders(book)
+  assert rebuilt.OrderID.tolist() == live.OrderID.tolist()
+  assert rebuilt[['IsBuy', 'Price', 'Quantity']].values.tolist() == live[['IsBuy', 'Price', 'Quantity']].values.tolist()
+
+
+def test_journal_rebuilds_book_with_string_and_reused_ids(book, tmp_path):
+  # Order ids in the style of SpreadBasedMarketMakerAgent, mixed with the usual integer ids.
+  book.handleLimitOrder(limit_order(100, True, 1000, 'SBMM_5_1'))
+  book.handleLimitOrder(limit_order(50, True, 1000, 'SBMM_5_2'))
+  book.handleLimitOrder(limit_order(70, False, 1010, 'SBMM_5_3'))
+  book.handleLimitOrder(limit_order(20, True, 1005, 3))
+
+  book.owner.currentTime = TIME + pd.Timedelta('1s')
+  book.handleLimitOrder(limit_order(30, False, 1000, 4))
+  book.modifyOrder(limit_order(70, False, 1010, 'SBMM_5_3'), limit_order(40, False, 1010, 'SBMM_5_3'))
+  book.cancelOrder(limit_order(50, True, 1000, 'SBMM_5_2'))
+
+  # SBMM_5_2 is reused for a new order at another price once the first has left the book.
+  book.owner.currentTime = TIME + pd.Timedelta('2s')
+  book.handleLimitOrder(limit_order(60, True, 999, 'SBMM_5_2'))
+  book.handleLimitOrder(limit_order(25, True, 1000, 'SBMM_5_4'))
+
+  journal = book.journal
+  check_rebuilt(book, journal)
+  assert journal.orders().OrderID.tolist() == ['SBMM_5_1', 'SBMM_5_4', 'SBMM_5_2', 'SBMM_5_3']
+
+  # The book as it stood before the reuse.
+  before = journal.orders(TIME.value + 10**9)
+  assert before.OrderID.tolist() == ['SBMM_5_1', 'SBMM_5_3']
+  assert before.Quantity.tolist() == [90, 40]
+
+  filename = str(tmp_path / 'journal.npz')
+  journal.write(filename)
+  loaded = BookJournal.load(filename)
+  assert loaded.levels() == journal.levels()
+  assert loaded.orders().equals(journal.orders())
+  # Ids of mixed types are saved as strings.
+  assert loaded.to_df().OrderID.tolist() == [str(order_id) for order_id in journal.to_df().OrderID]
+
+
+def test_journal_keeps_integer_ids(book):
+  for order_id, price in ((1, 1000), (2, 1001), (3, 999)):
+    book.handleLimitOrder(limit_order(10, True, price, order_id))
+  book.handleLimitOrder(limit_order(15, False, 1000, 4))
+
+  check_rebuilt(book, book.journal)
+  assert book.journal.orders().OrderID.tolist() == [1, 3]
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from message.Message import MessageType
+from util.EventQueue import CalendarEventQueue, HeapEventQueue
+
+
+BUCKET_WIDTH = 100
+
+
+@pytest.mark.parametrize('ns_clock', [True, False])
+@pytest.mark.parametrize('seed', range(5))
+def test_heap_and_calendar_deliver_in_same_order(seed, ns_clock):
+  # Drive both schedulers with the same randomized stream of puts, gets and requeues, as the Kernel does:
+  # no event is due before the last one delivered, many share (ns, recipient, message type), and they span
+  # many buckets.  Every delivery must match.
+  random_state = np.random.RandomState(seed)
+  queues = [HeapEventQueue(), CalendarEventQueue(bucket_width=BUCKET_WIDTH)]
+  offsets = [0, 0, 1, 5, BUCKET_WIDTH - 1, BUCKET_WIDTH, 3 * BUCKET_WIDTH + 7, 50 * BUCKET_WIDTH]
+  now, last, delivered = 0, None, []
+
+  def at(ns):
+    return ns if ns_clock else pd.Timestamp(ns)
+
+  for i in range(3000):
+    action = random_state.randint(10)
+    if not queues[0].empty() and action < 4:
+      (deliverAt, last), other = (queue.get() for queue in queues)
+      assert (deliverAt, last) == other
+      now = deliverAt if ns_clock else deliverAt.value
+      delivered.append(last[2])
+    elif last is not None and action == 4:
+      # The event delivered last goes back in, later, keeping its sequence number.
+      ns = now + int(random_state.choice([0, 1, BUCKET_WIDTH]))
+      for queue in queues: queue.requeue(at(ns), last)
+      last = None
+    else:
+      ns = now + int(random_state.choice(offsets))
+      event = (int(random_state.randint(3)), MessageType(int(random_state.randint(1, 3))), i)
+      for queue in queues: queue.put(at(ns), event)
+
+  while not queues[0].empty():
+    assert queues[0].get() == queues[1].get()
+  assert queues[1].empty()
+  assert len(delivered) > 1000
+
+
+def test_ties_break_on_recipient_then_type_then_insertion_order():
+  events = [(2, MessageType.MESSAGE, 'a'), (1, MessageType.WAKEUP, 'b'), (1, MessageType.MESSAGE, 'c'),
+            (1, MessageType.MESSAGE, 'd'), (0, MessageType.WAKEUP, 'e'), (1, MessageType.WAKEUP, 'f')]
+  expected = ['e', 'c', 'd', 'b', 'f', 'a']
+
+  for queue in (HeapEventQueue(), CalendarEventQueue(bucket_width=BUCKET_WIDTH)):
+    for event in events:
+      queue.put(5 * BUCKET_WIDTH, event)
+    # An earlier event in another bucket comes first.
+    queue.put(BUCKET_WIDTH + 1, (9, MessageType.WAKEUP, 'first'))
+    assert [queue.get()[1][2] for _ in range(len(events) + 1)] == ['first'] + expected
+    assert queue.empty()
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Kernel import Kernel
+from agent.Agent import Agent
+from message.Message import Message
+
+
+START = pd.Timestamp('2020-06-03 09:30:00')
+BUSY = 1000
+
+
+class Recorder(Agent):
+  # Takes BUSY ns over each wakeup or message, and records when each one arrives.
+
+  def __init__(self, id):
+    super().__init__(id, "RECORDER", "Recorder", np.random.RandomState(id), log_to_file=False)
+    self.deliveries = []
+
+  def kernelStarting(self, startTime):
+    super().kernelStarting(startTime)
+    self.setComputationDelay(BUSY)
+
+  def wakeup(self, currentTime):
+    super().wakeup(currentTime)
+    self.deliveries.append((currentTime, 'wakeup'))
+    # A second wakeup that falls due while the agent is busy with messages.
+    if len(self.deliveries) == 1: self.setWakeup(currentTime + pd.Timedelta(500))
+
+  def receiveMessage(self, currentTime, msg):
+    super().receiveMessage(currentTime, msg)
+    self.deliveries.append((currentTime, msg.body))
+
+
+class Sender(Agent):
+  # Sends the recorder a burst of messages while it is busy with its first wakeup, and one more later.
+
+  def __init__(self, id, recipient):
+    super().__init__(id, "SENDER", "Sender", np.random.RandomState(id), log_to_file=False)
+    self.recipient = recipient
+
+  def kernelStarting(self, startTime):
+    super().kernelStarting(startTime)
+    self.setComputationDelay(0)
+
+  def wakeup(self, currentTime):
+    super().wakeup(currentTime)
+    if currentTime == START:
+      for i, delay in enumerate((1, 100, 200, 300)):
+        self.sendMessage(self.recipient, Message(i), delay=delay)
+      self.setWakeup(START + pd.Timedelta(1500))
+    else:
+      self.sendMessage(self.recipient, Message('late'))
+
+
+@pytest.mark.parametrize('scheduler', ['heap', 'calendar'])
+@pytest.mark.parametrize('ns_clock', [False, True])
+def test_busy_agent_receives_held_events_in_order(tmp_path, monkeypatch, ns_clock, scheduler):
+  # The Kernel writes its summary log under ./log.
+  monkeypatch.chdir(tmp_path)
+
+  recorder = Recorder(0)
+  agents = [recorder, Sender(1, 0)]
+  kernel = Kernel("Test Kernel", random_state=np.random.RandomState(1))
+  kernel.runner(agents=agents, startTime=START, stopTime=START + pd.Timedelta('1s'), defaultLatency=0,
+                skip_log=True, log_dir='test', ns_clock=ns_clock, scheduler=scheduler)
+
+  # Everything that arrives while the recorder is busy waits until it is free, one event per BUSY ns.
+  # Waiting messages come before a waiting wakeup, and otherwise keep the order in which they were sent.
+  expected = [(0, 'wakeup'), (1, 0), (2, 1), (3, 2), (4, 3), (5, 'late'), (6, 'wakeup')]
+  assert recorder.deliveries == [(START + pd.Timedelta(i * BUSY), body) for i, body in expected]
+
+  # Only the first waiting event went back into the queue; the others were held in the inbox.
+  assert kernel.inboxedEvents == 5
+  assert not any(kernel.agentInboxes)
+
+
+class Failing(Agent):
+  # Raises from its first wakeup.
+
+  def __init__(self, id):
+    super().__init__(id, "FAILING", "Failing", np.random.RandomState(id), log_to_file=False)
+
+  def wakeup(self, currentTime):
+    super().wakeup(currentTime)
+    raise RuntimeError("agent failed")
+
+
+def test_telemetry_file_is_closed_when_an_agent_raises(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+
+  kernel = Kernel("Test Kernel", random_state=np.random.RandomState(1))
+  with pytest.raises(RuntimeError):
+    kernel.runner(agents=[Failing(0)], startTime=START, stopTime=START + pd.Timedelta('1s'), defaultLatency=0,
+                  skip_log=True, log_dir='test', telemetry=str(tmp_path / 'telemetry.jsonl'))
+
+  assert kernel.telemetry.file is None
+  assert (tmp_path / 'telemetry.jsonl').read_text()
+
+
+def test_profile_is_not_written_with_skip_log(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+
+  kernel = Kernel("Test Kernel", random_state=np.random.RandomState(1))
+  kernel.runner(agents=[Recorder(0)], startTime=START, stopTime=START + pd.Timedelta('1s'), defaultLatency=0,
+                skip_log=True, log_dir='test', profile_counters=True)
+
+  assert 'kernel_profile' in kernel.custom_state
+  # The summary log is always written, but the profile follows skip_log like the agent logs.
+  assert not (tmp_path / 'log' / 'test' / 'kernel_profile.json').exists()
@@ -0,0 +1,118 @@
+import pandas as pd
+
+from conftest import TIME
+
+
+
+def place(trader, kernel, time, price):
+  trader.currentTime = time
+  trader.placeLimitOrder('ABM', 10, True, price)
+  kernel.deliver(time)
+
+
+def test_resubscribe_after_cancel_accepts_new_sequence(agents):
+  exchange, (trader, _), kernel = agents
+  book = exchange.order_books['ABM']
+  time = TIME
+
+  trader.requestDataSubscription('ABM', 5, 0, incremental=True)
+  kernel.deliver(time)
+  for i in range(5):
+    time += pd.Timedelta('1s')
+    place(trader, kernel, time, 1000 + i)
+  assert trader.market_data_seq['ABM'] == 4
+
+  trader.cancelDataSubscription('ABM')
+  kernel.deliver(time)
+  time += pd.Timedelta('1s')
+  place(trader, kernel, time, 990)
+  assert 'ABM' not in trader.market_data_seq
+
+  # The new subscription numbers its messages from 0 again, starting with a full refresh.
+  trader.requestDataSubscription('ABM', 5, 0, incremental=True)
+  kernel.deliver(time)
+  for price in (995, 1010):
+    time += pd.Timedelta('1s')
+    place(trader, kernel, time, price)
+
+  assert trader.market_data_seq['ABM'] == 1
+  assert 'ABM' not in trader.market_data_stale
+  assert trader.known_bids['ABM'] == book.getInsideBids(5)
+  assert trader.known_asks['ABM'] == book.getInsideAsks(5)
+
+
+def test_replacement_subscription_starts_with_full_refresh(agents):
+  exchange, (trader, _), kernel = agents
+  book = exchange.order_books['ABM']
+  time = TIME
+
+  trader.requestDataSubscription('ABM', 5, 0, incremental=True)
+  kernel.deliver(time)
+  for i in range(3):
+    time += pd.Timedelta('1s')
+    place(trader, kernel, time, 1000 + i)
+
+  trader.requestDataSubscription('ABM', 3, 0, incremental=True)
+  kernel.deliver(time)
+  for price in (1005, 999):
+    time += pd.Timedelta('1s')
+    place(trader, kernel, time, price)
+
+  assert trader.market_data_seq['ABM'] == 4
+  assert 'ABM' not in trader.market_data_stale
+  assert trader.known_bids['ABM'] == book.getInsideBids(3)
+
+
+def test_sequence_gap_leaves_levels_stale_until_full_refresh(agents):
+  exchange, (trader, other), kernel = agents
+  exchange.market_data_refresh = 4
+  book = exchange.order_books['ABM']
+  time = TIME
+
+  trader.requestDataSubscription('ABM', 5, 0, incremental=True)
+  kernel.deliver(time)
+
+  def publish(price, lost=False):
+    nonlocal time
+    time += pd.Timedelta('1s')
+    other.currentTime = time
+    other.placeLimitOrder('ABM', 10, True, price)
+    kernel.deliver(time, drop=lambda recipient, msg: lost and recipient == trader.id and
+                                                     msg.body['msg'] == 'MARKET_DATA')
+
+  publish(1000)
+  assert trader.known_bids['ABM'] == book.getInsideBids(5)
+
+  # Message 1 is lost, so message 2 reveals a gap.  The known levels stop changing.
+  publish(1001, lost=True)
+  publish(1002)
+  assert trader.market_data_seq['ABM'] == 2
+  assert 'ABM' in trader.market_data_stale
+  assert trader.known_bids['ABM'] == [(1000, 10)]
+  publish(1003)
+  assert 'ABM' in trader.market_data_stale
+  assert trader.known_bids['ABM'] == [(1000, 10)]
+
+  # Message 4 is a full refresh, which resynchronizes the levels, and incremental updates apply again.
+  publish(1004)
+  assert trader.market_data_seq['ABM'] == 4
+  assert 'ABM' not in trader.market_data_stale
+  assert trader.known_bids['ABM'] == book.getInsideBids(5)
+  publish(1005)
+  assert trader.market_data_seq['ABM'] == 5
+  assert trader.known_bids['ABM'] == book.getInsideBids(5)
+
+
+def test_apply_level_changes_keeps_levels_best_first(agents):
+  _, (trader, _), _ = agents
+  bids = [(1005, 10), (1003, 20), (1000, 30)]
+  trader.applyLevelChanges(bids, [(1004, 5), (1003, 0), (1006, 1), (999, 2), (1000, 35), (1002, 0)], True)
+  assert bids == [(1006, 1), (1005, 10), (1004, 5), (1000, 35), (999, 2)]
+
+  asks = [(1010, 10), (1012, 20)]
+  trader.applyLevelChanges(asks, [(1011, 5), (1010, 0), (1009, 1), (1013, 2), (1012, 25)], False)
+  assert asks == [(1009, 1), (1011, 5), (1012, 25), (1013, 2)]
+
+  levels = []
+  trader.applyLevelChanges(levels, [(1000, 10), (1001, 5)], True)
+  assert levels == [(1001, 5), (1000, 10)]
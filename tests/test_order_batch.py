@@ -0,0 +1,73 @@
+from conftest import TIME
+
+
+def place(trader, kernel, quantity, is_buy_order, price):
+  trader.placeLimitOrder('ABM', quantity, is_buy_order, price)
+  kernel.deliver(TIME)
+  return next(reversed(trader.orders.values()))
+
+
+def test_replace_enters_new_order_once_accepted(agents):
+  exchange, (trader, _), kernel = agents
+  book = exchange.order_books['ABM']
+  order = place(trader, kernel, 10, True, 1000)
+
+  trader.replaceOrderBatch([(order, 'ABM', 10, True, 1001)])
+  new_order_id, = trader.pending_replacements
+  assert list(trader.orders) == [order.order_id]
+
+  kernel.deliver(TIME)
+  assert book.getInsideBids() == [(1001, 10)]
+  assert list(trader.orders) == [new_order_id]
+  assert not trader.pending_replacements
+
+
+def test_replace_of_filled_order_fails_without_entering_new_order(agents):
+  exchange, (trader, other), kernel = agents
+  book = exchange.order_books['ABM']
+  order = place(trader, kernel, 10, True, 1000)
+
+  # The order fills before the replacement reaches the exchange.
+  other.placeLimitOrder('ABM', 10, False, 1000)
+  trader.replaceOrderBatch([(order, 'ABM', 10, True, 1001)])
+  kernel.deliver(TIME)
+
+  assert book.getInsideBids() == []
+  assert trader.holdings['ABM'] == 10
+  assert not trader.orders
+  assert not trader.pending_replacements
+
+
+def test_replacement_not_permitted_leaves_order_in_place(agents):
+  exchange, (trader, _), kernel = agents
+  book = exchange.order_books['ABM']
+  orders = [place(trader, kernel, 10, True, price) for price in (1000, 1001)]
+
+  # A replacement of quantity zero is left out of the batch.
+  trader.replaceOrderBatch([(orders[0], 'ABM', 0, True, 999), (orders[1], 'ABM', 5, True, 1002)])
+  assert len(trader.pending_replacements) == 1
+  kernel.deliver(TIME)
+
+  assert book.getInsideBids() == [(1002, 5), (1000, 10)]
+  assert [(o.limit_price, o.quantity) for o in trader.orders.values()] == [(1000, 10), (1002, 5)]
+
+  # Nothing is sent when every replacement is left out.
+  trader.replaceOrderBatch([(orders[0], 'ABM', 0, True, 999)])
+  assert not kernel.queue
+
+
+def test_batches_place_and_cancel_orders(agents):
+  exchange, (trader, _), kernel = agents
+  book = exchange.order_books['ABM']
+
+  trader.placeLimitOrderBatch([('ABM', 10, True, 1000), ('ABM', 0, True, 999), ('ABM', 20, False, 1010)])
+  assert len(kernel.queue) == 1
+  kernel.deliver(TIME)
+  assert book.getInsideBids() == [(1000, 10)]
+  assert book.getInsideAsks() == [(1010, 20)]
+
+  trader.cancelOrderBatch(list(trader.orders.values()))
+  assert len(kernel.queue) == 1
+  kernel.deliver(TIME)
+  assert book.getInsideBids() == [] and book.getInsideAsks() == []
+  assert not trader.orders
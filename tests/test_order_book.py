@@ -0,0 +1,131 @@
+import pandas as pd
+
+from conftest import TIME
+from util.OrderBook import OrderHistory, TransactedVolume
+from util.order.LimitOrder import LimitOrder
+
+
+def limit_order(quantity, is_buy_order, price, order_id):
+  return LimitOrder(1, TIME, 'ABM', quantity, is_buy_order, price, order_id)
+
+
+def test_duplicate_order_id_is_discarded(book):
+  order = limit_order(100, True, 1000, 7)
+  book.handleLimitOrder(order)
+
+  book.handleLimitOrder(limit_order(50, True, 1001, 7))
+  book.handleLimitOrder(limit_order(50, False, 1010, 7))
+  assert book.getInsideBids() == [(1000, 100)]
+  assert book.getInsideAsks() == []
+
+  # Cancelling the original leaves nothing behind.
+  book.cancelOrder(order)
+  assert book.getInsideBids() == []
+  assert not book.bids.orders and not book.bids.levels
+
+
+def test_modify_may_only_change_quantity(book):
+  order = limit_order(100, True, 1000, 7)
+  book.handleLimitOrder(order)
+
+  book.modifyOrder(order, limit_order(100, True, 1005, 7))
+  assert book.getInsideBids() == [(1000, 100)]
+  assert book.bids.getOrder(7).limit_price == 1000
+
+  book.modifyOrder(order, limit_order(60, True, 1000, 7))
+  assert book.getInsideBids() == [(1000, 60)]
+  assert book.journal.levels() == ([(1000, 60)], [])
+
+  book.cancelOrder(order)
+  assert book.getInsideBids() == []
+  assert not book.bids.orders and not book.bids.levels
+
+
+def test_price_level_volume_follows_partial_fills(book):
+  book.handleLimitOrder(limit_order(100, False, 1000, 1))
+  book.handleLimitOrder(limit_order(50, False, 1000, 2))
+  book.handleLimitOrder(limit_order(30, False, 1001, 3))
+  level = book.asks.levels[1000]
+  assert level.volume == 150
+
+  # A partial fill of the oldest order at the best price.
+  book.handleLimitOrder(limit_order(30, True, 1000, 4))
+  assert level.volume == 120
+  assert [(o.order_id, o.quantity) for o in level] == [(1, 70), (2, 50)]
+
+  # Filling the oldest order and part of the next.
+  book.handleLimitOrder(limit_order(80, True, 1000, 5))
+  assert level.volume == 40
+  assert [(o.order_id, o.quantity) for o in level] == [(2, 40)]
+  assert book.getInsideAsks() == [(1000, 40), (1001, 30)]
+  assert book.journal.levels() == ([], [(1000, 40), (1001, 30)])
+
+  # Clearing the level removes it and leaves the next level best.
+  book.handleLimitOrder(limit_order(40, True, 1000, 6))
+  assert 1000 not in book.asks.levels
+  assert book.getInsideAsks() == [(1001, 30)]
+  assert book.getInsideBids() == []
+
+
+def test_order_history_keeps_max_trades_slots():
+  history = OrderHistory(max_trades=2)
+  orders = [limit_order(10, True, 1000 + i, i) for i in range(4)]
+
+  history.addOrder(orders[0], TIME)
+  history.advance()
+  history.addOrder(orders[1], TIME)
+  history.advance()
+  history.addOrder(orders[2], TIME)
+  assert len(history) == 3
+  assert [list(slot) for slot in history] == [[2], [1], [0]]
+  assert [list(slot) for slot in history[1:]] == [[1], [0]]
+  assert history.getRecord(0)['limit_price'] == 1000
+
+  # A full history drops its oldest slot, and the records of the orders in it, on the next trade.
+  history.advance()
+  history.addOrder(orders[3], TIME)
+  assert [list(slot) for slot in history] == [[3], [2], [1]]
+  assert history.getRecord(0) is None
+  assert history.getRecord(1) is history[2][1]
+
+
+def test_order_history_keeps_newest_record_of_reused_id():
+  history = OrderHistory(max_trades=1)
+  history.addOrder(limit_order(10, True, 1000, 7), TIME)
+  history.advance()
+  history.addOrder(limit_order(20, True, 1001, 7), TIME)
+
+  # Dropping the slot with the old record keeps the newer one.
+  history.advance()
+  assert history.getRecord(7)['quantity'] == 20
+
+
+def test_transacted_volume_since():
+  volume = TransactedVolume()
+  assert volume.since(0) == 0
+
+  start = TIME.value
+  volume.record(TIME, 10)
+  volume.record(TIME, 5)
+  volume.record(TIME + pd.Timedelta('1s'), 20)
+  volume.record(TIME + pd.Timedelta('3s'), 7)
+  assert volume.times == [start, start + 10**9, start + 3 * 10**9]
+  assert volume.cumulative == [15, 35, 42]
+
+  assert volume.since(start - 1) == 42
+  assert volume.since(start) == 42
+  assert volume.since(start + 1) == 27
+  assert volume.since(start + 10**9) == 27
+  assert volume.since(start + 2 * 10**9) == 7
+  assert volume.since(start + 3 * 10**9) == 7
+  assert volume.since(start + 3 * 10**9 + 1) == 0
+
+
+def test_get_transacted_volume_looks_back_from_current_time(book):
+  book.handleLimitOrder(limit_order(100, False, 1000, 1))
+  book.handleLimitOrder(limit_order(30, True, 1000, 2))
+  book.owner.currentTime = TIME + pd.Timedelta('5min')
+  book.handleLimitOrder(limit_order(20, True, 1000, 3))
+
+  assert book.get_transacted_volume('1min') == 20
+  assert book.get_transacted_volume('10min') == 50
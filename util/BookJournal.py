@@ -0,0 +1,219 @@
+# Append-only journal of the changes to an order book, kept by an OrderBook when its exchange
+# has book_journal set.  Rather than a copy of the book's depth after every change (see
+# util.DepthLog), each event records only what changed, so memory and file size grow with the
+# number of events, not with events x depth.  Events are stored in growable numpy arrays:
+#
+#   times      int64 nanoseconds
+#   kinds      int8 event type: ADD, EXECUTE, CANCEL or MODIFY
+#   keys       int64 key of the resting order affected: ids[key] is its order_id
+#   sides      int8 1 for a bid, 0 for an ask
+#   prices     int64 price of the resting order's level
+#   deltas     int64 signed change in the resting quantity at that price: +quantity for an
+#              ADD, -quantity for an EXECUTE or CANCEL, new minus old quantity for a MODIFY
+#
+# Order ids can be of any type (some agents use strings), so orders are recorded by a dense
+# integer key instead.  Each order entering the book (each ADD) gets the next key, and later
+# events find it by order_id, so an order_id that is reused once its first order has left the
+# book starts a new order rather than adding to the old one.
+#
+# Because every event is a signed change at one (side, price) and to one order, the book at
+# any time is just the sum of the events up to then: by (side, price) for the depth, by
+# key (in ADD order, which is time priority) for the individual orders.  levels(), orders()
+# and top() reconstruct the book that way after the fact.
+#
+# write() saves the arrays and the ids to a compressed .npz file and load() reads one back.
+# The ids are saved as a numpy array, so ids of mixed types are saved as strings.
+import sys
+from bisect import bisect_left, insort
+
+import numpy as np
+import pandas as pd
+
+
+class BookJournal:
+
+    ADD, EXECUTE, CANCEL, MODIFY = range(4)
+    KINDS = ('ADD', 'EXECUTE', 'CANCEL', 'MODIFY')
+
+    def __init__(self, capacity=4096):
+        self.events = 0
+        self.times = np.empty(capacity, dtype=np.int64)
+        self.kinds = np.empty(capacity, dtype=np.int8)
+        self.keys = np.empty(capacity, dtype=np.int64)
+        self.sides = np.empty(capacity, dtype=np.int8)
+        self.prices = np.empty(capacity, dtype=np.int64)
+        self.deltas = np.empty(capacity, dtype=np.int64)
+
+        # The order_id of each key, and the current key of each order_id.
+        self.ids = []
+        self.id_keys = {}
+
+    def __len__(self):
+        return self.events
+
+    def append(self, ns, kind, order, delta):
+        # Record an event of this kind at time ns against the resting order (a LimitOrder).  An
+        # ADD gives the order a new key.
+        i = self.events
+        if i >= len(self.times):
+            capacity = 2 * len(self.times)
+            self.times = np.resize(self.times, capacity)
+            self.kinds = np.resize(self.kinds, capacity)
+            self.keys = np.resize(self.keys, capacity)
+            self.sides = np.resize(self.sides, capacity)
+            self.prices = np.resize(self.prices, capacity)
+            self.deltas = np.resize(self.deltas, capacity)
+
+        self.times[i] = ns
+        self.kinds[i] = kind
+        key = self.id_keys.get(order.order_id)
+        if key is None or kind == self.ADD:
+            key = self.id_keys[order.order_id] = len(self.ids)
+            self.ids.append(order.order_id)
+
+        self.keys[i] = key
+        self.sides[i] = order.is_buy_order
+        self.prices[i] = order.limit_price
+        self.deltas[i] = delta
+        self.events = i + 1
+
+    def add(self, ns, order):
+        self.append(ns, self.ADD, order, order.quantity)
+
+    def execute(self, ns, order, quantity):
+        self.append(ns, self.EXECUTE, order, -quantity)
+
+    def cancel(self, ns, order):
+        self.append(ns, self.CANCEL, order, -order.quantity)
+
+    def modify(self, ns, order, new_quantity):
+        # order is the resting order before the change.
+        self.append(ns, self.MODIFY, order, new_quantity - order.quantity)
+
+    def arrays(self):
+        # Views of the recorded events, trimmed to length:
+        # (times, kinds, keys, sides, prices, deltas).
+        n = self.events
+        return (self.times[:n], self.kinds[:n], self.keys[:n], self.sides[:n],
+                self.prices[:n], self.deltas[:n])
+
+    def order_ids(self, keys):
+        # The order_ids of an array of keys, as an object array that keeps their types.
+        ids = np.empty(len(self.ids), dtype=object)
+        ids[:] = self.ids
+        return ids[keys]
+
+    def to_df(self):
+        # The events as a DataFrame indexed by time, one row per event.
+        times, kinds, keys, sides, prices, deltas = self.arrays()
+        return pd.DataFrame({'EventType': pd.Categorical.from_codes(kinds, self.KINDS),
+                             'OrderID': self.order_ids(keys), 'IsBuy': sides.astype(bool),
+                             'Price': prices, 'Delta': deltas},
+                            index=pd.DatetimeIndex(pd.to_datetime(times), name='EventTime'))
+
+    def until(self, ns):
+        # The number of events at or before time ns (all of them when ns is None).
+        if ns is None: return self.events
+        return int(np.searchsorted(self.times[:self.events], ns, side='right'))
+
+    def levels(self, ns=None, depth=sys.maxsize):
+        # The depth of the book as it stood after every event at or before time ns: lists of
+        # (price, volume) for the bids and the asks, best first, like OrderBook.getInsideBids()
+        # and getInsideAsks().
+        n = self.until(ns)
+        sides = self.sides[:n]
+        prices = self.prices[:n]
+        deltas = self.deltas[:n]
+
+        result = []
+        for side in (1, 0):
+            mask = sides == side
+            quotes, inverse = np.unique(prices[mask], return_inverse=True)
+            volumes = np.bincount(inverse, weights=deltas[mask], minlength=len(quotes)).astype(np.int64)
+            keep = volumes > 0
+            quotes, volumes = quotes[keep], volumes[keep]
+            if side: quotes, volumes = quotes[::-1], volumes[::-1]
+            result.append(list(zip(quotes[:depth].tolist(), volumes[:depth].tolist())))
+        return tuple(result)
+
+    def orders(self, ns=None):
+        # The resting orders as they stood after every event at or before time ns, as a
+        # DataFrame of OrderID, IsBuy, Price and Quantity: bids best first, then asks best
+        # first, and within a price in time priority.
+        n = self.until(ns)
+        keys, first, inverse = np.unique(self.keys[:n], return_index=True, return_inverse=True)
+        quantities = np.bincount(inverse, weights=self.deltas[:n], minlength=len(keys)).astype(np.int64)
+
+        keep = quantities > 0
+        first = first[keep]
+        df = pd.DataFrame({'OrderID': self.order_ids(keys[keep]), 'IsBuy': self.sides[first].astype(bool),
+                           'Price': self.prices[first], 'Quantity': quantities[keep]})
+
+        # Bids by descending price then ascending priority, then asks by ascending price.
+        df['_key'] = np.where(df.IsBuy, -df.Price, df.Price)
+        df['_priority'] = first
+        df.sort_values(['IsBuy', '_key', '_priority'], ascending=[False, True, True], inplace=True)
+        return df.drop(columns=['_key', '_priority']).reset_index(drop=True)
+
+    def top(self, n=1, times=None):
+        # A time series of the top n levels of the book.  With times (a sorted array of int64
+        # nanoseconds) there is one row per time, showing the book after every event at or
+        # before it; without, one row per distinct event time.  Returns (times, bid_prices,
+        # bid_volumes, ask_prices, ask_volumes), the last four (rows x n) int64 arrays with
+        # price 0 and volume 0 where a side has fewer than n levels.
+        events, kinds, keys, sides, prices, deltas = self.arrays()
+        if times is None:
+            times = np.unique(events)
+        times = np.asarray(times, dtype=np.int64)
+        ends = np.searchsorted(events, times, side='right')
+
+        rows = len(times)
+        bid_prices = np.zeros((rows, n), dtype=np.int64)
+        bid_volumes = np.zeros((rows, n), dtype=np.int64)
+        ask_prices = np.zeros((rows, n), dtype=np.int64)
+        ask_volumes = np.zeros((rows, n), dtype=np.int64)
+
+        # Replay the events into per-side level volumes and sorted indices (price for asks,
+        # -price for bids, so the best level is first), reading off the top at each time.
+        volumes = ({}, {})
+        index = ([], [])
+        sides, prices, deltas = sides.tolist(), prices.tolist(), deltas.tolist()
+        i = 0
+        for row, end in enumerate(ends.tolist()):
+            while i < end:
+                side, price, delta = sides[i], prices[i], deltas[i]
+                levels = volumes[side]
+                key = -price if side else price
+                volume = levels.get(price, 0) + delta
+                if volume > 0:
+                    if price not in levels: insort(index[side], key)
+                    levels[price] = volume
+                elif price in levels:
+                    del levels[price]
+                    del index[side][bisect_left(index[side], key)]
+                i += 1
+
+            for side, p, v in ((1, bid_prices, bid_volumes), (0, ask_prices, ask_volumes)):
+                for level, key in enumerate(index[side][:n]):
+                    price = -key if side else key
+                    p[row, level] = price
+                    v[row, level] = volumes[side][price]
+
+        return times, bid_prices, bid_volumes, ask_prices, ask_volumes
+
+    def write(self, filename):
+        times, kinds, keys, sides, prices, deltas = self.arrays()
+        np.savez_compressed(filename, times=times, kinds=kinds, keys=keys, sides=sides,
+                            prices=prices, deltas=deltas, ids=np.asarray(self.ids))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            journal = cls(capacity=1)
+            journal.times, journal.kinds = data['times'], data['kinds']
+            journal.keys, journal.sides = data['keys'], data['sides']
+            journal.prices, journal.deltas = data['prices'], data['deltas']
+            journal.ids = data['ids'].tolist()
+        journal.id_keys = {order_id: key for key, order_id in enumerate(journal.ids)}
+        journal.events = len(journal.times)
+        return journal
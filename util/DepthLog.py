@@ -0,0 +1,154 @@
+# Columnar record of order book depth over time, kept by an OrderBook when its exchange has
+# a book_freq.  Each row is a snapshot of the book: the time, then the price and volume of
+# each price level (bids first, best to worst, with negative volume; then asks, best to
+# worst).  Rows are stored like a compressed sparse row matrix in growable numpy arrays:
+#
+#   times      int64 nanoseconds, one per row
+#   offsets    int64, one per row plus one: row i is entries offsets[i]:offsets[i+1]
+#   prices     int64 price of each entry
+#   volumes    int64 signed volume of each entry (negative for bids)
+#
+# Rows are sampled while the simulation runs.  With a book_freq of 0 the book is recorded
+# after every change, keeping only the last change in any one nanosecond.  With a frequency
+# such as '1s' only the last state of the book in each interval (mkt_open, mkt_open + 1s],
+# (mkt_open + 1s, mkt_open + 2s], ... is recorded, which is exactly what a snapshot at the end
+# of the interval needs.  Either way the snapshot is taken lazily: the OrderBook calls
+# changing() before and changed() after each change, and the book is only read when a change
+# arrives in a new interval (or at flush()), so a busy interval costs one snapshot, not one
+# per change.  depth optionally limits each side to its best `depth` levels.
+#
+# write() saves the arrays to a compressed .npz file and load() reads one back.
+import sys
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from scipy.sparse import csr_matrix, vstack
+
+
+class DepthLog:
+
+    def __init__(self, freq=0, origin=0, depth=None, capacity=1024):
+        # freq is the exchange's book_freq: 0 or a fixed pandas frequency ('S', '100ms', ...).
+        # origin (integer nanoseconds, usually market open) anchors the sampling intervals.
+        self.freq = freq
+        self.interval = 0 if str(freq).isdigit() and int(freq) == 0 else to_offset(freq).nanos
+        self.origin = origin
+        self.depth = depth
+
+        self.rows = 0
+        self.times = np.empty(capacity, dtype=np.int64)
+        self.offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self.prices = np.empty(capacity * 8, dtype=np.int64)
+        self.volumes = np.empty(capacity * 8, dtype=np.int64)
+
+        # Time (ns) of the most recent change not yet recorded, and its sampling interval.
+        self.pending = None
+        self.pending_bucket = None
+
+    def __len__(self):
+        return self.rows
+
+    def bucket(self, ns):
+        # The sampling interval containing ns: ceil((ns - origin) / interval), or ns itself
+        # when every change is recorded.
+        if self.interval == 0: return ns
+        return -((self.origin - ns) // self.interval)
+
+    def changing(self, ns, book):
+        # Called before the book changes at time ns.  If the last unrecorded change was in an
+        # earlier interval, the book still shows its result, so record it now.
+        if self.pending is not None and self.bucket(ns) != self.pending_bucket:
+            self.record(self.pending, book)
+            self.pending = None
+
+    def changed(self, ns, book):
+        # Called after the book has changed at time ns.
+        self.pending = ns
+        self.pending_bucket = self.bucket(ns)
+
+    def flush(self, book):
+        # Record the last change, if it has not been.  Call before reading the arrays.
+        if self.pending is not None:
+            self.record(self.pending, book)
+            self.pending = None
+
+    def record(self, ns, book):
+        depth = self.depth if self.depth is not None else sys.maxsize
+        bids = book.getInsideBids(depth)
+        asks = book.getInsideAsks(depth)
+
+        if bids and asks and bids[0][0] >= asks[0][0]:
+            print("WARNING: THIS IS A REAL PROBLEM: an order book contains bids and asks at the same quote price!")
+
+        row = self.rows
+        start = self.offsets[row]
+        end = start + len(bids) + len(asks)
+
+        if row >= len(self.times):
+            capacity = 2 * len(self.times)
+            self.times = np.resize(self.times, capacity)
+            self.offsets = np.resize(self.offsets, capacity + 1)
+        if end > len(self.prices):
+            size = max(end, 2 * len(self.prices))
+            self.prices = np.resize(self.prices, size)
+            self.volumes = np.resize(self.volumes, size)
+
+        mid = start + len(bids)
+        if bids:
+            self.prices[start:mid] = [price for price, volume in bids]
+            self.volumes[start:mid] = [-volume for price, volume in bids]
+        if asks:
+            self.prices[mid:end] = [price for price, volume in asks]
+            self.volumes[mid:end] = [volume for price, volume in asks]
+
+        self.times[row] = ns
+        self.offsets[row + 1] = end
+        self.rows = row + 1
+
+    def arrays(self):
+        # Views of the recorded data, trimmed to length: (times, offsets, prices, volumes).
+        n = self.offsets[self.rows]
+        return self.times[:self.rows], self.offsets[:self.rows + 1], self.prices[:n], self.volumes[:n]
+
+    def matrix(self):
+        # The log as a sparse (rows x quotes) matrix of signed volume, and the sorted array of
+        # quotes that label its columns.
+        times, offsets, prices, volumes = self.arrays()
+        quotes, columns = np.unique(prices, return_inverse=True)
+        return csr_matrix((volumes, columns, offsets), shape=(len(times), len(quotes))), quotes
+
+    def resample(self, times):
+        # The book as it stood at each of the given times (sorted int64 nanoseconds): a sparse
+        # (times x quotes) matrix holding, for each time, the last row recorded at or before it
+        # (an empty row before the first), and the sorted array of quotes that label its columns.
+        S, quotes = self.matrix()
+        rows = np.searchsorted(self.arrays()[0], times, side='right') - 1
+
+        # Row -1, before anything was recorded, picks the empty row appended at the end.
+        S = vstack([S, csr_matrix((1, len(quotes)), dtype=S.dtype)], format='csr')
+        return S[rows], quotes
+
+    def to_df(self):
+        # The log as a DataFrame: a QuoteTime column, then one sparse column of signed volume
+        # per quote seen (0 where the quote had no volume).
+        S, quotes = self.matrix()
+        df = pd.DataFrame.sparse.from_spmatrix(S.tocsc(), columns=quotes)
+        df.insert(0, 'QuoteTime', pd.to_datetime(self.arrays()[0]), allow_duplicates=True)
+        return df
+
+    def write(self, filename):
+        times, offsets, prices, volumes = self.arrays()
+        np.savez_compressed(filename, times=times, offsets=offsets, prices=prices, volumes=volumes,
+                            freq=str(self.freq), origin=self.origin,
+                            depth=-1 if self.depth is None else self.depth)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            log = cls(freq=str(data['freq']), origin=int(data['origin']),
+                      depth=None if int(data['depth']) < 0 else int(data['depth']), capacity=1)
+            log.times, log.offsets = data['times'], data['offsets']
+            log.prices, log.volumes = data['prices'], data['volumes']
+        log.rows = len(log.times)
+        return log
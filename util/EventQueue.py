@@ -0,0 +1,181 @@
+# Event calendars used by the Kernel to keep pending messages and wakeup calls ordered by
+# delivery time.  The simulation loop is single-threaded, so there is no need for the
+# locking done by queue.PriorityQueue.  Entries are keyed on integer nanoseconds, so
+# ordering never has to compare pd.Timestamp or Message objects.
+#
+# Every scheduler delivers events in exactly the same order, so they can be swapped freely
+# to pick the fastest structure for a given workload.  The Kernel selects one by name
+# (see schedulers below) or accepts an EventQueue instance directly.
+from heapq import heapify, heappush, heappop
+
+
+class EventQueue:
+
+    # Base class for Kernel schedulers.  Entries are tuples of (delivery ns, recipient,
+    # message type value, sequence, delivery time, event).  Only the first four fields are
+    # ever compared, and the sequence number is unique, so the trailing payload fields are
+    # never inspected.  Ties on delivery time are broken by recipient, then message type,
+    # then insertion order, matching the historical ordering of the Kernel's
+    # (Timestamp, event) priority queue entries.
+
+    def __init__(self):
+        # Monotonic sequence number.  It acts as the final tiebreaker, so events that are
+        # otherwise tied are delivered first-in first-out.
+        self.seq = 0
+
+        # Sequence number of the event most recently returned by get(), used by requeue().
+        self.last_seq = None
+
+    def put(self, deliverAt, event):
+        # Add an event to the calendar.  deliverAt is a pd.Timestamp, or integer nanoseconds
+        # when the Kernel runs with ns_clock, and event is a tuple of (recipient, MessageType, msg).
+        recipient, msg_type, _ = event
+        ns = deliverAt if type(deliverAt) is int else deliverAt.value
+        self.push((ns, recipient, msg_type.value, self.seq, deliverAt, event))
+        self.seq += 1
+
+    def get(self):
+        # Remove and return the next (deliverAt, event) pair in delivery order.
+        _, _, _, self.last_seq, deliverAt, event = self.pop()
+        return deliverAt, event
+
+    def requeue(self, deliverAt, event, seq=None):
+        # Push a previously popped event back into the calendar at a later time.  It keeps
+        # its original sequence number (by default, that of the event most recently returned
+        # by get()), so it is not overtaken by events that were queued after it for the same
+        # recipient and time.
+        recipient, msg_type, _ = event
+        ns = deliverAt if type(deliverAt) is int else deliverAt.value
+        self.push((ns, recipient, msg_type.value, self.last_seq if seq is None else seq, deliverAt, event))
+
+    def empty(self):
+        return len(self) == 0
+
+    # Subclasses implement the storage structure.
+
+    def push(self, entry):
+        raise NotImplementedError
+
+    def pop(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class HeapEventQueue(EventQueue):
+
+    # A single binary heap over all pending entries.  O(log n) push and pop.
+
+    def __init__(self):
+        super().__init__()
+        self.queue = []
+
+    # put() and get() are the innermost calls of the Kernel loop, so the heap versions
+    # are written out directly rather than going through push() and pop().
+
+    def put(self, deliverAt, event):
+        recipient, msg_type, _ = event
+        ns = deliverAt if type(deliverAt) is int else deliverAt.value
+        heappush(self.queue, (ns, recipient, msg_type.value, self.seq, deliverAt, event))
+        self.seq += 1
+
+    def get(self):
+        _, _, _, self.last_seq, deliverAt, event = heappop(self.queue)
+        return deliverAt, event
+
+    def push(self, entry):
+        heappush(self.queue, entry)
+
+    def pop(self):
+        return heappop(self.queue)
+
+    def empty(self):
+        return not self.queue
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class CalendarEventQueue(EventQueue):
+
+    # A calendar queue: entries are dropped unsorted into fixed-width time buckets, and a
+    # bucket is only ordered (heapified, in linear time) when the clock reaches it.  Pushing
+    # into a future bucket is an O(1) append, and pushes and pops against the bucket being
+    # drained are O(log b) in the size of that bucket rather than the whole calendar.  This
+    # suits dense bursts of events landing on the same few nanoseconds, e.g. thousands of
+    # wakeups scheduled for market open.  The small heap of bucket numbers only grows when
+    # a new bucket is first used.
+
+    def __init__(self, bucket_width=100000):
+        super().__init__()
+
+        # Width of each bucket in nanoseconds.
+        self.bucket_width = bucket_width
+
+        # Unordered future buckets keyed by bucket number, and a heap of those bucket numbers.
+        self.buckets = {}
+        self.bucket_heap = []
+
+        # The bucket currently being drained (as a heap) and its number.
+        self.current_bucket = None
+        self.current = []
+
+        self.size = 0
+
+    # As in HeapEventQueue, put() and get() are written out directly for speed.
+
+    def put(self, deliverAt, event):
+        recipient, msg_type, _ = event
+        ns = deliverAt if type(deliverAt) is int else deliverAt.value
+        entry = (ns, recipient, msg_type.value, self.seq, deliverAt, event)
+        self.seq += 1
+
+        bucket = ns // self.bucket_width
+        if self.current_bucket is not None and bucket <= self.current_bucket:
+            heappush(self.current, entry)
+        elif bucket in self.buckets:
+            self.buckets[bucket].append(entry)
+        else:
+            self.buckets[bucket] = [entry]
+            heappush(self.bucket_heap, bucket)
+
+        self.size += 1
+
+    def get(self):
+        _, _, _, self.last_seq, deliverAt, event = self.pop()
+        return deliverAt, event
+
+    def push(self, entry):
+        bucket = entry[0] // self.bucket_width
+
+        if self.current_bucket is not None and bucket <= self.current_bucket:
+            heappush(self.current, entry)
+        elif bucket in self.buckets:
+            self.buckets[bucket].append(entry)
+        else:
+            self.buckets[bucket] = [entry]
+            heappush(self.bucket_heap, bucket)
+
+        self.size += 1
+
+    def pop(self):
+        if not self.current:
+            # Current bucket is exhausted.  Move on to the earliest non-empty bucket.
+            # (Raises IndexError when the calendar is empty, as heappop would.)
+            self.current_bucket = heappop(self.bucket_heap)
+            self.current = self.buckets.pop(self.current_bucket)
+            heapify(self.current)
+
+        self.size -= 1
+        return heappop(self.current)
+
+    def empty(self):
+        return self.size == 0
+
+    def __len__(self):
+        return self.size
+
+
+# Schedulers the Kernel can select by name.
+schedulers = {'heap': HeapEventQueue, 'calendar': CalendarEventQueue}
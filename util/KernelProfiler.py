@@ -0,0 +1,125 @@
+# Lightweight counters the Kernel can collect while it runs, to attribute simulation cost to
+# agent classes and message types without a full cProfile run.  For every delivered event it
+# records the recipient's class, the message type ('WAKEUP' for wakeup calls, otherwise the
+# message body's 'msg' field) and the wall time spent inside wakeup() or receiveMessage().
+# It also samples the event queue depth at every delivery, both as a series over simulated
+# time and as a power-of-two histogram.
+#
+# The Kernel only calls into the profiler when one was requested (Kernel.runner's
+# profile_counters argument), so an unprofiled run pays nothing for it.
+import json
+import os
+
+import pandas as pd
+
+from message.Message import TypedMessage
+
+
+class KernelProfiler:
+
+    def __init__(self, depth_interval='1min'):
+        # Queue depth is summarized per interval of simulated time.
+        self.depth_interval = pd.Timedelta(depth_interval).value
+
+        # Recipient class name per agent id, filled in by kernelStarting().
+        self.agent_types = []
+
+        # Agent class name -> [number of agents, wakeups, wakeup seconds, messages, message seconds].
+        self.by_agent_type = {}
+
+        # Message type -> [count, seconds].
+        self.by_message_type = {}
+
+        # Simulated time bucket -> [events, summed depth, max depth], and
+        # power-of-two depth bound -> events.
+        self.depth_series = {}
+        self.depth_histogram = {}
+
+    def kernelStarting(self, agents):
+        # Called by the Kernel before the event queue starts, once the agent list is known.
+        self.agent_types = [type(agent).__name__ for agent in agents]
+        for name in set(self.agent_types):
+            if name not in self.by_agent_type:
+                self.by_agent_type[name] = [0, 0, 0.0, 0, 0.0]
+            self.by_agent_type[name][0] = self.agent_types.count(name)
+
+    def recordDepth(self, deliverAt, depth):
+        # Called for every event popped from the queue.  deliverAt is a pd.Timestamp or
+        # integer nanoseconds.
+        ns = deliverAt if type(deliverAt) is int else deliverAt.value
+        bucket = ns // self.depth_interval
+
+        stats = self.depth_series.get(bucket)
+        if stats is None:
+            self.depth_series[bucket] = [1, depth, depth]
+        else:
+            stats[0] += 1
+            stats[1] += depth
+            if depth > stats[2]: stats[2] = depth
+
+        # Histogram bins are labeled by the smallest power of two >= depth.
+        bound = 1 << (depth - 1).bit_length() if depth else 0
+        self.depth_histogram[bound] = self.depth_histogram.get(bound, 0) + 1
+
+    def recordWakeup(self, agent, elapsed):
+        stats = self.by_agent_type[self.agent_types[agent]]
+        stats[1] += 1
+        stats[2] += elapsed
+
+        self.recordMessageType('WAKEUP', elapsed)
+
+    def recordMessage(self, agent, msg, elapsed):
+        stats = self.by_agent_type[self.agent_types[agent]]
+        stats[3] += 1
+        stats[4] += elapsed
+
+        body = msg.body
+        self.recordMessageType(body['msg'] if isinstance(body, (dict, TypedMessage)) and 'msg' in body
+                               else type(msg).__name__, elapsed)
+
+    def recordMessageType(self, msg_type, elapsed):
+        stats = self.by_message_type.get(msg_type)
+        if stats is None:
+            self.by_message_type[msg_type] = [1, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    def results(self):
+        # Plain dictionaries and lists only, so the results can go straight to JSON.
+        agent_types = {}
+        for name, (agents, wakeups, wakeup_s, messages, message_s) in self.by_agent_type.items():
+            agent_types[name] = {'agents': agents, 'wakeups': wakeups, 'wakeup_seconds': wakeup_s,
+                                 'messages': messages, 'message_seconds': message_s,
+                                 'total_seconds': wakeup_s + message_s}
+
+        message_types = {}
+        for name, (count, seconds) in self.by_message_type.items():
+            message_types[name] = {'count': count, 'seconds': seconds}
+
+        depth_series = []
+        for bucket in sorted(self.depth_series):
+            events, total, max_depth = self.depth_series[bucket]
+            depth_series.append({'time': str(pd.Timestamp(bucket * self.depth_interval)), 'events': events,
+                                 'mean_depth': total / events, 'max_depth': max_depth})
+
+        depth_histogram = {str(bound): self.depth_histogram[bound] for bound in sorted(self.depth_histogram)}
+
+        return {'agent_types': agent_types, 'message_types': message_types,
+                'queue_depth': depth_series, 'queue_depth_histogram': depth_histogram}
+
+    def summary(self, top=10):
+        # Human-readable lines for the agent classes that took the most wall time.
+        lines = []
+        ranked = sorted(self.results()['agent_types'].items(), key=lambda x: x[1]['total_seconds'], reverse=True)
+        for name, stats in ranked[:top]:
+            lines.append("{}: {} agents, {} wakeups, {} messages, {:0.3f}s".format(
+                name, stats['agents'], stats['wakeups'], stats['messages'], stats['total_seconds']))
+        return lines
+
+    def write(self, path, filename='kernel_profile.json'):
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        with open(os.path.join(path, filename), 'w') as f:
+            json.dump(self.results(), f, indent=2)
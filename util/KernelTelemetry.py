@@ -0,0 +1,112 @@
+# Periodic structured progress records for long simulations.  While the Kernel event loop
+# runs, a KernelTelemetry object writes one row every `interval` seconds of wall clock time
+# with the simulation time, wall time, messages processed so far, the message rate since the
+# previous row, the event queue length and the process resident set size.  Throughput
+# collapses (e.g. order book depth blowing up) then show up in a file that can be tailed,
+# scraped or plotted while the run is still going.
+#
+# Rows are written as JSON lines, or as CSV if the file name ends in .csv, and flushed as
+# they are written.
+import csv
+import json
+import os
+from time import perf_counter
+
+import pandas as pd
+
+
+FIELDS = ['sim_time', 'wall_time', 'elapsed_seconds', 'messages', 'messages_per_second', 'queue_length',
+          'rss_bytes']
+
+
+def current_rss():
+    # Resident set size of this process in bytes, or None where it cannot be read cheaply.
+    # /proc is Linux only.  Elsewhere fall back to the peak RSS reported by getrusage().
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+        import sys
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class KernelTelemetry:
+
+    def __init__(self, filename, interval=10.0):
+        # Output file and the wall clock interval (in seconds) between rows.
+        self.filename = filename
+        self.interval = interval
+        self.csv = filename.endswith('.csv')
+
+        self.file = None
+        self.writer = None
+
+        # Has this object already written to the file?  If so (e.g. the Kernel is running
+        # multiple simulations), further rows are appended rather than starting over.
+        self.started = False
+
+        # perf_counter() value at which the next row is due.  The Kernel compares against
+        # this directly, so a row costs nothing until it is due.
+        self.next_sample = float('inf')
+
+        self.wall_start = None
+        self.last_wall = None
+        self.last_messages = 0
+
+    def start(self, currentTime, queue_length):
+        # Called by the Kernel when the event queue starts processing.
+        path = os.path.dirname(self.filename)
+        if path and not os.path.exists(path):
+            os.makedirs(path)
+
+        self.file = open(self.filename, 'a' if self.started else 'w', newline='' if self.csv else None)
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+            if not self.started: self.writer.writeheader()
+        self.started = True
+
+        self.wall_start = self.last_wall = perf_counter()
+        self.last_messages = 0
+        self.sample(currentTime, 0, queue_length)
+
+    def sample(self, currentTime, messages, queue_length):
+        # Write one row.  currentTime is a pd.Timestamp or integer nanoseconds.
+        wall = perf_counter()
+        elapsed = wall - self.last_wall
+
+        row = {'sim_time': str(pd.Timestamp(currentTime)),
+               'wall_time': str(pd.Timestamp('now')),
+               'elapsed_seconds': round(wall - self.wall_start, 6),
+               'messages': messages,
+               'messages_per_second': round((messages - self.last_messages) / elapsed, 1) if elapsed > 0 else 0.0,
+               'queue_length': queue_length,
+               'rss_bytes': current_rss()}
+
+        if self.csv:
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + '\n')
+        self.file.flush()
+
+        self.last_wall = wall
+        self.last_messages = messages
+        self.next_sample = wall + self.interval
+
+    def stop(self, currentTime, messages, queue_length):
+        # Called by the Kernel when the event queue stops, or fails.  Writes a final row and
+        # closes the file.  The file is closed even if the row cannot be written.
+        if self.file is None: return
+        try:
+            if currentTime is not None:
+                self.sample(currentTime, messages, queue_length)
+        finally:
+            self.file.close()
+            self.file = self.writer = None
+            self.next_sample = float('inf')
@@ -1,18 +1,209 @@
 # Basic class for an order book for one symbol, in the style of the major US Stock Exchanges.
-# List of bid prices (index zero is best bid), each with a list of LimitOrders.
-# List of ask prices (index zero is best ask), each with a list of LimitOrders.
+# Bids and asks are each an OrderBookSide: PriceLevels keyed by price, each holding its
+# LimitOrders in time priority and their total quantity, a sorted index of the prices to find the best level, and an
+# index from order_id to PriceLevel to find any resting order directly.
+#
+# Order ownership: an order handed to handleLimitOrder (or as the new order to modifyOrder)
+# belongs to the book from then on, and the book updates it in place as it is executed, so
+# the caller must not touch it again.  Every order the book sends to an agent is one it no
+# longer holds: an order removed from the book, or a snapshot or fill report (see
+# Order.snapshot and Order.fill).  Nothing on the matching path deep copies an order.
 import sys
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from itertools import islice
 
-from message.Message import Message
+from message.Message import OrderAccepted, OrderCancelled, OrderExecuted, OrderModified
+from util.BookJournal import BookJournal
+from util.DepthLog import DepthLog
 from util.order.LimitOrder import LimitOrder
+from util import util
 from util.util import log_print, be_silent
 
-from copy import deepcopy
 import pandas as pd
-from pandas.io.json import json_normalize
-from functools import reduce
-from scipy.sparse import dok_matrix
-from tqdm import tqdm
+
+
+class PriceLevel:
+
+    # The LimitOrders resting at one price, in time priority (oldest first).  orders is an
+    # OrderedDict keyed by order_id, so an order anywhere in the queue can be found, replaced
+    # or removed in O(1) without disturbing the priority of the others.  volume is the total
+    # quantity of the orders, kept up to date by the OrderBookSide (and by executeOrder for
+    # partial fills) so that depth queries need not add it up again.
+    __slots__ = ('price', 'orders', 'volume')
+
+    def __init__(self, price):
+        self.price = price
+        self.orders = OrderedDict()
+        self.volume = 0
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __iter__(self):
+        return iter(self.orders.values())
+
+    def first(self):
+        # The oldest order at this price.  The level must not be empty.
+        return next(iter(self.orders.values()))
+
+
+class OrderBookSide:
+
+    # One side (bids or asks) of an OrderBook.  levels maps each price to its PriceLevel.
+    # index holds the level prices in sorted order (as price for bids and -price for asks)
+    # with the best price LAST, so a level is found, added or removed with a dict lookup and
+    # a bisection, and removing the best level does not shift the rest of the index.
+    # orders maps the order_id of every resting order to its PriceLevel.  Order ids must be
+    # unique among the resting orders, and a resting order must stay at its price: the
+    # OrderBook discards a limit order whose id is already resting and a modification that
+    # changes an order's price or side.
+
+    def __init__(self, is_buy_side):
+        self.levels = {}
+        self.index = []
+        self.orders = {}
+        self.sign = 1 if is_buy_side else -1
+
+    def __len__(self):
+        return len(self.index)
+
+    def bestLevel(self):
+        # The PriceLevel at the best price.  The side must not be empty.
+        return self.levels[self.sign * self.index[-1]]
+
+    def getOrder(self, order_id):
+        # The resting order with this order_id, or None if there is none.
+        level = self.orders.get(order_id)
+        return level.orders[order_id] if level is not None else None
+
+    def addOrder(self, order):
+        # Append the order to its price level, creating the level if needed.
+        level = self.levels.get(order.limit_price)
+        if level is None:
+            level = self.levels[order.limit_price] = PriceLevel(order.limit_price)
+            insort(self.index, self.sign * order.limit_price)
+        level.orders[order.order_id] = order
+        level.volume += order.quantity
+        self.orders[order.order_id] = level
+
+    def replaceOrder(self, new_order):
+        # Put new_order in place of the resting order with the same order_id, keeping its
+        # time priority.  Returns False if there is no such order.
+        level = self.orders.get(new_order.order_id)
+        if level is None: return False
+        level.volume += new_order.quantity - level.orders[new_order.order_id].quantity
+        level.orders[new_order.order_id] = new_order
+        return True
+
+    def removeOrder(self, order_id):
+        # Remove and return the resting order with this order_id, or None if there is none.
+        # A price level is removed when its last order is.
+        level = self.orders.pop(order_id, None)
+        if level is None: return None
+        order = level.orders.pop(order_id)
+        level.volume -= order.quantity
+        if not level.orders:
+            self.removeLevel(level.price)
+        return order
+
+    def removeLevel(self, price):
+        # Remove an (emptied) price level.
+        del self.levels[price]
+        key = self.sign * price
+        if self.index[-1] == key:
+            self.index.pop()
+        else:
+            del self.index[bisect_left(self.index, key)]
+
+    def levelsFromBest(self, depth=sys.maxsize):
+        # Iterate over the price levels, best price first, to a limit of depth levels.
+        levels, sign = self.levels, self.sign
+        for key in islice(reversed(self.index), depth):
+            yield levels[sign * key]
+
+
+class OrderHistory:
+
+    # The recent order stream of an OrderBook, as reported by QUERY_ORDER_STREAM.  Slot 0 holds
+    # the orders that arrived since the most recent trade, slot 1 those leading up to that
+    # trade, and so on back to slot max_trades.  Each slot is a dict from order_id to a record
+    # of the order: entry time, quantity, side, limit price and lists of its transactions,
+    # modifications and cancellations.
+    #
+    # The slots are a bounded deque, so a trade opens a new slot 0 and drops the oldest slot in
+    # O(1) rather than inserting at the front of a list and copying it to truncate.  records
+    # indexes every order in the history by order_id, so updating an order's record is a
+    # single lookup however many slots there are.  Indexing, slicing, len() and iteration work
+    # as they did on the list of slots.
+
+    def __init__(self, max_trades):
+        self.slots = deque([{}], maxlen=min(max_trades + 1, sys.maxsize))
+        self.records = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return list(islice(self.slots, *key.indices(len(self.slots))))
+        return self.slots[key]
+
+    def addOrder(self, order, currentTime):
+        # Record a newly arrived order in slot 0.
+        record = {'entry_time': currentTime,
+                  'quantity': order.quantity, 'is_buy_order': order.is_buy_order,
+                  'limit_price': order.limit_price, 'transactions': [],
+                  'modifications': [],
+                  'cancellations': []}
+        self.slots[0][order.order_id] = record
+        self.records[order.order_id] = record
+
+    def getRecord(self, order_id):
+        # The record of this order, or None if it is no longer (or was never) in the history.
+        return self.records.get(order_id)
+
+    def advance(self):
+        # A trade occurred: open a new slot 0, dropping the oldest slot if the history is full.
+        if len(self.slots) == self.slots.maxlen:
+            records = self.records
+            for order_id, record in self.slots[-1].items():
+                if records.get(order_id) is record:
+                    del records[order_id]
+        self.slots.appendleft({})
+
+
+class TransactedVolume:
+
+    # Running record of the volume executed in an OrderBook, for lookback queries such as
+    # QUERY_TRANSACTED_VOLUME.  times holds the distinct times (in integer nanoseconds) at
+    # which trades executed, in order, and cumulative the total volume executed up to and
+    # including each of those times.  Recording a trade is an append (or an update of the
+    # last entry for a trade at the same time), and the volume since any time is the running
+    # total less the cumulative volume before that time, found by bisection.
+
+    def __init__(self):
+        self.times = []
+        self.cumulative = []
+        self.total = 0
+
+    def record(self, time, quantity):
+        # The exchange clock never goes backwards, so times stay sorted.
+        self.total += quantity
+        ns = time.value
+        if self.times and self.times[-1] == ns:
+            self.cumulative[-1] = self.total
+        else:
+            self.times.append(ns)
+            self.cumulative.append(self.total)
+
+    def since(self, ns):
+        # Volume executed at or after time ns (integer nanoseconds).
+        i = bisect_left(self.times, ns)
+        return self.total - self.cumulative[i - 1] if i else self.total
 
 
 class OrderBook:
@@ -23,25 +214,28 @@ class OrderBook:
     def __init__(self, owner, symbol):
         self.owner = owner
         self.symbol = symbol
-        self.bids = []
-        self.asks = []
+        self.bids = OrderBookSide(is_buy_side=True)
+        self.asks = OrderBookSide(is_buy_side=False)
         self.last_trade = None
 
-        # Create an empty list of dictionaries to log the full order book depth (price and volume) each time it changes.
-        self.book_log = []
-        self.quotes_seen = set()
+        # If the owner archives order book snapshots, record the depth (price and volume) as it changes.
+        self.depth_log = None
+        if owner.book_freq is not None:
+            self.depth_log = DepthLog(owner.book_freq, owner.mkt_open.value, owner.book_log_depth)
+
+        # If the owner keeps a journal of every change to the book, the journal.
+        self.journal = BookJournal() if owner.book_journal else None
 
         # Create an order history for the exchange to report to certain agent types.
-        self.history = [{}]
+        self.history = OrderHistory(owner.stream_history)
 
         # Last timestamp the orderbook for that symbol was updated
         self.last_update_ts = None
 
-        # Internal variable used for computing transacted volumes
-        self._transacted_volume = {
-            "unrolled_transactions": None,
-            "self.history_previous_length": 0
-        }
+        # Volume executed over time, for transacted volume queries, and a cache of their
+        # lookback periods in nanoseconds.
+        self.transacted_volume = TransactedVolume()
+        self._lookback_ns = {}
 
     def handleLimitOrder(self, order):
         # Matches a limit order or adds it to the order book.  Handles partial matches piecewise,
@@ -49,19 +243,24 @@ class OrderBook:
         # order size "fit" or minimizing number of transactions.  Sends one notification per
         # match.
         if order.symbol != self.symbol:
-            log_print("{} order discarded.  Does not match OrderBook symbol: {}", order.symbol, self.symbol)
+            if not util.silent_mode:
+                log_print("{} order discarded.  Does not match OrderBook symbol: {}", order.symbol, self.symbol)
             return
 
         if (order.quantity <= 0) or (int(order.quantity) != order.quantity):
-            log_print("{} order discarded.  Quantity ({}) must be a positive integer.", order.symbol, order.quantity)
+            if not util.silent_mode:
+                log_print("{} order discarded.  Quantity ({}) must be a positive integer.", order.symbol, order.quantity)
+            return
+
+        if order.order_id in self.bids.orders or order.order_id in self.asks.orders:
+            if not util.silent_mode:
+                log_print("{} order discarded.  An order with id {} is already in the book.", order.symbol, order.order_id)
             return
 
         # Add the order under index 0 of history: orders since the most recent trade.
-        self.history[0][order.order_id] = {'entry_time': self.owner.currentTime,
-                                           'quantity': order.quantity, 'is_buy_order': order.is_buy_order,
-                                           'limit_price': order.limit_price, 'transactions': [],
-                                           'modifications': [],
-                                           'cancellations': []}
+        self.history.addOrder(order, self.owner.currentTime)
+
+        if self.depth_log is not None: self.depth_log.changing(self.owner.currentTime.value, self)
 
         matching = True
 
@@ -70,23 +269,21 @@ class OrderBook:
         executed = []
 
         while matching:
-            matched_order = deepcopy(self.executeOrder(order))
+            matched_order = self.executeOrder(order)
 
             if matched_order:
                 # Decrement quantity on new order and notify traders of execution.
-                filled_order = deepcopy(order)
-                filled_order.quantity = matched_order.quantity
-                filled_order.fill_price = matched_order.fill_price
+                filled_order = order.fill(matched_order.quantity, matched_order.fill_price)
 
                 order.quantity -= filled_order.quantity
 
-                log_print("MATCHED: new order {} vs old order {}", filled_order, matched_order)
-                log_print("SENT: notifications of order execution to agents {} and {} for orders {} and {}",
-                          filled_order.agent_id, matched_order.agent_id, filled_order.order_id, matched_order.order_id)
+                if not util.silent_mode:
+                    log_print("MATCHED: new order {} vs old order {}", filled_order, matched_order)
+                    log_print("SENT: notifications of order execution to agents {} and {} for orders {} and {}",
+                              filled_order.agent_id, matched_order.agent_id, filled_order.order_id, matched_order.order_id)
 
-                self.owner.sendMessage(order.agent_id, Message({"msg": "ORDER_EXECUTED", "order": filled_order}))
-                self.owner.sendMessage(matched_order.agent_id,
-                                       Message({"msg": "ORDER_EXECUTED", "order": matched_order}))
+                self.owner.sendMessage(order.agent_id, OrderExecuted(filled_order))
+                self.owner.sendMessage(matched_order.agent_id, OrderExecuted(matched_order))
 
                 # Accumulate the volume and average share price of the currently executing inbound trade.
                 executed.append((filled_order.quantity, filled_order.fill_price))
@@ -95,76 +292,66 @@ class OrderBook:
                     matching = False
 
             else:
-                # No matching order was found, so the new order enters the order book.  Notify the agent.
-                self.enterOrder(deepcopy(order))
+                # No matching order was found, so the new order enters the order book.  Notify the agent
+                # with a snapshot, as the order itself will change as it is executed.
+                self.enterOrder(order)
 
-                log_print("ACCEPTED: new order {}", order)
-                log_print("SENT: notifications of order acceptance to agent {} for order {}",
-                          order.agent_id, order.order_id)
+                if not util.silent_mode:
+                    log_print("ACCEPTED: new order {}", order)
+                    log_print("SENT: notifications of order acceptance to agent {} for order {}",
+                              order.agent_id, order.order_id)
 
-                self.owner.sendMessage(order.agent_id, Message({"msg": "ORDER_ACCEPTED", "order": order}))
+                self.owner.sendMessage(order.agent_id, OrderAccepted(order.snapshot()))
 
                 matching = False
 
         if not matching:
             # Now that we are done executing or accepting this order, log the new best bid and ask.
             if self.bids:
+                best = self.bids.bestLevel()
                 self.owner.logEvent('BEST_BID', "{},{},{}".format(self.symbol,
-                                                                  self.bids[0][0].limit_price,
-                                                                  sum([o.quantity for o in self.bids[0]])))
+                                                                  best.price, best.volume))
 
             if self.asks:
+                best = self.asks.bestLevel()
                 self.owner.logEvent('BEST_ASK', "{},{},{}".format(self.symbol,
-                                                                  self.asks[0][0].limit_price,
-                                                                  sum([o.quantity for o in self.asks[0]])))
+                                                                  best.price, best.volume))
 
             # Also log the last trade (total share quantity, average share price).
             if executed:
                 trade_qty = 0
                 trade_price = 0
                 for q, p in executed:
-                    log_print("Executed: {} @ {}", q, p)
+                    if not util.silent_mode: log_print("Executed: {} @ {}", q, p)
                     trade_qty += q
                     trade_price += (p * q)
 
                 avg_price = int(round(trade_price / trade_qty))
-                log_print("Avg: {} @ ${:0.4f}", trade_qty, avg_price)
+                if not util.silent_mode: log_print("Avg: {} @ ${:0.4f}", trade_qty, avg_price)
                 self.owner.logEvent('LAST_TRADE', "{},${:0.4f}".format(trade_qty, avg_price))
 
                 self.last_trade = avg_price
 
-                # Transaction occurred, so advance indices.
-                self.history.insert(0, {})
-
-                # Truncate history to required length.
-                self.history = self.history[:self.owner.stream_history + 1]
-
-            # Finally, log the full depth of the order book, ONLY if we have been requested to store the order book
-            # for later visualization.  (This is slow.)
-            if self.owner.book_freq is not None:
-                row = {'QuoteTime': self.owner.currentTime}
-                for quote, volume in self.getInsideBids():
-                    row[quote] = -volume
-                    self.quotes_seen.add(quote)
-                for quote, volume in self.getInsideAsks():
-                    if quote in row:
-                        if row[quote] is not None:
-                            print(
-                                "WARNING: THIS IS A REAL PROBLEM: an order book contains bids and asks at the same quote price!")
-                    row[quote] = volume
-                    self.quotes_seen.add(quote)
-                self.book_log.append(row)
+                # Transaction occurred, so advance indices.  (This also drops the oldest slot once
+                # the history holds the required number of trades.)
+                self.history.advance()
+
+            # Finally, note the change in the depth log, ONLY if we have been requested to store the order book
+            # for later visualization.
+            if self.depth_log is not None: self.depth_log.changed(self.owner.currentTime.value, self)
         self.last_update_ts = self.owner.currentTime
         self.prettyPrint()
 
     def handleMarketOrder(self, order):
 
         if order.symbol != self.symbol:
-            log_print("{} order discarded.  Does not match OrderBook symbol: {}", order.symbol, self.symbol)
+            if not util.silent_mode:
+                log_print("{} order discarded.  Does not match OrderBook symbol: {}", order.symbol, self.symbol)
             return
 
         if (order.quantity <= 0) or (int(order.quantity) != order.quantity):
-            log_print("{} order discarded.  Quantity ({}) must be a positive integer.", order.symbol, order.quantity)
+            if not util.silent_mode:
+                log_print("{} order discarded.  Quantity ({}) must be a positive integer.", order.symbol, order.quantity)
             return
 
         orderbook_side = self.getInsideAsks() if order.is_buy_order else self.getInsideBids()
@@ -181,7 +368,8 @@ class OrderBook:
                                            # therefore walk through the book until all the quantities are matched
                 order_quantity -= size
                 continue
-        log_print("{} placing market order as multiple limit orders", order.symbol, order.quantity)
+        if not util.silent_mode:
+            log_print("{} placing market order as multiple limit orders", order.symbol, order.quantity)
         for lo in limit_orders.items():
             p, q = lo[0], lo[1]
             limit_order = LimitOrder(order.agent_id, order.time_placed, order.symbol, q, order.is_buy_order, p)
@@ -207,7 +395,11 @@ class OrderBook:
         if not book:
             # No orders on this side.
             return None
-        elif not self.isMatch(order, book[0][0]):
+
+        level = book.bestLevel()
+        oldest = level.first()
+
+        if not self.isMatch(order, oldest):
             # There were orders on the right side, but the prices do not overlap.
             # Or: bid could not match with best ask, or vice versa.
             # Or: bid offer is below the lowest asking price, or vice versa.
@@ -217,41 +409,40 @@ class OrderBook:
             # somewhere within them.  We can/will only match against the oldest order
             # among those with the best price.  (i.e. best price, then FIFO)
 
-            # Note that book[i] is a LIST of all orders (oldest at index book[i][0]) at the same price.
-
             # The matched order might be only partially filled. (i.e. new order is smaller)
-            if order.quantity >= book[0][0].quantity:
-                # Consumed entire matched order.
-                matched_order = book[0].pop(0)
+            if self.journal is not None:
+                self.journal.execute(self.owner.currentTime.value, oldest, min(order.quantity, oldest.quantity))
 
-                # If the matched price now has no orders, remove it completely.
-                if not book[0]:
-                    del book[0]
+            if order.quantity >= oldest.quantity:
+                # Consumed entire matched order.  (If the matched price now has no orders,
+                # this removes it completely.)  It has left the book, so it can be returned as is.
+                matched_order = book.removeOrder(oldest.order_id)
 
             else:
-                # Consumed only part of matched order.
-                matched_order = deepcopy(book[0][0])
+                # Consumed only part of matched order.  Report the executed part on a snapshot.
+                matched_order = oldest.snapshot()
                 matched_order.quantity = order.quantity
 
-                book[0][0].quantity -= matched_order.quantity
+                oldest.quantity -= matched_order.quantity
+                level.volume -= matched_order.quantity
 
             # When two limit orders are matched, they execute at the price that
             # was being "advertised" in the order book.
             matched_order.fill_price = matched_order.limit_price
 
+            self.transacted_volume.record(self.owner.currentTime, matched_order.quantity)
+
             # Record the transaction in the order history and push the indices
             # out one, possibly truncating to the maximum history length.
 
             # The incoming order is guaranteed to exist under index 0.
             self.history[0][order.order_id]['transactions'].append((self.owner.currentTime, order.quantity))
 
-            # The pre-existing order may or may not still be in the recent history.
-            for idx, orders in enumerate(self.history):
-                if matched_order.order_id not in orders: continue
-
-                # Found the matched order in history.  Update it with this transaction.
-                self.history[idx][matched_order.order_id]['transactions'].append(
-                    (self.owner.currentTime, matched_order.quantity))
+            # The pre-existing order may or may not still be in the recent history.  If it is,
+            # update it with this transaction.
+            record = self.history.getRecord(matched_order.order_id)
+            if record is not None:
+                record['transactions'].append((self.owner.currentTime, matched_order.quantity))
 
             # Return (only the executed portion of) the matched order.
             return matched_order
@@ -280,23 +471,9 @@ class OrderBook:
         else:
             book = self.asks
 
-        if not book:
-            # There were no orders on this side of the book.
-            book.append([order])
-        elif not self.isBetterPrice(order, book[-1][0]) and not self.isEqualPrice(order, book[-1][0]):
-            # There were orders on this side, but this order is worse than all of them.
-            # (New lowest bid or highest ask.)
-            book.append([order])
-        else:
-            # There are orders on this side.  Insert this order in the correct position in the list.
-            # Note that o is a LIST of all orders (oldest at index 0) at this same price.
-            for i, o in enumerate(book):
-                if self.isBetterPrice(order, o[0]):
-                    book.insert(i, [order])
-                    break
-                elif self.isEqualPrice(order, o[0]):
-                    book[i].append(order)
-                    break
+        # Join the back of the queue at this price, opening a new price level if there is none.
+        book.addOrder(order)
+        if self.journal is not None: self.journal.add(self.owner.currentTime.value, order)
 
     def cancelOrder(self, order):
         # Attempts to cancel (the remaining, unexecuted portion of) a trade in the order book.
@@ -305,171 +482,83 @@ class OrderBook:
         # no message back to the agent.  This should possibly change to some kind of failed
         # cancellation message.  (?)  Otherwise, the agent receives ORDER_CANCELLED with the
         # order as the message body, with the cancelled quantity correctly represented as the
-        # number of shares that had not already been executed.
+        # number of shares that had not already been executed.  Returns whether the order was
+        # found and cancelled.
 
         if order.is_buy_order:
             book = self.bids
         else:
             book = self.asks
 
-        # If there are no orders on this side of the book, there is nothing to do.
-        if not book: return
-
-        # There are orders on this side.  Find the price level of the order to cancel,
-        # then find the exact order and cancel it.
-        # Note that o is a LIST of all orders (oldest at index 0) at this same price.
-        for i, o in enumerate(book):
-            if self.isEqualPrice(order, o[0]):
-                # This is the correct price level.
-                for ci, co in enumerate(book[i]):
-                    if order.order_id == co.order_id:
-                        # Cancel this order.
-                        cancelled_order = book[i].pop(ci)
-
-                        # Record cancellation of the order if it is still present in the recent history structure.
-                        for idx, orders in enumerate(self.history):
-                            if cancelled_order.order_id not in orders: continue
-
-                            # Found the cancelled order in history.  Update it with the cancelation.
-                            self.history[idx][cancelled_order.order_id]['cancellations'].append(
-                                (self.owner.currentTime, cancelled_order.quantity))
-
-                        # If the cancelled price now has no orders, remove it completely.
-                        if not book[i]:
-                            del book[i]
-
-                        log_print("CANCELLED: order {}", order)
-                        log_print("SENT: notifications of order cancellation to agent {} for order {}",
-                                  cancelled_order.agent_id, cancelled_order.order_id)
-
-                        self.owner.sendMessage(order.agent_id,
-                                               Message({"msg": "ORDER_CANCELLED", "order": cancelled_order}))
-                        # We found the order and cancelled it, so stop looking.
-                        self.last_update_ts = self.owner.currentTime
-                        return
+        # Find the order to cancel by its id and remove it (and its price level, if the
+        # level is now empty).  If it is not in the book, there is nothing to do.
+        if self.depth_log is not None: self.depth_log.changing(self.owner.currentTime.value, self)
+        cancelled_order = book.removeOrder(order.order_id)
+        if cancelled_order is None: return False
+        if self.journal is not None: self.journal.cancel(self.owner.currentTime.value, cancelled_order)
+        if self.depth_log is not None: self.depth_log.changed(self.owner.currentTime.value, self)
+
+        # Record cancellation of the order if it is still present in the recent history structure.
+        record = self.history.getRecord(cancelled_order.order_id)
+        if record is not None:
+            record['cancellations'].append((self.owner.currentTime, cancelled_order.quantity))
+
+        if not util.silent_mode:
+            log_print("CANCELLED: order {}", order)
+            log_print("SENT: notifications of order cancellation to agent {} for order {}",
+                      cancelled_order.agent_id, cancelled_order.order_id)
+
+        self.owner.sendMessage(order.agent_id, OrderCancelled(cancelled_order))
+        self.last_update_ts = self.owner.currentTime
+        return True
 
     def modifyOrder(self, order, new_order):
         # Modifies the quantity of an existing limit order in the order book
         if not self.isSameOrder(order, new_order): return
         book = self.bids if order.is_buy_order else self.asks
         if not book: return
-        for i, o in enumerate(book):
-            if self.isEqualPrice(order, o[0]):
-                for mi, mo in enumerate(book[i]):
-                    if order.order_id == mo.order_id:
-                        book[i][0] = new_order
-                        for idx, orders in enumerate(self.history):
-                            if new_order.order_id not in orders: continue
-                            self.history[idx][new_order.order_id]['modifications'].append(
-                                (self.owner.currentTime, new_order.quantity))
-                            log_print("MODIFIED: order {}", order)
-                            log_print("SENT: notifications of order modification to agent {} for order {}",
-                                      new_order.agent_id, new_order.order_id)
-                            self.owner.sendMessage(order.agent_id,
-                                                   Message({"msg": "ORDER_MODIFIED", "new_order": new_order}))
-        if order.is_buy_order:
-            self.bids = book
-        else:
-            self.asks = book
+        # Only the quantity may change: the new order must rest at the same price on the same side.
+        resting = book.getOrder(new_order.order_id)
+        if resting is not None and (new_order.limit_price != resting.limit_price or
+                                    new_order.is_buy_order != resting.is_buy_order):
+            if not util.silent_mode:
+                log_print("{} modification discarded.  Only the quantity of order {} may change.", order.symbol,
+                          order.order_id)
+            return
+        # The new order takes the place (and time priority) of the resting order.
+        if self.depth_log is not None: self.depth_log.changing(self.owner.currentTime.value, self)
+        if book.replaceOrder(new_order):
+            if self.journal is not None: self.journal.modify(self.owner.currentTime.value, resting, new_order.quantity)
+            if self.depth_log is not None: self.depth_log.changed(self.owner.currentTime.value, self)
+            record = self.history.getRecord(new_order.order_id)
+            if record is not None:
+                record['modifications'].append((self.owner.currentTime, new_order.quantity))
+                if not util.silent_mode:
+                    log_print("MODIFIED: order {}", order)
+                    log_print("SENT: notifications of order modification to agent {} for order {}",
+                              new_order.agent_id, new_order.order_id)
+                self.owner.sendMessage(order.agent_id, OrderModified(new_order.snapshot()))
         self.last_update_ts = self.owner.currentTime
 
     # Get the inside bid price(s) and share volume available at each price, to a limit
     # of "depth".  (i.e. inside price, inside 2 prices)  Returns a list of tuples:
     # list index is best bids (0 is best); each tuple is (price, total shares).
     def getInsideBids(self, depth=sys.maxsize):
-        book = []
-        for i in range(min(depth, len(self.bids))):
-            qty = 0
-            price = self.bids[i][0].limit_price
-            for o in self.bids[i]:
-                qty += o.quantity
-            book.append((price, qty))
-
-        return book
+        return [(level.price, level.volume) for level in self.bids.levelsFromBest(depth)]
 
     # As above, except for ask price(s).
     def getInsideAsks(self, depth=sys.maxsize):
-        book = []
-        for i in range(min(depth, len(self.asks))):
-            qty = 0
-            price = self.asks[i][0].limit_price
-            for o in self.asks[i]:
-                qty += o.quantity
-            book.append((price, qty))
-
-        return book
-
-    def _get_recent_history(self):
-        """ Gets portion of self.history that has arrived since last call of self.get_transacted_volume.
-
-            Also updates self._transacted_volume[self.history_previous_length]
-        :return:
-        """
-        if self._transacted_volume["self.history_previous_length"] == 0:
-            self._transacted_volume["self.history_previous_length"] = len(self.history)
-            return self.history
-        elif self._transacted_volume["self.history_previous_length"] == len(self.history):
-            return {}
-        else:
-            idx = len(self.history) - self._transacted_volume["self.history_previous_length"] - 1
-            recent_history = self.history[0:idx]
-            self._transacted_volume["self.history_previous_length"] = len(self.history)
-            return recent_history
-
-    def _update_unrolled_transactions(self, recent_history):
-        """ Updates self._transacted_volume["unrolled_transactions"] with data from recent_history
-
-        :return:
-        """
-        new_unrolled_txn = self._unrolled_transactions_from_order_history(recent_history)
-        old_unrolled_txn = self._transacted_volume["unrolled_transactions"]
-        total_unrolled_txn = pd.concat([old_unrolled_txn, new_unrolled_txn], ignore_index=True)
-        self._transacted_volume["unrolled_transactions"] = total_unrolled_txn
-
-    def _unrolled_transactions_from_order_history(self, history):
-        """ Returns a DataFrame with columns ['execution_time', 'quantity'] from a dictionary with same format as
-            self.history, describing executed transactions.
-        """
-        # Load history into DataFrame
-        unrolled_history = []
-        for elem in history:
-            for _, val in elem.items():
-                unrolled_history.append(val)
-
-        unrolled_history_df = pd.DataFrame(unrolled_history, columns=[
-            'entry_time', 'quantity', 'is_buy_order', 'limit_price', 'transactions', 'modifications', 'cancellations'
-        ])
-
-        if unrolled_history_df.empty:
-            return pd.DataFrame(columns=['execution_time', 'quantity'])
-
-        executed_transactions = unrolled_history_df[unrolled_history_df['transactions'].map(lambda d: len(d)) > 0]  # remove cells that are an empty list
-
-        #  Reshape into DataFrame with columns ['execution_time', 'quantity']
-        transaction_list = [element for list_ in executed_transactions['transactions'].values for element in list_]
-        unrolled_transactions = pd.DataFrame(transaction_list, columns=['execution_time', 'quantity'])
-        unrolled_transactions = unrolled_transactions.sort_values(by=['execution_time'])
-        unrolled_transactions = unrolled_transactions.drop_duplicates(keep='last')
-
-        return unrolled_transactions
+        return [(level.price, level.volume) for level in self.asks.levelsFromBest(depth)]
 
     def get_transacted_volume(self, lookback_period='10min'):
         """ Method retrieves the total transacted volume for a symbol over a lookback period finishing at the current
             simulation time.
         """
+        lookback_ns = self._lookback_ns.get(lookback_period)
+        if lookback_ns is None:
+            lookback_ns = self._lookback_ns[lookback_period] = pd.to_timedelta(lookback_period).value
 
-        # Update unrolled transactions DataFrame
-        recent_history = self._get_recent_history()
-        self._update_unrolled_transactions(recent_history)
-        unrolled_transactions = self._transacted_volume["unrolled_transactions"]
-
-        #  Get transacted volume in time window
-        lookback_pd = pd.to_timedelta(lookback_period)
-        window_start = self.owner.currentTime - lookback_pd
-        executed_within_lookback_period = unrolled_transactions[unrolled_transactions['execution_time'] >= window_start]
-        transacted_volume = executed_within_lookback_period['quantity'].sum()
-
-        return transacted_volume
+        return self.transacted_volume.since(self.owner.currentTime.value - lookback_ns)
 
     # These could be moved to the LimitOrder class.  We could even operator overload them
     # into >, <, ==, etc.
@@ -495,11 +584,11 @@ class OrderBook:
         return order.order_id == new_order.order_id
 
     def book_log_to_df(self):
-        """ Returns a pandas DataFrame constructed from the order book log, to be consumed by
-            agent.ExchangeAgent.logOrderbookSnapshots.
+        """ Returns a pandas DataFrame constructed from the order book log, for analysis during or after a run.
+            (agent.ExchangeAgent.logOrderBookSnapshots works on self.depth_log directly.)
 
             The first column of the DataFrame is `QuoteTime`. The succeeding columns are prices quoted during the
-            simulation (as taken from self.quotes_seen).
+            simulation.
 
             Each row is a snapshot at a specific time instance. If there is volume at a certain price level (negative
             for bids, positive for asks) this volume is written in the column corresponding to the price level. If there
@@ -509,26 +598,8 @@ class OrderBook:
 
         :return:
         """
-        quotes = sorted(list(self.quotes_seen))
-        log_len = len(self.book_log)
-        quote_idx_dict = {quote: idx for idx, quote in enumerate(quotes)}
-        quotes_times = []
-
-
-        # Construct sparse matrix, where rows are timesteps, columns are quotes and elements are volume.
-        S = dok_matrix((log_len, len(quotes)), dtype=int)  # Dictionary Of Keys based sparse matrix.
-
-        for i, row in enumerate(tqdm(self.book_log, desc="Processing orderbook log")):
-            quotes_times.append(row['QuoteTime'])
-            for quote, vol in row.items():
-                if quote == "QuoteTime":
-                    continue
-                S[i, quote_idx_dict[quote]] = vol
-
-        S = S.tocsc()  # Convert this matrix to Compressed Sparse Column format for pandas to consume.
-        df = pd.DataFrame.sparse.from_spmatrix(S, columns=quotes)
-        df.insert(0, 'QuoteTime', quotes_times, allow_duplicates=True)
-        return df
+        self.depth_log.flush(self)
+        return self.depth_log.to_df()
 
     # Print a nicely-formatted view of the current order book.
     def prettyPrint(self, silent=False):
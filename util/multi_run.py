@@ -0,0 +1,100 @@
+# In-process multi-run support.  Launching `python abides.py` once per seed pays interpreter
+# startup, the numpy/pandas/scipy imports and any data loading on every run.  run_config()
+# instead executes a config module (exactly as abides.py would) repeatedly inside one
+# process.  Each run builds a fresh Kernel and agent population, as configs always do, and
+# the order id counter (Order.next_order_id), the only class-level state that would otherwise
+# leak from one run into the next, is reset first, so a run gives the same results it would
+# in a fresh process.  Data that is safe to share (fundamental series, processed replay
+# order streams in util.replay_cache) is cached by the modules that load it and is only
+# read once.
+#
+# From the command line:  python abides.py -c rmsc03 --run-seeds 1 2 3 -t ABM -d 20200603 -l sweep
+# runs rmsc03 three times, logging to sweep_seed_1, sweep_seed_2 and sweep_seed_3.
+
+import runpy
+import sys
+import time
+
+from util import replay_cache
+from util.order.Order import Order
+
+
+def reset_simulation_state(clear_caches=False):
+    # Restart order ids at 0.  Order.next_order_id is the only class-level state shared by all
+    # simulations in a process.  Cached input data is kept, since reusing it is the point of
+    # running in-process, unless clear_caches is set.
+    Order.next_order_id = 0
+    if clear_caches:
+        replay_cache.clear()
+
+
+def args_for_seed(config_args, seed, default_log_dir=None):
+    # Returns a copy of config_args with the seed option (-s/--seed) set to seed and the log
+    # directory option (-l/--log_dir) set to <log_dir>_seed_<seed>.  log_dir is the log
+    # directory given in config_args, or default_log_dir if there is none.  If neither is
+    # given, the log directory is left to the config.
+    log_dir = None
+    args = []
+    i = 0
+    while i < len(config_args):
+        arg = config_args[i]
+        name = arg.split('=', 1)[0]
+        if name in ('-s', '--seed', '-l', '--log_dir'):
+            if '=' in arg:
+                value = arg.split('=', 1)[1]
+            else:
+                value = config_args[i + 1] if i + 1 < len(config_args) else None
+                i += 1
+            if name in ('-l', '--log_dir'):
+                log_dir = value
+        else:
+            args.append(arg)
+        i += 1
+
+    if log_dir is None:
+        log_dir = default_log_dir
+
+    args += ['-s', str(seed)]
+    if log_dir is not None:
+        args += ['-l', '{}_seed_{}'.format(log_dir, seed)]
+    return args
+
+
+def run_config(config, config_args=()):
+    # Execute config/<config>.py once in this process, with config_args as the arguments that
+    # follow "-c <config>" on its command line.  Returns the config module's globals, from
+    # which the caller can pick up e.g. the kernel (and its custom_state and summaryLog).
+    reset_simulation_state()
+
+    argv = sys.argv
+    sys.argv = [argv[0], '-c', config] + list(config_args)
+    try:
+        return runpy.run_module('config.{}'.format(config), run_name='config.{}'.format(config))
+    finally:
+        sys.argv = argv
+
+
+def run_seeds(config, config_args, seeds):
+    # Run a config once per seed in this process.  Returns a list of per-run result dicts
+    # with the seed, wall clock seconds and the Kernel's custom_state (None if the config
+    # does not leave a kernel behind).
+
+    # Runs would otherwise share the Kernel's default log directory (the wall clock second
+    # at which it was created), so give them one that includes the seed.
+    default_log_dir = str(int(time.time()))
+
+    results = []
+    for seed in seeds:
+        print("\n====== In-process run: {} seed {} ======\n".format(config, seed))
+
+        start = time.perf_counter()
+        config_globals = run_config(config, args_for_seed(config_args, seed, default_log_dir))
+        elapsed = time.perf_counter() - start
+
+        kernel = config_globals.get('kernel')
+        results.append({'seed': seed, 'elapsed_seconds': elapsed,
+                        'custom_state': kernel.custom_state if kernel is not None else None})
+
+        print("\n====== In-process run: {} seed {} complete in {:0.1f}s ======\n".format(config, seed, elapsed))
+
+    return results
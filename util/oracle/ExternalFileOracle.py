@@ -1,9 +1,15 @@
 import pandas as pd
+from util import util
 from util.util import log_print
 from bisect import bisect_left
 from math import sqrt
 
 
+# Fundamental series already read, by file path.  Kept for the life of the process so that
+# repeated in-process runs (see util.multi_run) do not read the same files again.
+fundamentals_cache = {}
+
+
 class ExternalFileOracle:
     """ Oracle using an external price series as the fundamental. The external series are specified files in the ABIDES
         config. If an agent requests the fundamental value in between two timestamps the returned fundamental value is
@@ -24,7 +30,9 @@ class ExternalFileOracle:
         for symbol, params_dict in self.symbols.items():
             fundamental_file_path = params_dict['fundamental_file_path']
             log_print("Oracle: loading {}", fundamental_file_path)
-            fundamental_df = pd.read_pickle(fundamental_file_path)
+            if fundamental_file_path not in fundamentals_cache:
+                fundamentals_cache[fundamental_file_path] = pd.read_pickle(fundamental_file_path)
+            fundamental_df = fundamentals_cache[fundamental_file_path]
             fundamentals.update({symbol: fundamental_df})
 
         log_print("Oracle: loading fundamental price series complete!")
@@ -51,7 +59,7 @@ class ExternalFileOracle:
             :type time: pd.Timestamp
         """
 
-        log_print("Oracle: client requested {} as of {}", symbol, query_time)
+        if not util.silent_mode: log_print("Oracle: client requested {} as of {}", symbol, query_time)
 
         fundamental_series = self.fundamentals[symbol]
         time_of_query = pd.Timestamp(query_time)
@@ -73,12 +81,15 @@ class ExternalFileOracle:
             lower_val = fundamental_series[lower_idx]
             upper_val = fundamental_series[upper_idx]
 
-            log_print(f"DEBUG: lower_idx: {lower_idx}, lower_val: {lower_val}, upper_idx: {upper_idx}, upper_val: {upper_val}")
+            if not util.silent_mode:
+                log_print("DEBUG: lower_idx: {}, lower_val: {}, upper_idx: {}, upper_val: {}",
+                          lower_idx, lower_val, upper_idx, upper_val)
 
             interpolated_price = self.getInterpolatedPrice(query_time, fundamental_series.index[lower_idx],
                                                            fundamental_series.index[upper_idx], lower_val, upper_val)
-            log_print("Oracle: latest historical trade was {} at {}. Next historical trade is {}. "
-                      "Interpolated price is {}", lower_val, query_time, upper_val, interpolated_price)
+            if not util.silent_mode:
+                log_print("Oracle: latest historical trade was {} at {}. Next historical trade is {}. "
+                          "Interpolated price is {}", lower_val, query_time, upper_val, interpolated_price)
 
             self.f_log[symbol].append({'FundamentalTime': query_time, 'FundamentalValue': interpolated_price})
 
@@ -119,7 +130,9 @@ class ExternalFileOracle:
             :type price_high: float
             :return float of interpolated price:
         """
-        log_print(f'DEBUG: current_time: {current_time} time_low {time_low} time_high: {time_high} price_low:  {price_low} price_high: {price_high}' )
+        if not util.silent_mode:
+            log_print('DEBUG: current_time: {} time_low {} time_high: {} price_low:  {} price_high: {}',
+                      current_time, time_low, time_high, price_low, price_high)
         delta_y = price_high - price_low
         delta_x = (time_high - time_low).total_seconds()
 
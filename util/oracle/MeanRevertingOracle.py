@@ -19,6 +19,7 @@ import pandas as pd
 import os, random, sys
 
 from math import sqrt
+from util import util
 from util.util import log_print
 
 
@@ -122,8 +123,9 @@ class MeanRevertingOracle:
     else:
       obs = int(round(random_state.normal(loc=r_t, scale=sqrt(sigma_n))))
  
-    log_print ("Oracle: current fundamental value is {} at {}", r_t, currentTime)
-    log_print ("Oracle: giving client value observation {}", obs)
+    if not util.silent_mode:
+      log_print ("Oracle: current fundamental value is {} at {}", r_t, currentTime)
+      log_print ("Oracle: giving client value observation {}", obs)
  
     # Reminder: all simulator prices are specified in integer cents.
     return obs
\ No newline at end of file
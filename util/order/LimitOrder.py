@@ -14,6 +14,9 @@ silent_mode = False
 
 class LimitOrder(Order):
 
+    __slots__ = ('limit_price',)
+    _fields = Order._fields + __slots__
+
     def __init__(self, agent_id, time_placed, symbol, quantity, is_buy_order, limit_price, order_id=None, tag=None):
 
         super().__init__(agent_id, time_placed, symbol, quantity, is_buy_order, order_id, tag=tag)
@@ -43,29 +46,10 @@ class LimitOrder(Order):
         return self.__str__()
 
     def __copy__(self):
-        order = LimitOrder(self.agent_id, self.time_placed, self.symbol, self.quantity, self.is_buy_order,
-                           self.limit_price,
-                           order_id=self.order_id,
-                           tag=self.tag)
-        Order._order_ids.pop()  # remove duplicate agent ID
-        order.fill_price = self.fill_price
-        return order
+        return self.snapshot()
 
     def __deepcopy__(self, memodict={}):
-        # Deep copy instance attributes
-        agent_id = deepcopy(self.agent_id, memodict)
-        time_placed = deepcopy(self.time_placed, memodict)
-        symbol = deepcopy(self.symbol, memodict)
-        quantity = deepcopy(self.quantity, memodict)
-        is_buy_order = deepcopy(self.is_buy_order, memodict)
-        limit_price = deepcopy(self.limit_price, memodict)
-        order_id = deepcopy(self.order_id, memodict)
-        tag = deepcopy(self.tag, memodict)
-        fill_price = deepcopy(self.fill_price, memodict)
-
-        # Create new order object
-        order = LimitOrder(agent_id, time_placed, symbol, quantity, is_buy_order, limit_price,
-                           order_id=order_id, tag=tag)
-        order.fill_price = fill_price
-
+        # All attributes but the tag are immutable, so only the tag needs copying.
+        order = self.snapshot()
+        order.tag = deepcopy(self.tag, memodict)
         return order
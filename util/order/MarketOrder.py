@@ -10,6 +10,8 @@ silent_mode = False
 
 class MarketOrder(Order):
 
+    __slots__ = ()
+
     def __init__(self, agent_id, time_placed, symbol, quantity, is_buy_order, order_id=None, tag=None):
         super().__init__(agent_id, time_placed, symbol, quantity, is_buy_order, order_id=order_id, tag=tag)
 
@@ -25,26 +27,10 @@ class MarketOrder(Order):
         return self.__str__()
 
     def __copy__(self):
-        order = MarketOrder(self.agent_id, self.time_placed, self.symbol, self.quantity, self.is_buy_order,
-                            order_id=self.order_id,
-                            tag=self.tag)
-        Order._order_ids.pop()  # remove duplicate agent ID
-        order.fill_price = self.fill_price
-        return order
+        return self.snapshot()
 
     def __deepcopy__(self, memodict={}):
-        # Deep copy instance attributes
-        agent_id = deepcopy(self.agent_id, memodict)
-        time_placed = deepcopy(self.time_placed, memodict)
-        symbol = deepcopy(self.symbol, memodict)
-        quantity = deepcopy(self.quantity, memodict)
-        is_buy_order = deepcopy(self.is_buy_order, memodict)
-        order_id = deepcopy(self.order_id, memodict)
-        tag = deepcopy(self.tag, memodict)
-        fill_price = deepcopy(self.fill_price, memodict)
-
-        # Create new order object
-        order = MarketOrder(agent_id, time_placed, symbol, quantity, is_buy_order, order_id=order_id, tag=tag)
-        order.fill_price = fill_price
-
+        # All attributes but the tag are immutable, so only the tag needs copying.
+        order = self.snapshot()
+        order.tag = deepcopy(self.tag, memodict)
         return order
@@ -1,13 +1,24 @@
 # A basic Order type used by an Exchange to conduct trades or maintain an order book.
 # This should not be confused with order Messages agents send to request an Order.
 # Specific order types will inherit from this (like LimitOrder).
+#
+# Orders are created by the million in a large simulation and rest in order books for a long
+# time, so they are slotted: no per-instance __dict__.  Subclasses declare their own extra
+# attributes in __slots__ and append them to _fields.
 
-from copy import deepcopy
+from numbers import Integral
 
 
 class Order:
-    order_id = 0
-    _order_ids = set()
+    # The next order id to generate.  Generated ids count up from here; an explicitly
+    # assigned integer id moves the counter past itself, so later generated ids never
+    # collide with it.
+    next_order_id = 0
+
+    __slots__ = ('agent_id', 'time_placed', 'symbol', 'quantity', 'is_buy_order', 'order_id', 'fill_price', 'tag')
+
+    # Every attribute of the order, in the order to_dict() reports them.
+    _fields = __slots__
 
     def __init__(self, agent_id, time_placed, symbol, quantity, is_buy_order, order_id=None, tag=None):
 
@@ -26,8 +37,7 @@ class Order:
         self.is_buy_order = is_buy_order
 
         # Order ID: either self generated or assigned
-        self.order_id = self.generateOrderId() if not order_id else order_id
-        Order._order_ids.add(self.order_id)
+        self.order_id = self.generateOrderId() if order_id is None else self.useOrderId(order_id)
 
         # Create placeholder fields that don't get filled in until certain
         # events happen.  (We could instead subclass to a special FilledOrder
@@ -43,15 +53,37 @@ class Order:
 
     def generateOrderId(self):
         # generates a unique order ID if the order ID is not specified
-        if not Order.order_id in Order._order_ids:
-            oid = Order.order_id
-        else:
-            Order.order_id += 1
-            oid = self.generateOrderId()
+        oid = Order.next_order_id
+        Order.next_order_id += 1
         return oid
 
+    def useOrderId(self, order_id):
+        # An assigned order ID: make sure no later generated ID will repeat it.
+        if isinstance(order_id, Integral) and order_id >= Order.next_order_id:
+            Order.next_order_id = int(order_id) + 1
+        return order_id
+
+    def snapshot(self):
+        # A copy of this order as it is now, e.g. to report it to an agent while the original
+        # stays in (and may still change in) an order book.  Unlike deepcopy() this does not go
+        # through __init__, so it does not touch order ids, and it shares the attribute values
+        # rather than copying them (they are immutable, apart from whatever an agent put in
+        # the tag).
+        report = object.__new__(type(self))
+        for name in self._fields:
+            setattr(report, name, getattr(self, name))
+        return report
+
+    def fill(self, quantity, fill_price):
+        # An execution report for this order: a snapshot of it with quantity shares filled at
+        # fill_price.
+        report = self.snapshot()
+        report.quantity = quantity
+        report.fill_price = fill_price
+        return report
+
     def to_dict(self):
-        as_dict = deepcopy(self).__dict__
+        as_dict = {name: getattr(self, name) for name in self._fields}
         as_dict['time_placed'] = self.time_placed.isoformat()
         return as_dict
 
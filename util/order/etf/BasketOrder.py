@@ -14,6 +14,9 @@ silent_mode = False
 
 class BasketOrder (Order):
 
+  __slots__ = ('dollar',)
+  _fields = Order._fields + __slots__
+
   def __init__ (self, agent_id, time_placed, symbol, quantity, is_buy_order, dollar=True, order_id=None):
     super().__init__(agent_id, time_placed, symbol, quantity, is_buy_order, order_id)
     self.dollar = dollar
@@ -0,0 +1,24 @@
+# Processed replay order streams, kept in memory for the life of the process so that
+# repeated in-process runs (see util.multi_run) only read and process them once.  The
+# L3OrdersProcessor classes of the replay agents (agent/examples/MarketReplayAgent.py,
+# MarketReplayAgentUSD.py and RejectReplayAgent.py) all load their orders_dict through
+# processed_orders(), so this module holds the only copy.  Agents only read the cached
+# dicts, so a run cannot change what the next one sees.
+
+orders_cache = {}
+
+
+def processed_orders(processor, load):
+    # Returns the orders_dict for an L3OrdersProcessor, calling load() only the first time it
+    # is requested.  The processors of the replay agents read the same files into different
+    # formats, so the key includes the module the processor is defined in.
+    key = (type(processor).__module__, processor.symbol, processor.date, processor.start_time,
+           processor.end_time, processor.orders_file_path)
+    if key not in orders_cache:
+        orders_cache[key] = load()
+    return orders_cache[key]
+
+
+def clear():
+    # Drop all cached order streams, e.g. to free memory or to pick up changed input files.
+    orders_cache.clear()
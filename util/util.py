@@ -18,6 +18,18 @@ silent_mode = False
 # Use it for all permanent logging print statements to allow fastest possible
 # execution when verbose flag is not set.  This is especially fast because
 # the arguments will not even be formatted when in silent mode.
+#
+# The arguments themselves are still evaluated before the call, though, and on
+# the simulator's hot paths (the Kernel loop, order book matching, message
+# handlers) that cost (fmtTime, str(order), the call itself) dominates.  Those
+# call sites read the flag through the module first, so nothing at all is
+# evaluated in silent mode:
+#
+#   from util import util
+#   if not util.silent_mode: log_print("At {}, agent {}", kernel.fmtTime(t), id)
+#
+# Import the module rather than the name, so that config files that set
+# util.silent_mode at runtime are honored.
 def log_print (str, *args):
   if not silent_mode: print (str.format(*args))
 